@@ -0,0 +1,365 @@
+"""Benchmarks for the packet analysis hot paths
+
+Generates a deterministic synthetic capture, then measures throughput, per-call
+latency percentiles and peak memory for each stage and for end-to-end replay.
+Results are written as JSON; pass --compare with an earlier result file to flag
+regressions.
+
+    python benchmarks/run_benchmarks.py --packets 200000 --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.utils.analysis import (new_analysis, analyze_frame, analyze_packets, analyze_modbus_packet,
+                                generate_security_recommendations, generate_report)
+from src.utils.assets import AssetInventory
+from src.utils.baseline import ModbusBaseline
+from src.utils.decoder import decode_frame
+from src.utils.pcap_manager import PcapManager, analyze_chunk
+from src.utils.pcap_reader import iter_pcap
+from src.utils.traffic_gen import TrafficGenerator, parse_mix
+from src.utils.pcap_writer import write_pcap
+
+MEMORY_SAMPLE = 20000  # Calls traced for peak memory; tracemalloc is too slow for full runs
+SCAPY_SAMPLE = 20000   # analyze_packets takes scapy packets, which are slow to build
+BASELINE_BATCH = 256   # Frames per ModbusBaseline.flush(), as in the live processing loop
+INVENTORY_ASSETS = 100000  # Size of the synthetic asset inventory for the annotation stage
+INVENTORY_SUBNETS = 4096
+STARTUP_REPEAT = 5       # Fresh interpreters timed per startup stage
+STARTUP_TIMEOUT = 30.0
+
+
+def percentiles(samples_ns):
+    """Latency summary in microseconds from per-call nanosecond timings"""
+    if not samples_ns:
+        return {}
+    samples = sorted(samples_ns)
+    last = len(samples) - 1
+
+    def at(q):
+        return round(samples[min(last, int(q * len(samples)))] / 1000.0, 3)
+
+    return {"p50_us": at(0.50), "p95_us": at(0.95), "p99_us": at(0.99), "max_us": round(samples[-1] / 1000.0, 3)}
+
+
+def peak_memory(fn):
+    """Peak traced allocation in KiB while fn runs"""
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024.0, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def per_call_stage(name, items, call, setup=None):
+    """Time call(item) for every item individually, then trace memory on a sample"""
+    state = setup() if setup else None
+    timings = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for item in items:
+        t0 = clock()
+        call(item, state)
+        timings.append(clock() - t0)
+    elapsed = (clock() - started) / 1e9
+
+    sample = items[:MEMORY_SAMPLE]
+    memory_state = setup() if setup else None
+
+    def traced():
+        for item in sample:
+            call(item, memory_state)
+
+    memory = peak_memory(traced)
+    return {
+        "stage": name,
+        "calls": len(items),
+        "seconds": round(elapsed, 4),
+        "pps": round(len(items) / elapsed) if elapsed else None,
+        "latency": percentiles(timings),
+        "peak_memory_kb": memory,
+        "memory_sample": len(sample)
+    }
+
+
+def whole_stage(name, packets, run, repeat=1):
+    """Time a whole-batch operation (repeat times), then trace one run's memory"""
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        run()
+        timings.append(time.perf_counter_ns() - t0)
+    elapsed = sum(timings) / 1e9
+    return {
+        "stage": name,
+        "calls": repeat,
+        "packets": packets * repeat,
+        "seconds": round(elapsed, 4),
+        "pps": round(packets * repeat / elapsed) if elapsed and packets else None,
+        "latency": percentiles(timings),
+        "peak_memory_kb": peak_memory(run)
+    }
+
+
+def baseline_stage(modbus_frames):
+    """ModbusBaseline observe() per frame plus a vectorized flush() every BASELINE_BATCH frames"""
+    def run():
+        baseline = ModbusBaseline()
+        for i, frame in enumerate(modbus_frames):
+            frame.risk = 0
+            baseline.observe(frame)
+            if i % BASELINE_BATCH == BASELINE_BATCH - 1:
+                baseline.flush()
+        baseline.flush()
+
+    return whole_stage("modbus_baseline", len(modbus_frames), run)
+
+
+def synthetic_inventory():
+    """INVENTORY_ASSETS devices in INVENTORY_SUBNETS zone subnets of mixed prefix lengths, covering
+    the generator's client and PLC addresses"""
+    zones = []
+    for i in range(INVENTORY_SUBNETS):
+        length = (22, 24, 26, 28)[i % 4]
+        zones.append({"name": f"zone{i}", "level": i % 5, "conduits": [f"zone{i ^ 1}"],
+                      "subnets": [f"10.{i // 16}.{(i % 16) * 16}.0/{length}"]})
+    assets = [{"ip": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}", "name": f"asset{i}"}
+              for i in range(INVENTORY_ASSETS)]
+    return AssetInventory(zones, assets)
+
+
+def asset_stage(frames):
+    """AssetInventory.annotate() per IP frame: two LRU-cached asset/zone lookups"""
+    ip_frames = [frame for frame in frames if frame.is_ip]
+    return per_call_stage("asset_annotate", ip_frames, lambda frame, inventory: inventory.annotate(frame),
+                          setup=synthetic_inventory)
+
+
+def packet_callback_stage(frames):
+    """app.packet_callback including event storage, stats and broadcast queueing"""
+    try:
+        from src import app as scada_app
+    except ImportError as e:
+        return {"stage": "packet_callback", "skipped": f"cannot import src.app: {e}"}
+    with tempfile.TemporaryDirectory(prefix="scada_bench_app_") as data_dir:
+        # Keep the app's catalog and any files it writes out of the real data directory
+        scada_app.CAPTURE_DIR = os.path.join(data_dir, "pcaps")
+        scada_app.REPORTS_DIR = os.path.join(data_dir, "reports")
+        scada_app.CATALOG_PATH = os.path.join(data_dir, "catalog.db")
+        scada_app.SHARED_STATE_PATH = os.path.join(data_dir, "state.db")
+        scada_app.create_app()
+        try:
+            return per_call_stage("packet_callback", frames, lambda frame, _: scada_app.packet_callback(frame))
+        finally:
+            scada_app.catalog.close()
+
+
+def startup_stage(name, start, repeat=STARTUP_REPEAT):
+    """Wall time of start() (which spawns and waits on a fresh interpreter) repeat times"""
+    timings = []
+    for _ in range(repeat):
+        try:
+            timings.append(start())
+        except (OSError, subprocess.SubprocessError, RuntimeError) as e:
+            return {"stage": name, "skipped": str(e)}
+    return {
+        "stage": name,
+        "calls": repeat,
+        "seconds": round(sum(timings) / 1e9, 4),
+        "pps": None,
+        "latency": percentiles(timings),
+        "peak_memory_kb": None
+    }
+
+
+def import_app():
+    """Nanoseconds to import src.app (module-level setup included) in a new interpreter"""
+    t0 = time.perf_counter_ns()
+    subprocess.run([sys.executable, "-c", "import src.app"], cwd=project_root, check=True,
+                   stdout=subprocess.DEVNULL, timeout=STARTUP_TIMEOUT)
+    return time.perf_counter_ns() - t0
+
+
+def web_ready():
+    """Nanoseconds from launching run_scada.py until the dashboard answers"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    url = f"http://127.0.0.1:{port}/"
+    t0 = time.perf_counter_ns()
+    process = subprocess.Popen([sys.executable, "run_scada.py", "--port", str(port), "--no-browser"],
+                               cwd=project_root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter_ns() - t0
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"run_scada.py exited with {process.returncode}")
+                time.sleep(0.01)
+        raise RuntimeError(f"dashboard not ready after {STARTUP_TIMEOUT}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def analyze_packets_stage(raw):
+    """analyze_packets() over scapy packets (the original, scapy-based entry point)"""
+    try:
+        from scapy.layers.l2 import Ether
+    except ImportError as e:
+        return {"stage": "analyze_packets", "skipped": f"scapy not available: {e}"}
+    packets = []
+    for data, ts in raw[:SCAPY_SAMPLE]:
+        packet = Ether(data)
+        packet.time = ts
+        packets.append(packet)
+    return whole_stage("analyze_packets", len(packets), lambda: analyze_packets(packets, "bench"))
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="scada_bench_")
+    pcap_file = args.pcap
+    if pcap_file is None:
+        pcap_file = os.path.join(workdir, "bench.pcap")
+        generator = TrafficGenerator(args.seed, mix=args.mix)
+        t0 = time.perf_counter()
+        write_pcap(pcap_file, generator.frames(args.packets))
+        print(f"Generated {args.packets} packets in {time.perf_counter() - t0:.1f}s")
+
+    raw = list(iter_pcap(pcap_file))
+    frames = [decode_frame(data, ts) for data, ts in raw]
+    modbus_frames = [frame for frame in frames if frame.is_modbus]
+
+    stages = []
+
+    def report(result):
+        stages.append(result)
+        if "skipped" in result:
+            print(f"{result['stage']:<24} skipped: {result['skipped']}")
+        else:
+            print(f"{result['stage']:<24} {result['pps'] or '-':>10} pkt/s  "
+                  f"p99 {result['latency'].get('p99_us', 0):>9} us  peak {result['peak_memory_kb'] or '-'} KiB")
+
+    if args.startup:
+        report(startup_stage("startup_import_app", import_app))
+        report(startup_stage("startup_web_ready", web_ready))
+
+    report(per_call_stage("decode_frame", raw, lambda item, _: decode_frame(item[0], item[1])))
+    report(per_call_stage("analyze_frame", frames, lambda frame, analysis: analyze_frame(frame, analysis),
+                          setup=lambda: new_analysis("bench")))
+    report(per_call_stage("analyze_modbus_packet", modbus_frames,
+                          lambda frame, analysis: analyze_modbus_packet(frame, analysis),
+                          setup=lambda: new_analysis("bench")))
+    report(baseline_stage(modbus_frames))
+    report(asset_stage(frames))
+    report(packet_callback_stage(frames))
+    report(analyze_packets_stage(raw))
+
+    analysis = analyze_chunk(pcap_file)
+    generate_security_recommendations(analysis)
+    report_file = os.path.join(workdir, "report_bench.json")
+    report(whole_stage("generate_report", 0, lambda: generate_report(analysis, pcap_file, report_file),
+                       repeat=args.report_repeat))
+
+    report(whole_stage("replay_single_process", len(raw), lambda: analyze_chunk(pcap_file)))
+    if args.workers > 1:
+        manager = PcapManager(reports_dir=workdir, workers=args.workers,
+                              chunk_bytes=max(1, os.path.getsize(pcap_file) // args.workers))
+        report(whole_stage(f"replay_{args.workers}_workers", len(raw),
+                           lambda: manager.analyze_files([pcap_file], combined=True)))
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "packets": len(raw),
+            "modbus_packets": len(modbus_frames),
+            "seed": args.seed,
+            "mix": args.mix,
+            "pcap": args.pcap
+        },
+        "stages": {stage["stage"]: stage for stage in stages}
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Print per-stage throughput and p99 changes; returns the stages that regressed"""
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for name, stage in current["stages"].items():
+        before = baseline["stages"].get(name)
+        if not before or "skipped" in stage or "skipped" in before:
+            continue
+        # Stages without a packet rate (startup) are compared on latency alone
+        pps_change = (stage["pps"] - before["pps"]) / before["pps"] * 100 if before.get("pps") else 0
+        p99_before = before["latency"].get("p99_us")
+        p99_change = ((stage["latency"]["p99_us"] - p99_before) / p99_before * 100) if p99_before else 0
+        regressed = pps_change < -threshold or p99_change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<24} pkt/s {pps_change:+7.1f}%  p99 {p99_change:+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SCADA monitor analysis hot paths")
+    parser.add_argument("--packets", type=int, default=100000, help="Synthetic packets to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="Traffic mix, e.g. modbus=0.85,scan=0.05,spoof=0.02,flood=0.05,udp=0.03")
+    parser.add_argument("--pcap", default=None, help="Benchmark an existing capture instead of generating one")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Processes for the parallel replay stage (1 disables it)")
+    parser.add_argument("--report-repeat", type=int, default=5)
+    parser.add_argument("--no-startup", dest="startup", action="store_false",
+                        help="Skip timing app import and dashboard startup in fresh interpreters")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="Earlier JSON result to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
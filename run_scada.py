@@ -1,9 +1,12 @@
 import os
 import sys
 import signal
+import time
+import argparse
+import threading
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(project_root)
-from src.app import app, socketio, start_threads
+from src.app import start_threads, create_app, startup_started
 import webbrowser
 
 def signal_handler(sig, frame):
@@ -11,19 +14,33 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 def main():
+    parser = argparse.ArgumentParser(description="SCADA Security Monitor")
+    parser.add_argument("--role", choices=("standalone", "daemon"), default="standalone",
+                        help="daemon runs capture and analysis only, for web workers started from src.wsgi")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--no-browser", action="store_true", help="Don't open the dashboard in a web browser")
+    args = parser.parse_args()
     signal.signal(signal.SIGINT, signal_handler)
     print("Starting SCADA Security Monitor...")
+    app = create_app(args.role)
     print("Starting monitoring threads...")
     threads = start_threads()
-    print("Opening web browser...")
-    # Use localhost with port 5000
-    local_url = 'http://127.0.0.1:5000'
-    webbrowser.open(local_url)
+    if args.role == "daemon":
+        print("Capture daemon running; serve the web UI with: gunicorn -w 4 --threads 50 src.wsgi:app")
+        while True:
+            time.sleep(3600)
+    print(f"Web UI starting after {time.perf_counter() - startup_started:.2f}s; "
+          "capture and analysis load when monitoring is first started")
+    if not args.no_browser:
+        # Opened once the server below is listening, so startup doesn't wait on the browser
+        local_url = f'http://127.0.0.1:{args.port}'
+        threading.Timer(0.5, webbrowser.open, args=(local_url,)).start()
     try:
         # Run the application locally
-        socketio.run(app, 
-                    host='127.0.0.1',
-                    port=5000,
+        app.extensions['socketio'].run(app, 
+                    host=args.host,
+                    port=args.port,
                     debug=False, 
                     allow_unsafe_werkzeug=True)
     except KeyboardInterrupt:
@@ -1,77 +1,598 @@
 # Update imports and paths
-from flask import Flask, render_template, jsonify, send_file, request
-from flask_socketio import SocketIO
+import time
+startup_started = time.perf_counter()  # Startup phases are measured from here
+
+from flask import Blueprint, Flask, render_template, jsonify, send_file, request, Response
+from flask_socketio import SocketIO, join_room, leave_room
 from datetime import datetime
 import threading
-import time
-import random
-from scapy.all import sniff, wrpcap, TCP
+import queue
+import functools
 import os
 import json
-from pymodbus.client import ModbusTcpClient
-from .utils.pcap_manager import PcapManager  # Use relative import
+import ipaddress
+import base64
+import collections
+# Only what the web UI needs is imported here, and nothing is built until create_app(). Capture,
+# analysis, time series (both NumPy), Modbus polling (pymodbus), re-analysis and retention are
+# imported by their load_* functions when first used.
+from .utils.catalog import Catalog, parse_time
+from .utils.pcap_index import extract_pcap
+from .utils.pcap_reader import COMPRESSED_SUFFIX, open_pcap, resolve_capture, lock_shared
+from .utils.event_store import EventStore, format_ts
+from .utils.broadcaster import EventBroadcaster
+from .utils.shared_state import SharedState, BroadcastRelay
+from .utils.sketches import StreamingStats
+from .utils.decoder import decode_frame, peek_flow, ip_to_str
+from .utils.metrics import REGISTRY, counter, gauge, histogram, stage_histogram, SamplingProfiler
 
-app = Flask(__name__, 
-    template_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'),
-    static_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-)
-socketio = SocketIO(app, async_mode='threading', cors_allowed_origins="*")
+# Views are registered on this blueprint; create_app() builds the app and Socket.IO server around it
+routes = Blueprint("scada", __name__)
 
 # Update directory structure
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CAPTURE_DIR = os.path.join(BASE_DIR, "data", "pcaps")
 REPORTS_DIR = os.path.join(BASE_DIR, "data", "reports")
+CATALOG_PATH = os.path.join(BASE_DIR, "data", "catalog.db")
+SHARED_STATE_PATH = os.path.join(BASE_DIR, "data", "state.db")  # Daemon <-> web worker state in multi-worker mode
+MODBUS_DEVICES_CONFIG = os.path.join(BASE_DIR, "config", "modbus_devices.json")
+ASSET_INVENTORY = os.path.join(BASE_DIR, "config", "assets.json")  # Devices and zones; enrichment is off without it
+FILES_PAGE_SIZE = 50  # Default and maximum page sizes for /api/files
+FILES_MAX_PAGE_SIZE = 500
+
+# Continuous capture settings
+CAPTURE_CONFIG = os.path.join(BASE_DIR, "config", "capture.json")  # Interfaces and their capture profiles
+CAPTURE_QUEUE_SIZE = 100000  # Packets buffered between sniffer and analysis
+CAPTURE_BATCH_SIZE = 256  # Frames decoded per batch by the processing thread
+PCAP_ROTATE_BYTES = 64 * 1024 * 1024
+PCAP_ROTATE_SECONDS = 300
+PCAP_INDEX_INTERVAL = 1.0  # Seconds of capture time between offset index entries
+FLOW_TABLE_CAPACITY = 500000  # Concurrent TCP flows tracked for Modbus latency
+FLOW_IDLE_TIMEOUT = 120
+ANALYSIS_WORKERS = int(os.environ.get("SCADA_ANALYSIS_WORKERS", "0"))  # >0 shards analysis over worker processes
+PIPELINE_RING_BYTES = 32 * 1024 * 1024  # Shared-memory buffer per analysis worker
+PIPELINE_EVENT_RATE = 20000  # Low-severity events per second each worker forwards; the rest are counted
+PIPELINE_EPOCH_TIMEOUT = 120.0  # Seconds a closed file's report waits for every worker's share
+BASELINE_INTERVAL = 10.0  # Seconds per Modbus request-rate sample
+BASELINE_LEARNING_SECONDS = 300  # Modbus operations first seen after this are flagged as new
+BASELINE_MAX_KEYS = 200000  # Client/device/unit/function/register-block combinations tracked
+
+# Instrumentation settings
+STAGE_TIMING_SAMPLE = 16  # Time the per-frame stages on one frame in this many
+PROFILE_MAX_SECONDS = 300  # Longest sampling profile /api/profile/start will run
+
+# Storage retention settings
+RETENTION_INTERVAL = 60  # Seconds between housekeeping passes
+COMPRESS_AFTER_SECONDS = 0  # Closed captures are compressed on the next pass
+CAPTURE_BUDGET_BYTES = 20 * 1024 ** 3  # Oldest captures are deleted beyond this
+CAPTURE_MAX_AGE_DAYS = 30
+REPORT_ROLLUP_AFTER_DAYS = 7  # Older per-capture reports are merged into daily rollups
+REPORT_ENCODING = os.environ.get("SCADA_REPORT_ENCODING", "indent")  # indent, compact or gzip
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+
+# Simulation (load generator) settings
+SIMULATION_RATE = float(os.environ.get("SCADA_SIMULATION_RATE", "0"))  # >0 also runs the generator while monitoring
+SIMULATION_MAX_RATE = 1000000  # Highest target /api/simulation/start accepts, frames/s
+
+# Deployment roles: standalone runs capture and web in one process; daemon runs capture and
+# analysis only; web workers are stateless and read the daemon's state from SHARED_STATE_PATH
+ROLES = ("standalone", "daemon", "web")
+DAEMON_REQUEST_TIMEOUT = 10  # Seconds a web worker waits for the daemon to answer a relayed request
+
+# Dashboard statistics settings
+STATS_TICK_INTERVAL = 1.0  # Seconds between stats_tick pushes to dashboards
+
+# Event store settings
+EVENT_STORE_CAPACITY = 50000  # Most recent events kept in memory
+EVENTS_PAGE_LIMIT = 1000  # Maximum events returned by one /api/events call
+
+# Socket.IO broadcast settings
+BROADCAST_INTERVAL = 0.5  # Seconds between new_events batches
+BROADCAST_BATCH_SIZE = 200  # Flush early once this many events are queued
+BROADCAST_MAX_QUEUE = 20000  # Events beyond this are dropped and counted
+BROADCAST_MAX_ROOM_BATCH = 500  # Events per batch per client room; the rest are summarized
 
 # Global variables
+role = "standalone"
+shared_state = None
 scanning_active = False  # Start with capture disabled
-simulation_active = False
-events = []
+load_generator = None
 current_pcap = None
-pcap_manager = PcapManager()
+analysis_jobs = {}
+
+# Web state, built by create_app()
+app = None
+socketio = None
+catalog = None
+event_store = None
+broadcaster = None
+capture_queue = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+current_analysis = None
+last_file_analysis = None
+pipeline = None
+modbus_poller = None
+processing_thread = None
+
+# Subsystems created by their load_* function the first time they are needed
+capture_manager = None
+pcap_manager = None
+retention = None
+asset_inventory = None
+rule_engine = None
+flow_table = None
+baseline = None
+load_lock = threading.RLock()
+startup_seconds = {}  # Seconds after startup began that each phase was ready
 
 stats = {
     "total_events": 0,
-    "high_severity": 0,
-    "unique_sources": set()
+    "high_severity": 0
+}
+traffic_stats = StreamingStats()
+timeseries = None
+
+capture_stats = {
+    "captured_packets": 0,
+    "dropped_packets": 0,
+    "files_written": 0
 }
 
+stage_seconds = {}
+capture_delay = None
+profiler = None
+
+def register_metrics():
+    """Register this process's counters, gauges and stage histograms (again on a later create_app())"""
+    global stage_seconds, capture_delay
+    stage_seconds = {stage: stage_histogram(stage) for stage in
+                     ("decode", "analyze", "baseline", "callback", "pcap_write", "dispatch", "report")}
+    capture_delay = histogram("scada_capture_delay_seconds", "Time from kernel timestamp to analysis of a frame")
+    counter("scada_captured_packets_total", "Frames taken off the capture queue", fn=lambda: capture_stats["captured_packets"])
+    counter("scada_dropped_packets_total", "Frames dropped because the capture queue or pipeline was full",
+            fn=lambda: capture_stats["dropped_packets"])
+    counter("scada_kernel_packets_total", "Frames the kernel delivered to the capture sockets",
+            fn=lambda: capture_manager.totals().get("kernel_packets", 0) if capture_manager is not None else 0)
+    counter("scada_kernel_drops_total", "Frames the kernel dropped before a sniffer read them",
+            fn=lambda: capture_manager.totals().get("kernel_drops", 0) if capture_manager is not None else 0)
+    counter("scada_pcap_files_total", "Capture files closed and reported", fn=lambda: capture_stats["files_written"])
+    counter("scada_events_total", "Events recorded", fn=lambda: stats["total_events"])
+    counter("scada_broadcast_events_total", "Events queued for Socket.IO broadcast", fn=lambda: broadcaster.published)
+    counter("scada_broadcast_dropped_total", "Events dropped from a full broadcast queue", fn=lambda: broadcaster.dropped)
+    counter("scada_broadcast_batches_total", "new_events batches emitted", fn=lambda: broadcaster.batches_sent)
+    gauge("scada_capture_queue_depth", "Frames waiting between sniffer and analysis", fn=capture_queue.qsize)
+    gauge("scada_broadcast_queue_depth", "Events waiting for the next broadcast flush", fn=lambda: broadcaster.queue_depth)
+    gauge("scada_connected_clients", "Connected Socket.IO dashboards", fn=lambda: broadcaster.client_count)
+    gauge("scada_event_store_size", "Events held in memory", fn=lambda: len(event_store))
+    gauge("scada_active_flows", "TCP flows tracked", fn=lambda: len(flow_table) if flow_table is not None else 0)
+    gauge("scada_baseline_keys", "Modbus behaviour baselines tracked",
+          fn=lambda: len(baseline) if baseline is not None else 0)
+    gauge("scada_inventory_assets", "Devices in the asset inventory",
+          fn=lambda: len(asset_inventory) if asset_inventory is not None else 0)
+    counter("scada_baseline_anomalies_total", "Modbus frames scored as anomalous",
+            fn=lambda: baseline.anomalies if baseline is not None else 0)
+    gauge("scada_pipeline_backlog_bytes", "Bytes waiting in the analysis worker rings",
+          fn=lambda: sum(pipeline.backlog()) if pipeline is not None else 0)
+    counter("scada_pipeline_dropped_total", "Frames dropped because an analysis worker's ring was full",
+            fn=lambda: pipeline.dropped if pipeline is not None else 0)
+    counter("scada_pipeline_events_suppressed_total", "Low-severity events analysis workers counted but did not forward",
+            fn=lambda: pipeline.events_suppressed if pipeline is not None else 0)
+    counter("scada_pipeline_failed_epochs_total", "Capture files reported without every analysis worker's share",
+            fn=lambda: pipeline.failed_epochs if pipeline is not None else 0)
+    counter("scada_pipeline_worker_restarts_total", "Analysis worker processes restarted after exiting",
+            fn=lambda: pipeline.worker_restarts if pipeline is not None else 0)
+
+def mark_startup(phase):
+    """Record when a startup phase finished, as seconds since this module began importing"""
+    seconds = time.perf_counter() - startup_started
+    startup_seconds[phase] = round(seconds, 3)
+    gauge("scada_startup_seconds", "Seconds from startup to each phase being ready", phase=phase).set(seconds)
+    return seconds
+
+def load_timeseries():
+    """Dashboard time series, created by the first stats tick (or query) after startup"""
+    global timeseries
+    with load_lock:
+        if timeseries is None:
+            from .utils.timeseries import TimeSeries
+            timeseries = TimeSeries()
+    return timeseries
+
+def load_capture():
+    """The CaptureManager for the configured interfaces, created when capture is first used"""
+    global capture_manager
+    with load_lock:
+        if capture_manager is None:
+            from .utils.capture import CaptureManager, load_capture_config
+            capture_manager = CaptureManager(*load_capture_config(CAPTURE_CONFIG))
+            mark_startup("capture")
+    return capture_manager
+
+def load_analysis():
+    """Create the detection state kept across capture files: asset inventory, flows, Modbus baselines and rules"""
+    global asset_inventory, rule_engine, flow_table, baseline
+    with load_lock:
+        if rule_engine is None:
+            from .utils.assets import load_inventory
+            from .utils.baseline import ModbusBaseline
+            from .utils.flows import FlowTable
+            from .utils.rules import RuleEngine, default_rules
+            asset_inventory = load_inventory(ASSET_INVENTORY)
+            flow_table = FlowTable(FLOW_TABLE_CAPACITY, FLOW_IDLE_TIMEOUT)
+            baseline = ModbusBaseline(BASELINE_INTERVAL, learning=BASELINE_LEARNING_SECONDS, max_keys=BASELINE_MAX_KEYS)
+            rule_engine = RuleEngine(default_rules(inventory=asset_inventory))
+            mark_startup("analysis")
+    return rule_engine
+
+def load_pcap_manager():
+    global pcap_manager
+    with load_lock:
+        if pcap_manager is None:
+            from .utils.pcap_manager import PcapManager
+            pcap_manager = PcapManager(CAPTURE_DIR, REPORTS_DIR, catalog=catalog, report_encoding=REPORT_ENCODING,
+                                       inventory_path=ASSET_INVENTORY)
+    return pcap_manager
+
+def load_retention():
+    global retention
+    with load_lock:
+        if retention is None:
+            from .utils.retention import RetentionManager
+            retention = RetentionManager(
+                catalog,
+                REPORTS_DIR,
+                compress_after=COMPRESS_AFTER_SECONDS,
+                max_bytes=CAPTURE_BUDGET_BYTES,
+                max_age=CAPTURE_MAX_AGE_DAYS * 86400,
+                rollup_after=REPORT_ROLLUP_AFTER_DAYS * 86400,
+                report_encoding=REPORT_ENCODING,
+                interval=RETENTION_INTERVAL,
+                on_change=lambda summary: notify('catalog_updated', {"retention": summary})
+            )
+    return retention
+
+def create_app(deployment_role="standalone"):
+    """Build the Flask app, Socket.IO server, catalog and event store for a deployment role (see ROLES)
+
+    standalone and daemon processes then call start_threads(); a daemon publishes
+    events, stats and Socket.IO messages to SHARED_STATE_PATH and answers the
+    requests web workers relay. Web workers start only the broadcast relay.
+    Capture and analysis state is per process, so the latest app is the one they
+    report to; each call starts it with a fresh event store and catalog connection.
+    """
+    global app, socketio, role, shared_state, catalog, event_store, broadcaster
+    if deployment_role not in ROLES:
+        raise ValueError(f"Unknown role {deployment_role!r}, expected one of {', '.join(ROLES)}")
+    role = deployment_role
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    app = Flask(__name__, template_folder=os.path.join(package_dir, 'templates'),
+                static_folder=os.path.join(package_dir, 'static'))
+    app.register_blueprint(routes)
+    socketio = SocketIO(app, async_mode='threading', cors_allowed_origins="*")
+    for event, handler in (('connect', handle_connect), ('client_ready', handle_client_ready),
+                           ('subscribe', handle_subscribe), ('disconnect', handle_disconnect)):
+        socketio.on_event(event, handler)
+
+    os.makedirs(os.path.dirname(CATALOG_PATH), exist_ok=True)
+    catalog = Catalog(CATALOG_PATH)
+    event_store = EventStore(EVENT_STORE_CAPACITY)
+    broadcaster = EventBroadcaster(
+        socketio,
+        interval=BROADCAST_INTERVAL,
+        batch_size=BROADCAST_BATCH_SIZE,
+        max_queue=BROADCAST_MAX_QUEUE,
+        max_room_batch=BROADCAST_MAX_ROOM_BATCH
+    )
+    register_metrics()
+
+    shared_state = None
+    if role != "standalone":
+        os.makedirs(os.path.dirname(SHARED_STATE_PATH), exist_ok=True)
+        shared_state = SharedState(SHARED_STATE_PATH, EVENT_STORE_CAPACITY, interval=BROADCAST_INTERVAL)
+    if role == "daemon":
+        shared_state.reset()
+        shared_state.serve(run_relayed_request)
+    elif role == "web":
+        BroadcastRelay(shared_state, socketio, broadcaster, BROADCAST_INTERVAL, BROADCAST_MAX_QUEUE).start()
+        broadcaster.start()
+    return app
+
 def start_threads():
+    """Start what the web UI needs; the rest starts in the background or when first enabled
+
+    Capture, analysis and the PCAP writer load when monitoring (or a simulation) is
+    first started. Indexing existing files, retention and Modbus polling start on a
+    background thread so the web server can come up first.
+    """
     # Create necessary directories
     for directory in [CAPTURE_DIR, REPORTS_DIR]:
         if not os.path.exists(directory):
             os.makedirs(directory)
             print(f"Created directory: {directory}")
-    
-    # Optimize threads
-    simulation_thread = threading.Thread(target=simulate_events, daemon=True)
-    capture_thread = threading.Thread(target=capture_packets, daemon=True)
-    
-    simulation_thread.start()
+
+    capture_thread = threading.Thread(target=capture_packets, name="capture", daemon=True)
     capture_thread.start()
-    
-    return [simulation_thread, capture_thread]
+    broadcast_thread = shared_state.start() if role == "daemon" else broadcaster.start()
+    stats_thread = threading.Thread(target=push_stats, daemon=True)
+    stats_thread.start()
+    services_thread = threading.Thread(target=start_services, name="startup", daemon=True)
+    services_thread.start()
+    mark_startup("web")
+    return [capture_thread, broadcast_thread, stats_thread, services_thread]
+
+def start_services():
+    """Background part of startup: index existing files, then start retention and Modbus polling"""
+    try:
+        added = catalog.sync_directories(CAPTURE_DIR, REPORTS_DIR)
+        if added:
+            print(f"Indexed {added} existing capture/report files")
+        load_retention().start()
+        start_modbus_poller()
+        print(f"Background services ready after {mark_startup('services'):.2f}s")
+    except Exception as e:
+        print(f"Startup error: {e}")
 
-@app.route('/')
+def start_processing():
+    """Start the analysis thread (loading capture and analysis) unless it is already running"""
+    global processing_thread
+    with load_lock:
+        if processing_thread is None:
+            processing_thread = threading.Thread(target=process_captured_packets, name="analysis", daemon=True)
+            processing_thread.start()
+    return processing_thread
+
+def start_modbus_poller():
+    """Start active polling of the PLCs in config/modbus_devices.json, if any are enabled
+
+    pymodbus is only imported once a device is enabled.
+    """
+    global modbus_poller
+    if not os.path.exists(MODBUS_DEVICES_CONFIG):
+        return None
+    try:
+        with open(MODBUS_DEVICES_CONFIG) as f:
+            if not any(device.get("enabled", True) for device in json.load(f).get("devices", [])):
+                return None
+        from .utils.modbus_poller import ModbusPoller, load_config
+        devices = load_config(MODBUS_DEVICES_CONFIG)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Invalid Modbus device config: {e}")
+        return None
+    modbus_poller = ModbusPoller(devices, on_poll_reading, on_poll_failure)
+    print(f"Polling {len(devices)} Modbus devices")
+    return modbus_poller.start()
+
+def on_poll_reading(device, values, latency_ms):
+    now = time.time()
+    record_event({
+        "ts": now,
+        "timestamp": format_ts(now),
+        "source_ip": device.host,
+        "target_ip": "poller",
+        "protocol": "Modbus TCP",
+        "severity": "Low",
+        "packet_info": f"Polled {device.name}: {len(values)} points in {latency_ms:.1f} ms",
+        "modbus_details": {"function_code": "poll", "unit_id": device.unit_id, "data_length": len(device.blocks)}
+    })
+
+def on_poll_failure(device, error, breaker_opened):
+    now = time.time()
+    record_event({
+        "ts": now,
+        "timestamp": format_ts(now),
+        "source_ip": device.host,
+        "target_ip": "poller",
+        "protocol": "Modbus TCP",
+        "severity": "High" if breaker_opened else "Medium",
+        "packet_info": f"Poll of {device.name} failed: {error}" + (" (polling suspended)" if breaker_opened else ""),
+        "modbus_details": None
+    })
+
+def daemon_route(view):
+    """Views that need the daemon's live state or control it: web workers relay them to the daemon
+
+    Request and response bodies travel base64-encoded, so binary bodies pass through unchanged.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if role != "web":
+            return view(*args, **kwargs)
+        result = shared_state.call("request", {
+            "method": request.method,
+            "path": request.path,
+            "query_string": request.query_string.decode(),
+            "body": base64.b64encode(request.get_data()).decode("ascii"),
+            "content_type": request.content_type
+        }, timeout=DAEMON_REQUEST_TIMEOUT)
+        if result is None:
+            return jsonify({"error": "Capture daemon is not responding"}), 503
+        if "error" in result and "status" not in result:
+            return jsonify(result), 500
+        return Response(base64.b64decode(result["body"]), status=result["status"],
+                        content_type=result["content_type"])
+    return wrapper
+
+def run_relayed_request(name, payload):
+    """Daemon side of daemon_route: run the request against this process's views"""
+    if name != "request":
+        raise ValueError(f"Unknown command {name!r}")
+    with app.test_request_context(payload["path"], method=payload["method"], query_string=payload["query_string"],
+                                  data=base64.b64decode(payload["body"]), content_type=payload["content_type"]):
+        response = app.full_dispatch_request()
+        return {
+            "status": response.status_code,
+            "content_type": response.content_type,
+            "body": base64.b64encode(response.get_data()).decode("ascii")
+        }
+
+@routes.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/api/stats')
+@routes.route('/api/stats')
 def get_stats():
-    return jsonify({
+    if role == "web":
+        return jsonify(shared_state.get("stats") or {"error": "Capture daemon has not published any stats yet"})
+    return jsonify(stats_snapshot())
+
+def stats_snapshot():
+    return {
+        "scanning": scanning_active,
         "total_events": stats["total_events"],
         "high_severity": stats["high_severity"],
-        "unique_sources": len(stats["unique_sources"])
-    })
+        "unique_sources": traffic_stats.unique_sources(),
+        "windows": traffic_stats.snapshot(),
+        "captured_packets": capture_stats["captured_packets"],
+        "dropped_packets": capture_stats["dropped_packets"],
+        "capture_backlog": capture_queue.qsize(),
+        "interfaces": capture_manager.status() if capture_manager is not None else [],
+        "startup": startup_seconds,
+        "broadcast_rooms": broadcaster.room_stats(),
+        "pipeline": {
+            "workers": pipeline.workers,
+            "submitted": pipeline.submitted,
+            "dropped": pipeline.dropped,
+            "worker_dropped": pipeline.shard_dropped,
+            "events_suppressed": pipeline.events_suppressed,
+            "failed_epochs": pipeline.failed_epochs,
+            "worker_restarts": pipeline.worker_restarts,
+            "backlog_bytes": pipeline.backlog()
+        } if pipeline is not None else None
+    }
+
+@routes.route('/api/timeseries')
+@daemon_route
+def get_timeseries():
+    """Pre-aggregated severity/protocol counts: ?resolution=1s|1m|1h&range=5m"""
+    try:
+        resolution = request.args.get('resolution', '1s')
+        from .utils.timeseries import parse_duration
+        range_seconds = parse_duration(request.args.get('range', '5m'))
+        return jsonify(load_timeseries().query(resolution, range_seconds))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@routes.route('/api/network_health')
+@daemon_route
+def get_network_health():
+    """Live Modbus latency, retransmission and exception rates for the current capture file
+
+    In pipeline mode flow state lives in the workers, so the last closed file is reported.
+    """
+    if pipeline is not None:
+        if last_file_analysis is None:
+            return jsonify({"scope": "last_file"})
+        return jsonify(dict(last_file_analysis["network_health"].summary(), scope="last_file"))
+    analysis = current_analysis
+    if analysis is None:
+        return jsonify({"active_flows": len(flow_table) if flow_table is not None else 0})
+    health = analysis["network_health"].summary()
+    health["active_flows"] = len(flow_table)
+    health["evicted_flows"] = flow_table.evicted
+    return jsonify(health)
+
+@routes.route('/api/poller')
+@daemon_route
+def get_poller_status():
+    """Per-device polling health and the latest values read"""
+    if modbus_poller is None:
+        return jsonify({"enabled": False, "devices": []})
+    return jsonify({"enabled": True, "devices": modbus_poller.status()})
+
+@routes.route('/metrics')
+@daemon_route
+def prometheus_metrics():
+    """Counters, gauges and stage latency histograms in Prometheus text format"""
+    return Response(REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@routes.route('/api/metrics')
+@daemon_route
+def get_metrics():
+    return jsonify(REGISTRY.snapshot())
+
+@routes.route('/api/profile/start', methods=['POST'])
+@daemon_route
+def start_profile():
+    """Sample the analysis thread's stack: {"interval": 0.005, "duration": 30}"""
+    global profiler
+    body = request.get_json(silent=True) or {}
+    try:
+        interval = max(0.001, float(body.get("interval", 0.005)))
+        duration = min(PROFILE_MAX_SECONDS, float(body.get("duration", 30)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "interval and duration must be numbers"}), 400
+    if profiler is not None and profiler.running:
+        return jsonify({"error": "A profile is already running"}), 409
+    new_profiler = SamplingProfiler(body.get("thread", "analysis"), interval)
+    try:
+        new_profiler.start(duration)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    profiler = new_profiler
+    return jsonify(profiler.status()), 202
+
+@routes.route('/api/profile/stop', methods=['POST'])
+@daemon_route
+def stop_profile():
+    if profiler is None:
+        return jsonify({"error": "No profile has been started"}), 404
+    profiler.stop()
+    return jsonify(profiler.status())
+
+@routes.route('/api/profile')
+@daemon_route
+def get_profile():
+    """Latest profile: ?format=json (top functions) or collapsed (flame graph input)"""
+    if profiler is None:
+        return jsonify({"error": "No profile has been started"}), 404
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    return jsonify(dict(profiler.status(), top=profiler.top(request.args.get('top', 20, type=int))))
+
+@routes.route('/api/capture')
+@daemon_route
+def get_capture():
+    """Capture profiles and each interface's profile, state and counters"""
+    manager = load_capture()
+    return jsonify({"profiles": manager.profiles, "interfaces": manager.status()})
+
+@routes.route('/api/capture/interfaces', methods=['POST'])
+@daemon_route
+def set_capture_profile():
+    """Capture an interface with a profile, switching live if running: {"iface": "eth0", "profile": "modbus-only"}"""
+    body = request.get_json(silent=True) or {}
+    manager = load_capture()
+    try:
+        manager.set_profile(body.get("iface") or None, body.get("profile", "full"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"interfaces": manager.status()})
+
+@routes.route('/api/capture/interfaces/<iface>', methods=['DELETE'])
+@daemon_route
+def remove_capture_interface(iface):
+    manager = load_capture()
+    try:
+        manager.remove_interface(None if iface == "default" else iface)
+    except KeyError:
+        return jsonify({"error": f"Interface {iface} is not being captured"}), 404
+    return jsonify({"interfaces": manager.status()})
 
-@app.route('/api/control/toggle', methods=['POST'])
+@routes.route('/api/control/toggle', methods=['POST'])
+@daemon_route
 def toggle_scanning():
-    global scanning_active, simulation_active
+    global scanning_active
     try:
         scanning_active = not scanning_active
-        simulation_active = not simulation_active
+        if scanning_active:
+            start_processing()
+        if SIMULATION_RATE > 0:
+            if scanning_active:
+                start_load_generator(SIMULATION_RATE)
+            else:
+                stop_load_generator()
         status = "running" if scanning_active else "stopped"
         
-        socketio.emit('scanning_status', {
+        notify('scanning_status', {
             "scanning": scanning_active,
             "status": status
         })
@@ -86,388 +607,625 @@ def toggle_scanning():
         print(f"Toggle error: {e}")
         return jsonify({"error": str(e)}), 500
 
-def packet_callback(packet):
-    if hasattr(packet, 'src'):
-        is_modbus = False
-        modbus_info = {}
-        
-        if TCP in packet and (packet[TCP].sport == 502 or packet[TCP].dport == 502):
-            is_modbus = True
-            modbus_info = {
-                "function_code": "Unknown",
-                "unit_id": "Unknown",
-                "data_length": len(packet[TCP].payload) if hasattr(packet[TCP], 'payload') else 0
-            }
-        
-        event = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "source_ip": packet.src,
-            "target_ip": packet.dst if hasattr(packet, 'dst') else 'Unknown',
-            "protocol": "Modbus TCP" if is_modbus else (packet.type if hasattr(packet, 'type') else 'Unknown'),
-            "severity": "High" if is_modbus else random.choice(["Low", "Medium", "High"]),
-            "packet_info": packet.summary(),
-            "modbus_details": modbus_info if is_modbus else None
-        }
-        
-        events.append(event)
+@routes.route('/api/simulation')
+@daemon_route
+def get_simulation():
+    if load_generator is None:
+        return jsonify({"running": False})
+    return jsonify(load_generator.status())
+
+@routes.route('/api/simulation/start', methods=['POST'])
+@daemon_route
+def start_simulation():
+    """Offer synthetic traffic: {"rate": 50000, "profile": "burst", "scenario": "scan", "duration": 60, "iface": "lo"}
+
+    Without iface the frames go straight into the capture queue; with it they are
+    replayed onto that interface for the sniffers to pick up.
+    """
+    body = request.get_json(silent=True) or {}
+    if load_generator is not None and load_generator.running:
+        return jsonify({"error": "A simulation is already running"}), 409
+    try:
+        rate = float(body.get("rate", 10000))
+        duration = float(body["duration"]) if body.get("duration") is not None else None
+        period = float(body.get("period", 60))
+        if not 0 < rate <= SIMULATION_MAX_RATE:
+            raise ValueError(f"rate must be between 0 and {SIMULATION_MAX_RATE}")
+        start_load_generator(rate, body.get("profile", "constant"), body.get("scenario", "mixed"),
+                             duration, period, body.get("iface"))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        return jsonify({"error": f"Cannot send on {body.get('iface')}: {e}"}), 400
+    return jsonify(load_generator.status()), 202
+
+@routes.route('/api/simulation/stop', methods=['POST'])
+@daemon_route
+def stop_simulation():
+    if load_generator is None:
+        return jsonify({"error": "No simulation has been started"}), 404
+    stop_load_generator()
+    return jsonify(load_generator.status())
+
+def start_load_generator(rate, profile="constant", scenario="mixed", duration=None, period=60.0, iface=None):
+    """Start offering synthetic traffic, in process or onto iface"""
+    global load_generator
+    from .utils.load_gen import LoadGenerator, InterfaceSink
+    start_processing()
+    sink = InterfaceSink(iface) if iface else enqueue_frames
+    generator = LoadGenerator(sink, rate, profile, scenario, duration, period=period,
+                              processed=lambda: capture_stats["captured_packets"], on_finish=load_generator_finished)
+    generator.start()
+    load_generator = generator
+    print(f"Simulation started: {rate:g} frames/s, {profile} profile, {scenario} scenario"
+          f"{' on ' + iface if iface else ''}")
+
+def stop_load_generator():
+    if load_generator is not None:
+        load_generator.stop()
+
+def load_generator_finished(generator):
+    """Generator thread exit: release the interface, or close the simulated PCAP so its report is written"""
+    from .utils.load_gen import InterfaceSink
+    if isinstance(generator.sink, InterfaceSink):
+        generator.sink.close()
+    elif not scanning_active:
+        capture_queue.put(None)
+    status = generator.status()
+    print(f"Simulation stopped: {status['achieved_pps']} of {status['mean_target_pps']} frames/s achieved")
+
+def packet_callback(frame):
+    """Turn a decoded frame into a live event"""
+    from .utils.analysis import frame_event
+    event = frame_event(frame)
+    if event is not None:
+        record_event(event)
+
+def record_event(event, count_source=True):
+    """Store an event, update stats and queue it for broadcast
+
+    count_source is False for pipeline events, whose frames the dispatch thread
+    has already counted in traffic_stats.
+    """
+    with event_store.lock:  # Called from the processing, poller and pipeline coordinator threads
+        record = event_store.append(event)
         stats["total_events"] += 1
-        stats["unique_sources"].add(event["source_ip"])
+        if count_source:
+            traffic_stats.add_source(event["source_ip"])
         if event["severity"] == "High":
             stats["high_severity"] += 1
-            
-        socketio.emit('new_event', event)
-        print(f"Event emitted: {event}")
+        if timeseries is not None:
+            timeseries.record(event["severity"], event["protocol"])
+    event["id"] = record.id
+    if role == "daemon":
+        shared_state.publish(record)
+    else:
+        broadcaster.publish(event)
+
+def record_events(events):
+    for event in events:
+        record_event(event, count_source=False)
+
+def count_sources(flows):
+    """Pipeline mode: count every frame's source here, since workers rate-limit the events they forward"""
+    sources = collections.Counter(flow[0] for flow in flows if flow is not None)
+    now = time.time()
+    with event_store.lock:
+        for addr, count in sources.items():
+            traffic_stats.add_source(ip_to_str(addr), now, count)
+
+def push_stats():
+    """Roll up the last tick's counts and push them, with the headline stats, to dashboards"""
+    while True:
+        time.sleep(STATS_TICK_INTERVAL)
+        try:
+            delta = load_timeseries().tick()
+            if role == "daemon":
+                shared_state.put("stats", stats_snapshot())
+            if role == "daemon" or broadcaster.client_count:
+                delta.update(
+                    total_events=stats["total_events"],
+                    high_severity=stats["high_severity"],
+                    unique_sources=traffic_stats.unique_sources(),
+                    captured_packets=capture_stats["captured_packets"],
+                    dropped_packets=capture_stats["dropped_packets"]
+                )
+                notify('stats_tick', delta)
+        except Exception as e:
+            print(f"Stats tick error: {e}")
+
+def notify(event, data):
+    """Emit to every dashboard; a daemon hands the message to the web workers to emit"""
+    if role == "daemon":
+        shared_state.emit(event, data)
+    else:
+        socketio.emit(event, data)
 
 def capture_packets():
+    """Keep a sniffer running on every configured interface for as long as scanning is active"""
+    capturing = False
     while True:
-        if scanning_active:
-            try:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                pcap_file = os.path.join(CAPTURE_DIR, f"capture_{timestamp}.pcap")
-                report_file = os.path.join(REPORTS_DIR, f"report_{timestamp}.json")
-                
-                print("Starting packet capture...")
-                packets = sniff(filter="port 502 or not port 502", count=100, timeout=30)
-                
-                if packets:
-                    wrpcap(pcap_file, packets)
-                    print(f"PCAP saved: {pcap_file}")
-                    
-                    packet_analysis = analyze_packets(packets, timestamp)
-                    generate_report(packet_analysis, pcap_file, report_file)
-                
-            except Exception as e:
-                print(f"Capture error: {e}")
-            time.sleep(30)  # Wait 30 seconds between captures
-
-def analyze_packets(packets, timestamp):
-    analysis = {
-        "total_packets": len(packets),
-        "protocols": {},
-        "source_ips": set(),
-        "dest_ips": set(),
-        "timestamp": timestamp,
-        "modbus_stats": {
-            "total_modbus_packets": 0,
-            "function_codes": {},
-            "unit_ids": set()
-        },
-        "security_analysis": {
-            "potential_threats": [],
-            "recommendations": [],
-            "risk_level": "Low",
-            "detected_threats": []
-        },
-        "network_health": {
-            "latency": {},
-            "packet_loss": 0,
-            "bandwidth_usage": "Normal"
-        }
-    }
-    
-    for packet in packets:
-        analyze_single_packet(packet, analysis)
-    
-    generate_security_recommendations(analysis)  # This function is missing
-    return analysis
-
-def analyze_single_packet(packet, analysis):
-    if TCP in packet:
-        # Check for potential port scanning
-        if packet[TCP].sport == 502 or packet[TCP].dport == 502:
-            analysis["modbus_stats"]["total_modbus_packets"] += 1
-            analyze_modbus_packet(packet, analysis)
-            
-            # Detect potential Modbus-specific threats
-            if packet[TCP].flags == 'S':  # SYN packets
-                threat = {
-                    "type": "Port Scanning",
-                    "severity": "High",
-                    "source": packet.src,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "details": "Potential Modbus port scanning detected",
-                    "solution": "Implement firewall rules to limit Modbus access to known IP addresses",
-                    "mitigation_steps": [
-                        "Configure firewall to whitelist known Modbus devices",
-                        "Implement rate limiting for Modbus connections",
-                        "Enable logging for all Modbus connection attempts"
-                    ]
-                }
-                analysis["security_analysis"]["detected_threats"].append(threat)
-        
-        # Check for potential DoS
-        if len(analysis["source_ips"]) > 100:  # Too many source IPs
-            threat = {
-                "type": "Potential DoS Attack",
-                "severity": "Critical",
-                "source": "Multiple Sources",
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "details": "Unusual number of source IPs detected",
-                "solution": "Implement rate limiting and DoS protection mechanisms",
-                "mitigation_steps": [
-                    "Deploy DoS protection at network edge",
-                    "Configure SYN flood protection",
-                    "Set up traffic monitoring and alerting"
-                ]
-            }
-            analysis["security_analysis"]["detected_threats"].append(threat)
-    
-    if 'IP' in packet:
-        analyze_ip_packet(packet, analysis)
-        
-        # Check for suspicious IP patterns
-        if packet['IP'].src.startswith('0.') or packet['IP'].src.startswith('127.'):
-            threat = {
-                "type": "IP Spoofing",
-                "severity": "High",
-                "source": packet['IP'].src,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "details": "Potentially spoofed IP address detected",
-                "solution": "Implement IP filtering and validation mechanisms",
-                "mitigation_steps": [
-                    "Configure ingress filtering",
-                    "Implement reverse path forwarding checks",
-                    "Set up IP reputation monitoring"
-                ]
-            }
-            analysis["security_analysis"]["detected_threats"].append(threat)
-
-def generate_report(analysis, pcap_file, report_file):
-    # Ensure we keep .json extension
-    if not report_file.endswith('.json'):
-        report_file = report_file + '.json'
-    
-    report_data = {
-        "report_metadata": {
-            "capture_time": analysis['timestamp'],
-            "pcap_file": pcap_file,
-            "report_generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "analysis_version": "1.0"
-        },
-        "network_statistics": {
-            "total_packets": analysis['total_packets'],
-            "protocol_distribution": analysis['protocols'],
-            "unique_sources": list(analysis['source_ips']),
-            "unique_destinations": list(analysis['dest_ips'])
-        },
-        "modbus_analysis": {
-            "total_modbus_packets": analysis['modbus_stats']['total_modbus_packets'],
-            "function_codes": analysis['modbus_stats']['function_codes'],
-            "unit_ids": list(analysis['modbus_stats']['unit_ids']),
-            "suspicious_operations": []
-        },
-        "security_analysis": {
-            "risk_level": analysis['security_analysis']['risk_level'],
-            "detected_threats": [
-                {
-                    "type": threat['type'],
-                    "severity": threat['severity'],
-                    "source": threat['source'],
-                    "timestamp": threat['timestamp'],
-                    "details": threat['details'],
-                    "recommended_solution": threat['solution'],
-                    "mitigation_steps": threat.get('mitigation_steps', [])
-                }
-                for threat in analysis['security_analysis']['detected_threats']
-            ],
-            "recommendations": analysis['security_analysis']['recommendations']
-        },
-        "network_health": {
-            "latency_stats": analysis['network_health']['latency'],
-            "packet_loss_rate": analysis['network_health']['packet_loss'],
-            "bandwidth_status": analysis['network_health']['bandwidth_usage'],
-            "performance_metrics": {
-                "average_response_time": "N/A",
-                "packet_error_rate": "N/A",
-                "network_utilization": "N/A"
-            }
-        }
-    }
-    
-    with open(report_file, 'w') as f:
-        json.dump(report_data, f, indent=4)
-    
-    print(f"Analysis report saved: {report_file}")
+        try:
+            if scanning_active:
+                started = load_capture().ensure_running(enqueue_packet)
+                if not capturing and started:
+                    print(f"Continuous packet capture started on {started} interface(s)")
+                capturing = True
+            elif capturing:
+                capture_manager.stop()
+                capturing = False
+                capture_queue.put(None)  # Close the current PCAP once the backlog drains
+                print("Continuous packet capture stopped")
+        except Exception as e:
+            print(f"Capture error: {e}")
+        time.sleep(1)
+
+def enqueue_packet(data, ts):
+    """Sniffer callback: hand the raw frame off without ever blocking capture"""
+    try:
+        capture_queue.put_nowait((data, ts))
+    except queue.Full:
+        capture_stats["dropped_packets"] += 1
+        return False
+
+def enqueue_frames(frames):
+    """In-process load generator sink: queue (data, ts) pairs as if they had been captured"""
+    accepted = 0
+    for data, ts in frames:
+        if enqueue_packet(data, ts) is False:
+            break
+        accepted += 1
+    return accepted
+
+def next_capture_batch():
+    """Up to CAPTURE_BATCH_SIZE queued frames, waiting at most a second for the first
+
+    Returns (batch, stopped); stopped is set when the sniffer has signalled the end
+    of a capture session.
+    """
+    try:
+        item = capture_queue.get(timeout=1)
+    except queue.Empty:
+        return [], False
+
+    batch = []
+    while item is not None:
+        batch.append(item)
+        if len(batch) >= CAPTURE_BATCH_SIZE:
+            break
+        try:
+            item = capture_queue.get_nowait()
+        except queue.Empty:
+            break
+    return batch, item is None
+
+def new_capture_writer(on_rotate):
+    from .utils.pcap_writer import RotatingPcapWriter
+    return RotatingPcapWriter(
+        CAPTURE_DIR,
+        max_bytes=PCAP_ROTATE_BYTES,
+        max_seconds=PCAP_ROTATE_SECONDS,
+        on_rotate=on_rotate,
+        index_interval=PCAP_INDEX_INTERVAL
+    )
+
+def process_captured_packets():
+    """Drain the capture queue into the rotating PCAP writer and incremental analysis"""
+    global current_analysis
+    load_analysis()  # Pipeline mode too: reports annotate threats with the asset inventory
+    if ANALYSIS_WORKERS > 0:
+        return dispatch_captured_packets()
+
+    from .utils.analysis import new_analysis, analyze_frame, score_frames, frame_event
+    current_analysis = new_analysis(datetime.now().strftime("%Y%m%d_%H%M%S"), rule_engine, flow_table, baseline,
+                                    asset_inventory)
+    writer = new_capture_writer(finish_capture_file)
+    processed = 0
 
-def simulate_events():
     while True:
-        if simulation_active:
-            try:
-                event = {
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "source_ip": f"192.168.{random.randint(1, 254)}.{random.randint(1, 254)}",
-                    "target_ip": f"10.0.{random.randint(1, 254)}.{random.randint(1, 254)}",
-                    "protocol": random.choice(["TCP", "UDP", "ICMP"]),
-                    "severity": random.choice(["Low", "Medium", "High"]),
-                    "packet_info": "Simulated packet"
-                }
-                
-                events.append(event)
-                stats["total_events"] += 1
-                stats["unique_sources"].add(event["source_ip"])
-                if event["severity"] == "High":
-                    stats["high_severity"] += 1
-                
-                socketio.emit('new_event', event)
-                print(f"Event emitted: {event}")
-            except Exception as e:
-                print(f"Event simulation error: {e}")
-            time.sleep(1)
+        batch, stopped = next_capture_batch()
+        try:
+            writer.maybe_rotate()
+            frames = []
+            for data, ts in batch:
+                processed += 1
+                if processed % STAGE_TIMING_SAMPLE:
+                    frame = decode_frame(data, ts)
+                    analyze_frame(frame, current_analysis)
+                    writer.write(data, ts, (frame.src_addr, frame.dst_addr), frame.length)
+                else:
+                    frame = process_frame_timed(data, ts, writer)
+                frames.append(frame)
+            if frames:
+                # Events need each frame's final risk, so they follow the batch's baseline scoring
+                t0 = time.perf_counter()
+                score_frames(current_analysis)
+                t1 = time.perf_counter()
+                for frame in frames:
+                    event = frame_event(frame)  # packet_callback, without its per-call import
+                    if event is not None:
+                        record_event(event)
+                stage_seconds["baseline"].observe((t1 - t0) / len(frames))
+                stage_seconds["callback"].observe((time.perf_counter() - t1) / len(frames))
+            capture_stats["captured_packets"] += len(batch)
+        except Exception as e:
+            print(f"Packet processing error: {e}")
+
+        if stopped:
+            writer.rotate()
+
+def process_frame_timed(data, ts, writer):
+    """The per-frame steps of process_captured_packets, recording each stage's latency"""
+    from .utils.analysis import analyze_frame
+    t0 = time.perf_counter()
+    capture_delay.observe(max(0.0, time.time() - ts))
+    frame = decode_frame(data, ts)
+    t1 = time.perf_counter()
+    analyze_frame(frame, current_analysis)
+    t2 = time.perf_counter()
+    writer.write(data, ts, (frame.src_addr, frame.dst_addr), frame.length)
+    t3 = time.perf_counter()
+    stage_seconds["decode"].observe(t1 - t0)
+    stage_seconds["analyze"].observe(t2 - t1)
+    stage_seconds["pcap_write"].observe(t3 - t2)
+    return frame
+
+def dispatch_captured_packets():
+    """Pipeline mode: write PCAPs here and shard decoding/analysis over worker processes
+
+    Each closed file becomes an epoch; its report is written once every worker has
+    sent its share of the analysis.
+    """
+    global pipeline
+    from .utils.pipeline import ShardedPipeline
+    pipeline = ShardedPipeline(
+        ANALYSIS_WORKERS,
+        on_events=record_events,
+        on_epoch=finish_capture_file,
+        ring_bytes=PIPELINE_RING_BYTES,
+        inventory_path=ASSET_INVENTORY,
+        flow_capacity=FLOW_TABLE_CAPACITY,
+        flow_idle_timeout=FLOW_IDLE_TIMEOUT,
+        baseline_interval=BASELINE_INTERVAL,
+        baseline_learning=BASELINE_LEARNING_SECONDS,
+        baseline_max_keys=BASELINE_MAX_KEYS,
+        event_rate=PIPELINE_EVENT_RATE,
+        epoch_timeout=PIPELINE_EPOCH_TIMEOUT
+    )
+    pipeline.start()
+    print(f"Analysis pipeline started with {ANALYSIS_WORKERS} worker processes")
+    writer = new_capture_writer(pipeline.mark_epoch)
+
+    while True:
+        batch, stopped = next_capture_batch()
+        try:
+            started = time.perf_counter()
+            writer.maybe_rotate()
+            flows = [peek_flow(data) for data, _ in batch]
+            for (data, ts), flow in zip(batch, flows):
+                writer.write(data, ts, flow[:2] if flow is not None else ())
+            count_sources(flows)
+            dropped = pipeline.submit(batch, flows)
+            capture_stats["captured_packets"] += len(batch) - dropped
+            capture_stats["dropped_packets"] += dropped
+            if batch:
+                stage_seconds["dispatch"].observe((time.perf_counter() - started) / len(batch))
+        except Exception as e:
+            print(f"Packet dispatch error: {e}")
+
+        if stopped:
+            writer.rotate()
+
+def finish_capture_file(closed, analysis=None):
+    """Write the report for a PCAP file the writer has just closed
+
+    analysis is passed in pipeline mode (merged from the workers); otherwise the
+    live analysis is swapped out for a fresh one.
+    """
+    global current_analysis, last_file_analysis
+    from .utils.analysis import new_analysis, generate_security_recommendations, generate_report, REPORT_SUFFIXES
+    if analysis is None:
+        analysis = current_analysis
+        current_analysis = new_analysis(datetime.now().strftime("%Y%m%d_%H%M%S"), rule_engine, flow_table, baseline,
+                                        asset_inventory)
+    last_file_analysis = analysis
+
+    pcap_file = closed["pcap_file"]
+    timestamp = os.path.basename(pcap_file)[len("capture_"):-len(".pcap")]
+    analysis["timestamp"] = timestamp
+    report_file = os.path.join(REPORTS_DIR, f"report_{timestamp}{REPORT_SUFFIXES[REPORT_ENCODING]}")
 
-@app.route('/api/files')
+    capture_stats["files_written"] += 1
+    print(f"PCAP saved: {pcap_file} ({closed['packet_count']} packets)")
+
+    catalog.add_capture(pcap_file, closed["packet_count"], closed["first_ts"], closed["last_ts"], closed["size"])
+    started = time.perf_counter()
+    generate_security_recommendations(analysis)
+    report_data = generate_report(analysis, pcap_file, report_file, REPORT_ENCODING, asset_inventory)
+    stage_seconds["report"].observe(time.perf_counter() - started)
+    catalog.add_report(report_file, report_data)
+    notify('catalog_updated', {
+        "pcap_file": os.path.basename(pcap_file),
+        "report_file": os.path.basename(report_file)
+    })
+
+@routes.route('/api/files')
 def list_files():
+    """Paginated capture/report listing served from the catalog
+
+    Query params: kind (pcap|report), page, per_page, since/until (epoch or ISO),
+    and for reports risk, host and threat; detail=1 adds the indexed metadata.
+    """
     try:
-        pcap_files = [f for f in os.listdir(CAPTURE_DIR) if f.endswith('.pcap')]
-        report_files = [f for f in os.listdir(REPORTS_DIR) if f.endswith('.json')]
-        return jsonify({
-            "pcap_files": sorted(pcap_files, reverse=True),
-            "report_files": sorted(report_files, reverse=True)
-        })
+        kind = request.args.get('kind')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', FILES_PAGE_SIZE, type=int), 1), FILES_MAX_PAGE_SIZE)
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+        detail = request.args.get('detail') == '1'
+
+        result = {}
+        if kind in (None, 'pcap'):
+            captures = catalog.list_captures(page, per_page, since, until)
+            result["pcap_files"] = [item["name"] for item in captures["items"]]
+            result["pcap_total"] = captures["total"]
+            if detail:
+                result["pcap_details"] = captures["items"]
+        if kind in (None, 'report'):
+            reports = catalog.list_reports(
+                page, per_page, since, until,
+                risk=request.args.get('risk'),
+                host=request.args.get('host'),
+                threat_type=request.args.get('threat')
+            )
+            result["report_files"] = [item["name"] for item in reports["items"]]
+            result["report_total"] = reports["total"]
+            if detail:
+                result["report_details"] = reports["items"]
+        result["page"] = page
+        result["per_page"] = per_page
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
     except Exception as e:
         print(f"Error listing files: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/download/<path:filename>')
+@routes.route('/api/download/<path:filename>')
 def download_file(filename):
     try:
-        if filename.endswith('.pcap'):
+        if filename.endswith(('.pcap', '.pcap' + COMPRESSED_SUFFIX)):
             file_path = os.path.join(CAPTURE_DIR, filename)
-        elif filename.endswith('.json'):
+        elif filename.endswith(('.json', '.json.gz')):
             file_path = os.path.join(REPORTS_DIR, filename)
         else:
             return jsonify({"error": "Invalid file type"}), 400
 
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
-        return jsonify({"error": "File not found"}), 404
+        if not os.path.exists(file_path) and not (filename.endswith('.pcap') and
+                                                   os.path.exists(file_path + COMPRESSED_SUFFIX)):
+            return jsonify({"error": "File not found"}), 404
+        try:
+            # Held until the response is sent, so retention can't compress or delete the file meanwhile
+            lock = lock_shared(file_path)
+        except FileNotFoundError:
+            return jsonify({"error": "File not found"}), 404
+        if lock.name != file_path:
+            # Archived by retention: serve the original bytes, decompressed on the fly
+            return Response(
+                stream_decompressed(lock),
+                mimetype='application/vnd.tcpdump.pcap',
+                headers={"Content-Disposition": f"attachment; filename={os.path.basename(filename)}"}
+            )
+        try:
+            # conditional enables Range requests, so large captures can be fetched in parts or resumed
+            response = send_file(file_path, as_attachment=True, conditional=True)
+        except Exception:
+            lock.close()
+            raise
+        # Passthrough bodies are handed to the server without the response's close(), which releases the lock
+        response.direct_passthrough = False
+        response.call_on_close(lock.close)
+        return response
     except Exception as e:
         print(f"Download error: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/events')
+def stream_decompressed(lock):
+    """Stream a compressed capture's original bytes, releasing its read lock when done"""
+    try:
+        with open_pcap(lock.name) as fh:
+            while True:
+                data = fh.read(DOWNLOAD_CHUNK_BYTES)
+                if not data:
+                    return
+                yield data
+    finally:
+        lock.close()
+
+@routes.route('/api/storage')
+@daemon_route
+def get_storage():
+    """Retention settings, stored bytes and what the last housekeeping pass did"""
+    if retention is None:
+        return jsonify({"error": "Retention has not started yet"}), 503
+    return jsonify(retention.status())
+
+@routes.route('/api/assets')
+@daemon_route
+def get_assets():
+    """Inventory summary (zones, asset count, lookup cache), or with ?ip= that address's asset and zone"""
+    from .utils.assets import parse_addr
+    load_analysis()
+    if asset_inventory is None:
+        return jsonify({"error": f"No asset inventory at {ASSET_INVENTORY}"}), 404
+    ip = request.args.get('ip')
+    if ip is None:
+        return jsonify(asset_inventory.summary())
+    addr = parse_addr(ip)
+    if addr is None:
+        return jsonify({"error": f"Invalid IPv4 address: {ip}"}), 400
+    asset, zone = asset_inventory.lookup(addr)
+    return jsonify({
+        "ip": ip,
+        "asset": asset.to_dict() if asset is not None else None,
+        "zone": zone.to_dict()
+    })
+
+@routes.route('/api/extract')
+def extract_capture():
+    """Stream one PCAP with the stored packets in a time window: ?start=&end=&ip=&port=
+
+    start/end accept epoch seconds or ISO times; the window must be bounded.
+    """
+    try:
+        start_ts = parse_time(request.args.get('start'))
+        end_ts = parse_time(request.args.get('end'))
+        ip = request.args.get('ip') or None
+        port = request.args.get('port', type=int)
+        if start_ts is None or end_ts is None or end_ts < start_ts:
+            return jsonify({"error": "start and end are required and end must not precede start"}), 400
+        if ip:
+            ipaddress.IPv4Address(ip)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    pcap_files = [f for f in catalog.capture_paths(start_ts, end_ts) if os.path.exists(f)]
+    if not pcap_files:
+        return jsonify({"error": "No stored captures overlap that time range"}), 404
+
+    filename = f"extract_{datetime.fromtimestamp(start_ts).strftime('%Y%m%d_%H%M%S')}.pcap"
+    return Response(
+        extract_pcap(pcap_files, start_ts, end_ts, ip, port),
+        mimetype='application/vnd.tcpdump.pcap',
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@routes.route('/api/analyze', methods=['POST'])
+@daemon_route
+def start_reanalysis():
+    """Re-analyze stored captures in the background: {"files": [...], "combined": false, "overwrite": false}"""
+    body = request.get_json(silent=True) or {}
+    try:
+        pcap_files = []
+        for filename in body.get("files") or []:
+            file_path = resolve_capture(os.path.join(CAPTURE_DIR, os.path.basename(filename)))
+            if not file_path.endswith(('.pcap', '.pcap' + COMPRESSED_SUFFIX)) or not os.path.exists(file_path):
+                return jsonify({"error": f"Capture not found: {filename}"}), 404
+            pcap_files.append(file_path)
+        combined = bool(body.get("combined", False))
+        overwrite = bool(body.get("overwrite", False))
+
+        job_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        job = analysis_jobs[job_id] = {"status": "running", "started": time.time(), "reports": []}
+
+        def run():
+            try:
+                reports = load_pcap_manager().reanalyze(pcap_files or None, combined=combined, overwrite=overwrite)
+                job["reports"] = [os.path.basename(r) for r in reports]
+                job["status"] = "finished"
+                notify('catalog_updated', {"report_files": job["reports"]})
+            except Exception as e:
+                print(f"Re-analysis error: {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            job["elapsed"] = round(time.time() - job["started"], 2)
+
+        threading.Thread(target=run, daemon=True).start()
+        return jsonify({"job_id": job_id, "status": "running"}), 202
+    except Exception as e:
+        print(f"Re-analysis error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@routes.route('/api/analyze/<job_id>')
+@daemon_route
+def reanalysis_status(job_id):
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+@routes.route('/api/events')
 def get_events():
-    return jsonify(events)
+    """Page through stored events: ?since_id=&limit=&severity=High,Medium&ip="""
+    try:
+        since_id = max(0, request.args.get('since_id', 0, type=int))
+        limit = min(max(1, request.args.get('limit', 100, type=int)), EVENTS_PAGE_LIMIT)
+        severity = request.args.get('severity')
+        severities = set(severity.split(',')) if severity else None
+        ip = request.args.get('ip') or None
+
+        store = shared_state if role == "web" else event_store
+        records, cursor = store.query(since_id, limit, severities, ip)
+        last_id = store.last_id
+    except Exception as e:
+        print(f"Error querying events: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        yield '{"events": ['
+        for i, record in enumerate(records):
+            yield (',' if i else '') + json.dumps(record.to_dict())
+        yield f'], "next_since_id": {cursor}, "last_id": {last_id}}}'
+
+    return Response(generate(), mimetype='application/json')
 
-@app.route('/api/control/shutdown', methods=['POST'])
+@routes.route('/api/control/shutdown', methods=['POST'])
+@daemon_route
 def shutdown_server():
-    global scanning_active, simulation_active
+    """Stop monitoring, then the server itself where the Werkzeug dev server offers a hook for it
+
+    Web workers relay this to the daemon, which owns capture; the request the daemon
+    replays has no server hook, so under gunicorn only monitoring is stopped.
+    """
+    global scanning_active
     scanning_active = False
-    simulation_active = False
+    stop_load_generator()
     
-    socketio.emit('scanning_status', {
+    notify('scanning_status', {
         "scanning": False,
         "status": "stopped"
     })
     
     func = request.environ.get('werkzeug.server.shutdown')
     if func is None:
-        raise RuntimeError('Not running with Werkzeug server')
+        return jsonify({
+            "scanning": False,
+            "status": "stopped",
+            "error": "Monitoring stopped, but this server cannot be shut down over HTTP"
+        }), 501
     func()
     return jsonify({"status": "Server shutting down..."})
 
-@socketio.on('connect')
 def handle_connect():
     print("Client connected")
+    scanning = scanning_active
+    if role == "web":
+        scanning = (shared_state.get("stats") or {}).get("scanning", False)
     socketio.emit('scanning_status', {
-        "scanning": scanning_active,
-        "status": "running" if scanning_active else "stopped"
+        "scanning": scanning,
+        "status": "running" if scanning else "stopped"
     })
 
-@socketio.on('client_ready')
 def handle_client_ready():
     print("Client ready")
 
+def handle_subscribe(filters=None):
+    """Move the client into the room for its severity/protocol/IP filters"""
+    previous = broadcaster.unsubscribe(request.sid)
+    if previous:
+        leave_room(previous)
+    room = broadcaster.subscribe(request.sid, filters)
+    join_room(room)
+    return {"room": room}
+
+def handle_disconnect():
+    broadcaster.unsubscribe(request.sid)
+
 if __name__ == '__main__':
+    create_app()
     threads = start_threads()
     socketio.run(app, 
                  debug=False,  # Disable debug mode for production
                  host='127.0.0.1',  # Only listen on localhost
                  port=5000,
                  allow_unsafe_werkzeug=True)  # Required for SocketIO
-
-
-def analyze_modbus_packet(packet, analysis):
-    """Analyze Modbus packet details"""
-    try:
-        if TCP in packet and packet.haslayer('Raw'):
-            # Extract Modbus function code
-            data = bytes(packet['Raw'])
-            if len(data) > 7:  # Minimum Modbus packet length
-                function_code = data[7]
-                analysis['modbus_stats']['function_codes'][function_code] = \
-                    analysis['modbus_stats']['function_codes'].get(function_code, 0) + 1
-                
-                # Extract unit ID
-                unit_id = data[6]
-                analysis['modbus_stats']['unit_ids'].add(unit_id)
-    except Exception as e:
-        print(f"Error analyzing Modbus packet: {e}")
-
-def analyze_ip_packet(packet, analysis):
-    """Analyze IP packet details"""
-    try:
-        if 'IP' in packet:
-            # Add source and destination IPs
-            analysis['source_ips'].add(packet['IP'].src)
-            analysis['dest_ips'].add(packet['IP'].dst)
-            
-            # Add protocol information
-            proto = packet['IP'].proto
-            proto_name = {1: 'ICMP', 6: 'TCP', 17: 'UDP'}.get(proto, str(proto))
-            analysis['protocols'][proto_name] = analysis['protocols'].get(proto_name, 0) + 1
-            
-            # Basic latency calculation for TCP packets
-            if TCP in packet:
-                analysis['network_health']['latency'][packet['IP'].src] = 0  # Placeholder for actual latency
-    except Exception as e:
-        print(f"Error analyzing IP packet: {e}")
-
-def generate_security_recommendations(analysis):
-    """Generate security recommendations based on packet analysis."""
-    if analysis["modbus_stats"]["total_modbus_packets"] > 0:
-        analysis["security_analysis"]["recommendations"].append(
-            "Implement Modbus TCP whitelist for known devices"
-        )
-    
-    if len(analysis["source_ips"]) > 100:
-        analysis["security_analysis"]["recommendations"].append(
-            "Implement rate limiting to prevent potential DoS attacks"
-        )
-        analysis["security_analysis"]["risk_level"] = "High"
-    
-    if analysis["modbus_stats"]["total_modbus_packets"] > 1000:
-        analysis["security_analysis"]["recommendations"].append(
-            "Monitor for potential Modbus flooding attacks"
-        )
-
-    try:
-        # Evaluate risk level
-        threat_count = len(analysis['security_analysis']['detected_threats'])
-        if threat_count > 5:
-            analysis['security_analysis']['risk_level'] = "Critical"
-        elif threat_count > 2:
-            analysis['security_analysis']['risk_level'] = "High"
-        elif threat_count > 0:
-            analysis['security_analysis']['risk_level'] = "Medium"
-        
-        # Generate recommendations
-        recommendations = []
-        
-        # Check for basic security issues
-        if analysis['modbus_stats']['total_modbus_packets'] > 0:
-            recommendations.append({
-                "priority": "High",
-                "issue": "Modbus traffic detected",
-                "solution": "Implement Modbus security controls and monitoring"
-            })
-        
-        if len(analysis['source_ips']) > 50:
-            recommendations.append({
-                "priority": "High",
-                "issue": "High number of unique source IPs",
-                "solution": "Implement network segmentation and access controls"
-            })
-        
-        analysis['security_analysis']['recommendations'] = recommendations
-    except Exception as e:
-        print(f"Error generating security recommendations: {e}")
\ No newline at end of file
@@ -1,4 +1,7 @@
-const socket = io();
+// WebSocket only: a long-polling session would need every request to reach the same web worker
+const socket = io({transports: ['websocket']});
+const CHART_POINTS = 120;  // Seconds of history on the live chart
+const CHART_SEVERITIES = ['High', 'Medium', 'Low'];
 const ctx = document.getElementById('eventChart').getContext('2d');
 
 const chart = new Chart(ctx, {
@@ -37,21 +40,36 @@ const chart = new Chart(ctx, {
     }
 });
 
+// Subscription filters for this dashboard, e.g. {severity: ['High'], protocol: ['Modbus TCP'], ip: '10.0.0.5'}
+let eventFilters = {};
+
 // Remove duplicate event listeners and consolidate socket handling
 socket.on('connect', () => {
     console.log('Connected to server');
     socket.emit('client_ready');
+    socket.emit('subscribe', eventFilters);
 });
 
+function setEventFilters(filters) {
+    eventFilters = filters || {};
+    socket.emit('subscribe', eventFilters);
+}
+
 socket.on('disconnect', () => {
     console.log('Disconnected from server');
 });
 
-socket.on('new_event', function(event) {
-    console.log('Received event:', event);
-    updateChart(event);
-    addEventToTable(event);
-    updateStats();
+socket.on('new_events', function(batch) {
+    addEventsToTable(batch.events || []);
+    if (batch.dropped) {
+        console.warn('Events summarized by server:', batch.dropped);
+    }
+});
+
+// Server-side rollups: one pushed delta per second replaces client-side counting and polling
+socket.on('stats_tick', function(tick) {
+    addChartPoint(tick.ts, tick.counts);
+    showStats(tick);
 });
 
 // Remove duplicate updateFileList function and keep only one version
@@ -66,49 +84,61 @@ function updateFileList() {
         .catch(error => console.error('File list update error:', error));
 }
 
-// Initialize with shorter intervals
+// Initial load; after this the server pushes catalog_updated and stats_tick
 updateFileList();
 updateStats();
-setInterval(updateFileList, 5000);  // Check files every 5 seconds
-setInterval(updateStats, 5000);     // Update stats every 5 seconds
-// Update chart update function
-function updateChart(event) {
-    if (!event) return;
-    
-    const now = new Date().toLocaleTimeString();
-    chart.data.labels.push(now);
+loadTimeseries();
+socket.on('catalog_updated', updateFileList);  // Server announces new captures/reports
 
-    const dataPoint = {
-        high: event.severity === 'High' ? 1 : 0,
-        medium: event.severity === 'Medium' ? 1 : 0,
-        low: event.severity === 'Low' ? 1 : 0
-    };
+// Seed the chart with the server's per-second buckets
+function loadTimeseries() {
+    fetch(`/api/timeseries?resolution=1s&range=${CHART_POINTS}`)
+        .then(response => response.json())
+        .then(data => {
+            chart.data.labels = data.timestamps.map(ts => new Date(ts * 1000).toLocaleTimeString());
+            CHART_SEVERITIES.forEach((severity, i) => {
+                chart.data.datasets[i].data = data.series[severity];
+            });
+            chart.update('none');
+        })
+        .catch(error => console.error('Timeseries load error:', error));
+}
 
-    chart.data.datasets[0].data.push(dataPoint.high);
-    chart.data.datasets[1].data.push(dataPoint.medium);
-    chart.data.datasets[2].data.push(dataPoint.low);
+function addChartPoint(ts, counts) {
+    chart.data.labels.push(new Date(ts * 1000).toLocaleTimeString());
+    CHART_SEVERITIES.forEach((severity, i) => {
+        chart.data.datasets[i].data.push(counts[severity] || 0);
+    });
 
-    if (chart.data.labels.length > 30) {
+    if (chart.data.labels.length > CHART_POINTS) {
         chart.data.labels.shift();
         chart.data.datasets.forEach(dataset => dataset.data.shift());
     }
 
     chart.update('none');
 }
-function addEventToTable(event) {
+function endpointLabel(ip, asset, zone) {
+    // Events carry asset and zone only when an asset inventory is loaded
+    if (!zone) return ip;
+    return `${ip} (${asset || 'unknown'}, ${zone})`;
+}
+function addEventsToTable(events) {
     const table = document.getElementById('events-table');
-    const row = table.insertRow(0);
-    
-    row.className = event.severity === 'High' ? 'table-danger' : 
-                    event.severity === 'Medium' ? 'table-warning' : 'table-success';
-    
-    row.insertCell(0).textContent = event.timestamp;
-    row.insertCell(1).textContent = event.source_ip;
-    row.insertCell(2).textContent = event.target_ip;
-    row.insertCell(3).textContent = event.protocol;
-    row.insertCell(4).textContent = event.severity;
+    // Only the newest 100 rows are ever shown, so skip building the rest
+    events.slice(-100).forEach(event => {
+        const row = table.insertRow(0);
+        
+        row.className = event.severity === 'High' ? 'table-danger' : 
+                        event.severity === 'Medium' ? 'table-warning' : 'table-success';
+        
+        row.insertCell(0).textContent = event.timestamp;
+        row.insertCell(1).textContent = endpointLabel(event.source_ip, event.source_asset, event.source_zone);
+        row.insertCell(2).textContent = endpointLabel(event.target_ip, event.target_asset, event.target_zone);
+        row.insertCell(3).textContent = event.protocol;
+        row.insertCell(4).textContent = event.severity;
+    });
 
-    if (table.rows.length > 100) {
+    while (table.rows.length > 100) {
         table.deleteRow(-1);
     }
 }
@@ -147,17 +177,16 @@ function downloadSelected(type) {
     window.location.href = `/api/download/${filename}`;
 }
 
-// Add to initialization
-updateFileList();
-setInterval(updateFileList, 30000);
 function updateStats() {
     fetch('/api/stats')
         .then(response => response.json())
-        .then(data => {
-            document.getElementById('total-events').textContent = data.total_events;
-            document.getElementById('high-severity').textContent = data.high_severity;
-            document.getElementById('unique-sources').textContent = data.unique_sources;
-        });
+        .then(showStats);
+}
+
+function showStats(data) {
+    document.getElementById('total-events').textContent = data.total_events;
+    document.getElementById('high-severity').textContent = data.high_severity;
+    document.getElementById('unique-sources').textContent = data.unique_sources;
 }
 
 document.getElementById('toggleScan').addEventListener('click', function() {
@@ -177,6 +206,3 @@ document.getElementById('toggleScan').addEventListener('click', function() {
         setTimeout(() => button.disabled = false, 1000);
     });
 });
-
-updateStats();
-setInterval(updateStats, 30000);
\ No newline at end of file
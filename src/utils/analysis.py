@@ -0,0 +1,390 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from .decoder import decode_packet, MODBUS_PORT, MODBUS_WRITES
+from .sketches import HyperLogLog, SpaceSaving
+from .rules import RuleEngine, ThreatAggregator, default_rules
+from .flows import FlowTable, NetworkMetrics
+from .baseline import ModbusBaseline, ModbusRateAnomaly, ModbusValueAnomaly, NewModbusOperation
+from .metrics import stage_histogram
+from .pcap_index import HostSet
+from .event_store import format_ts
+
+RULE_TIMING_SAMPLE = 16  # Time rule evaluation on one frame in this many
+_rule_seconds = stage_histogram("rules")
+
+REPORT_TOP_TALKERS = 20
+REPORT_HOST_LIMIT = 1024  # Hosts listed exactly in a report; beyond this the report carries a Bloom filter
+# 2.0: network_statistics lists the top_sources/top_destinations (heaviest REPORT_TOP_TALKERS hosts)
+# where 1.0 had unique_sources/unique_destinations, and every host seen under hosts (HostSet.to_dict)
+ANALYSIS_VERSION = "2.0"
+
+RISK_SEVERITIES = ("Low", "Medium", "High")  # Event severity for each DecodedFrame.risk
+BASELINE_THREATS = (ModbusRateAnomaly.threat_type, ModbusValueAnomaly.threat_type, NewModbusOperation.threat_type)
+
+# Report file encodings and the file suffix each one uses
+REPORT_SUFFIXES = {
+    "indent": ".json",      # Human-readable, the original format
+    "compact": ".json",     # No whitespace: roughly a third smaller
+    "gzip": ".json.gz"      # Compact JSON, gzip-compressed
+}
+
+
+def write_report(report_data, report_file, encoding="indent"):
+    """Write report_data atomically in the given encoding"""
+    if encoding not in REPORT_SUFFIXES:
+        raise ValueError(f"Unknown report encoding {encoding!r}")
+    tmp_file = report_file + ".tmp"
+    if encoding == "indent":
+        with open(tmp_file, 'w') as f:
+            json.dump(report_data, f, indent=4)
+    else:
+        text = json.dumps(report_data, separators=(',', ':'))
+        opener = gzip.open if encoding == "gzip" else open
+        with opener(tmp_file, 'wt') as f:
+            f.write(text)
+    os.replace(tmp_file, report_file)
+
+
+def load_report(report_file):
+    """Read a report written in any of the REPORT_SUFFIXES encodings"""
+    opener = gzip.open if report_file.endswith('.gz') else open
+    with opener(report_file, 'rt') as f:
+        return json.load(f)
+
+
+def new_analysis(timestamp, rule_engine=None, flow_table=None, baseline=None, inventory=None):
+    """Create an empty analysis structure for one capture
+
+    Pass a shared rule_engine/flow_table/baseline to keep detection, connection and
+    learned behaviour state (rates, windows, open Modbus transactions) across
+    consecutive captures. With an asset inventory, frames are annotated with their
+    assets and zones before the rules run.
+    """
+    return {
+        "total_packets": 0,
+        "first_ts": None,
+        "last_ts": None,
+        "protocols": {},
+        # Distinct-count sketches stand in for sets so scans and floods can't exhaust memory
+        "source_ips": HyperLogLog(),
+        "dest_ips": HyperLogLog(),
+        "top_sources": SpaceSaving(),
+        "top_destinations": SpaceSaving(),
+        "hosts": HostSet(REPORT_HOST_LIMIT),  # Every host, for the catalog's host search
+        "timestamp": timestamp,
+        "modbus_stats": {
+            "total_modbus_packets": 0,
+            "function_codes": {},
+            "unit_ids": set(),
+            "exception_codes": {},
+            "write_requests": 0
+        },
+        "security_analysis": {
+            "potential_threats": [],
+            "recommendations": [],
+            "risk_level": "Low",
+            "detected_threats": ThreatAggregator()
+        },
+        "network_health": NetworkMetrics(),
+        "rule_engine": rule_engine if rule_engine is not None else RuleEngine(default_rules(inventory=inventory)),
+        "flow_table": flow_table if flow_table is not None else FlowTable(),
+        "baseline": baseline if baseline is not None else ModbusBaseline(),
+        "inventory": inventory
+    }
+
+def analyze_packets(packets, timestamp):
+    analysis = new_analysis(timestamp)
+    
+    for packet in packets:
+        analyze_frame(decode_packet(packet), analysis)
+    
+    generate_security_recommendations(analysis)  # This function is missing
+    return analysis
+
+def analyze_single_packet(packet, analysis):
+    """Analyze a scapy packet by way of the raw-bytes decoder"""
+    analyze_frame(decode_packet(packet), analysis)
+
+def analyze_frame(frame, analysis):
+    analysis["total_packets"] += 1
+    if analysis["first_ts"] is None:
+        analysis["first_ts"] = frame.ts
+    analysis["last_ts"] = frame.ts
+    if frame.is_modbus:
+        analysis["modbus_stats"]["total_modbus_packets"] += 1
+        analyze_modbus_packet(frame, analysis)
+    
+    if frame.is_ip:
+        if analysis["inventory"] is not None:
+            analysis["inventory"].annotate(frame)
+        analyze_ip_packet(frame, analysis)
+        if analysis["total_packets"] % RULE_TIMING_SAMPLE:
+            analysis["rule_engine"].evaluate(frame, analysis["security_analysis"]["detected_threats"])
+        else:
+            started = time.perf_counter()
+            analysis["rule_engine"].evaluate(frame, analysis["security_analysis"]["detected_threats"])
+            _rule_seconds.observe(time.perf_counter() - started)
+        if frame.is_tcp:
+            analysis["flow_table"].update(frame, analysis["network_health"])
+            # After the flow table, which gives read responses their request's address
+            if frame.modbus_fc is not None and analysis["baseline"].observe(frame):
+                score_frames(analysis)
+
+def score_frames(analysis):
+    """Score the Modbus frames analyzed since the last call against their baselines
+
+    Raises each anomalous frame's risk, so call it before building events for them.
+    analyze_frame also calls it whenever a full batch is waiting.
+    """
+    return analysis["baseline"].flush(analysis["security_analysis"]["detected_threats"])
+
+def frame_event(frame):
+    """Live dashboard event for a decoded frame, or None for frames without addresses"""
+    if frame.src is None:
+        return None
+
+    is_modbus = frame.is_modbus
+    modbus_info = None
+    if is_modbus:
+        modbus_info = {
+            "function_code": frame.modbus_fc if frame.modbus_fc is not None else "Unknown",
+            "unit_id": frame.modbus_unit if frame.modbus_unit is not None else "Unknown",
+            "data_length": frame.payload_len
+        }
+
+    event = {
+        "ts": frame.ts,
+        "timestamp": format_ts(frame.ts),
+        "source_ip": frame.src,
+        "target_ip": frame.dst if frame.dst is not None else 'Unknown',
+        "protocol": "Modbus TCP" if is_modbus else frame.protocol_name,
+        "severity": RISK_SEVERITIES[frame.risk],
+        "packet_info": frame.summary(),
+        "modbus_details": modbus_info
+    }
+    if frame.src_zone is not None:
+        event["source_asset"] = frame.src_asset.name if frame.src_asset is not None else None
+        event["source_zone"] = frame.src_zone.name
+        event["target_asset"] = frame.dst_asset.name if frame.dst_asset is not None else None
+        event["target_zone"] = frame.dst_zone.name
+    return event
+
+def merge_analysis(target, partial):
+    """Fold a partial analysis (e.g. one chunk of a PCAP) into target"""
+    target["total_packets"] += partial["total_packets"]
+    target["chunks"] = target.get("chunks", 0) + partial.get("chunks", 0)
+    if partial["first_ts"] is not None:
+        target["first_ts"] = partial["first_ts"] if target["first_ts"] is None else min(target["first_ts"], partial["first_ts"])
+        target["last_ts"] = partial["last_ts"] if target["last_ts"] is None else max(target["last_ts"], partial["last_ts"])
+    for proto, count in partial["protocols"].items():
+        target["protocols"][proto] = target["protocols"].get(proto, 0) + count
+    target["source_ips"].update(partial["source_ips"])
+    target["dest_ips"].update(partial["dest_ips"])
+    target["top_sources"].update(partial["top_sources"])
+    target["top_destinations"].update(partial["top_destinations"])
+    target["hosts"].update(partial["hosts"])
+
+    modbus = target["modbus_stats"]
+    modbus["total_modbus_packets"] += partial["modbus_stats"]["total_modbus_packets"]
+    for code, count in partial["modbus_stats"]["function_codes"].items():
+        modbus["function_codes"][code] = modbus["function_codes"].get(code, 0) + count
+    modbus["unit_ids"].update(partial["modbus_stats"]["unit_ids"])
+    for code, count in partial["modbus_stats"]["exception_codes"].items():
+        modbus["exception_codes"][code] = modbus["exception_codes"].get(code, 0) + count
+    modbus["write_requests"] += partial["modbus_stats"]["write_requests"]
+
+    target["security_analysis"]["detected_threats"].merge(
+        partial["security_analysis"]["detected_threats"]
+    )
+    target["network_health"].merge(partial["network_health"])
+    return target
+
+def generate_report(analysis, pcap_file, report_file, encoding="indent", inventory=None):
+    # Ensure we keep the extension the encoding expects
+    if not report_file.endswith(REPORT_SUFFIXES[encoding]):
+        report_file = report_file + REPORT_SUFFIXES[encoding]
+    
+    health = analysis['network_health'].summary()
+    threats = analysis['security_analysis']['detected_threats'].to_list()
+    if inventory is not None:
+        for threat in threats:
+            inventory.annotate_threat(threat)
+    average_response = health['overall_latency'].get('mean_ms')
+
+    report_data = {
+        "report_metadata": {
+            "capture_time": analysis['timestamp'],
+            "pcap_file": pcap_file,
+            "report_generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "analysis_version": ANALYSIS_VERSION,
+            "first_packet_ts": analysis['first_ts'],
+            "last_packet_ts": analysis['last_ts'],
+            "analysis_chunks": analysis.get('chunks') or 1,
+            "missing_shards": analysis.get('missing_shards', [])
+        },
+        "network_statistics": {
+            "total_packets": analysis['total_packets'],
+            "protocol_distribution": analysis['protocols'],
+            "top_sources": [ip for ip, _ in analysis['top_sources'].top(REPORT_TOP_TALKERS)],
+            "top_destinations": [ip for ip, _ in analysis['top_destinations'].top(REPORT_TOP_TALKERS)],
+            "unique_source_count": len(analysis['source_ips']),
+            "unique_destination_count": len(analysis['dest_ips']),
+            "hosts": analysis['hosts'].to_dict(),
+            "top_talkers": [
+                {"ip": ip, "packets": count}
+                for ip, count in analysis['top_sources'].top(REPORT_TOP_TALKERS)
+            ]
+        },
+        "modbus_analysis": {
+            "total_modbus_packets": analysis['modbus_stats']['total_modbus_packets'],
+            "function_codes": analysis['modbus_stats']['function_codes'],
+            "unit_ids": list(analysis['modbus_stats']['unit_ids']),
+            "exception_codes": analysis['modbus_stats']['exception_codes'],
+            "write_requests": analysis['modbus_stats']['write_requests'],
+            "suspicious_operations": [
+                {"type": threat['type'], "client": threat['source'], "operation": threat['target'],
+                 "count": threat['count']}
+                for threat in threats
+                if threat['type'] in BASELINE_THREATS
+            ],
+            "baseline": analysis['baseline'].summary() if 'baseline' in analysis else None
+        },
+        "security_analysis": {
+            "risk_level": analysis['security_analysis']['risk_level'],
+            "detected_threats": [
+                {
+                    "type": threat['type'],
+                    "severity": threat['severity'],
+                    "source": threat['source'],
+                    "target": threat['target'],
+                    "timestamp": threat['timestamp'],
+                    "count": threat['count'],
+                    "first_seen": threat['first_seen'],
+                    "last_seen": threat['last_seen'],
+                    "details": threat['details'],
+                    "recommended_solution": threat['solution'],
+                    "mitigation_steps": threat.get('mitigation_steps', []),
+                    "source_asset": threat.get('source_asset'),
+                    "source_zone": threat.get('source_zone'),
+                    "target_asset": threat.get('target_asset'),
+                    "target_zone": threat.get('target_zone')
+                }
+                for threat in threats
+            ],
+            "suppressed_threats": analysis['security_analysis']['detected_threats'].suppressed,
+            "recommendations": analysis['security_analysis']['recommendations']
+        },
+        "network_health": {
+            "latency_stats": health['latency'],
+            "packet_loss_rate": health['packet_loss'],
+            "bandwidth_status": "Normal",
+            "retransmission_rate": health['retransmission_rate'],
+            "exception_response_rate": health['exception_rate'],
+            "performance_metrics": {
+                "average_response_time": f"{average_response} ms" if average_response is not None else "N/A",
+                "response_time_percentiles": health['overall_latency'],
+                "packet_error_rate": health['retransmission_rate'],
+                "network_utilization": f"{health['throughput_bps']} bit/s" if health['throughput_bps'] is not None else "N/A"
+            }
+        }
+    }
+    
+    write_report(report_data, report_file, encoding)
+    
+    print(f"Analysis report saved: {report_file}")
+    return report_data
+
+def analyze_modbus_packet(frame, analysis):
+    """Analyze Modbus packet details"""
+    try:
+        if frame.modbus_fc is not None:
+            function_code = frame.modbus_fc
+            analysis['modbus_stats']['function_codes'][function_code] = \
+                analysis['modbus_stats']['function_codes'].get(function_code, 0) + 1
+            
+            analysis['modbus_stats']['unit_ids'].add(frame.modbus_unit)
+            if frame.modbus_exc is not None:
+                analysis['modbus_stats']['exception_codes'][frame.modbus_exc] = \
+                    analysis['modbus_stats']['exception_codes'].get(frame.modbus_exc, 0) + 1
+            elif function_code in MODBUS_WRITES and frame.dport == MODBUS_PORT:
+                analysis['modbus_stats']['write_requests'] += 1
+    except Exception as e:
+        print(f"Error analyzing Modbus packet: {e}")
+
+def analyze_ip_packet(frame, analysis):
+    """Analyze IP packet details"""
+    try:
+        if frame.is_ip:
+            # Add source and destination IPs
+            analysis['source_ips'].add(frame.src)
+            analysis['dest_ips'].add(frame.dst)
+            analysis['top_sources'].add(frame.src)
+            analysis['top_destinations'].add(frame.dst)
+            hosts = analysis['hosts']
+            known = hosts.exact  # Most frames are between known hosts: skip the method call
+            if frame.src_addr not in known:
+                hosts.add(frame.src_addr)
+            if frame.dst_addr not in known:
+                hosts.add(frame.dst_addr)
+            
+            # Add protocol information
+            proto_name = frame.protocol_name
+            analysis['protocols'][proto_name] = analysis['protocols'].get(proto_name, 0) + 1
+    except Exception as e:
+        print(f"Error analyzing IP packet: {e}")
+
+def generate_security_recommendations(analysis):
+    """Generate security recommendations based on packet analysis."""
+    if analysis["modbus_stats"]["total_modbus_packets"] > 0:
+        analysis["security_analysis"]["recommendations"].append(
+            "Implement Modbus TCP whitelist for known devices"
+        )
+    
+    if len(analysis["source_ips"]) > 100:
+        analysis["security_analysis"]["recommendations"].append(
+            "Implement rate limiting to prevent potential DoS attacks"
+        )
+        analysis["security_analysis"]["risk_level"] = "High"
+    
+    if analysis["modbus_stats"]["total_modbus_packets"] > 1000:
+        analysis["security_analysis"]["recommendations"].append(
+            "Monitor for potential Modbus flooding attacks"
+        )
+
+    try:
+        # Evaluate risk level; repeated hits are aggregated, so also weigh severity
+        threats = analysis['security_analysis']['detected_threats']
+        threat_count = len(threats)
+        severities = {threat['severity'] for threat in threats}
+        if threat_count > 5 or "Critical" in severities:
+            analysis['security_analysis']['risk_level'] = "Critical"
+        elif threat_count > 2 or "High" in severities:
+            analysis['security_analysis']['risk_level'] = "High"
+        elif threat_count > 0:
+            analysis['security_analysis']['risk_level'] = "Medium"
+        
+        # Generate recommendations
+        recommendations = []
+        
+        # Check for basic security issues
+        if analysis['modbus_stats']['total_modbus_packets'] > 0:
+            recommendations.append({
+                "priority": "High",
+                "issue": "Modbus traffic detected",
+                "solution": "Implement Modbus security controls and monitoring"
+            })
+        
+        if len(analysis['source_ips']) > 50:
+            recommendations.append({
+                "priority": "High",
+                "issue": "High number of unique source IPs",
+                "solution": "Implement network segmentation and access controls"
+            })
+        
+        analysis['security_analysis']['recommendations'] = recommendations
+    except Exception as e:
+        print(f"Error generating security recommendations: {e}")
@@ -0,0 +1,197 @@
+import functools
+import ipaddress
+import json
+import os
+import socket
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_INVENTORY = os.path.join(BASE_DIR, "config", "assets.json")
+
+EXTERNAL_ZONE = "external"  # Zone of every address outside the configured subnets
+LOOKUP_CACHE_SIZE = 65536   # Addresses whose (asset, zone) lookups are kept
+
+
+def _mask(length):
+    return 0xffffffff ^ (0xffffffff >> length)
+
+
+def parse_addr(text):
+    """32-bit address from "a.b.c.d" or "a.b.c.d:port", None for anything else"""
+    try:
+        return int.from_bytes(socket.inet_aton(text.rsplit(":", 1)[0] if text.count(":") == 1 else text), "big")
+    except (OSError, AttributeError):
+        return None
+
+
+class PrefixTable:
+    """Longest-prefix match over IPv4 networks with one hash table per prefix length
+
+    A lookup masks the address once for each prefix length in use, longest first,
+    and stops at the first hit, so its cost depends on how many distinct lengths
+    there are (at most 33) rather than on how many networks.
+    """
+
+    def __init__(self, prefixes=()):
+        self._tables = {}
+        self._levels = ()
+        for prefix, value in prefixes:
+            self.add(prefix, value)
+
+    def __len__(self):
+        return sum(len(table) for table in self._tables.values())
+
+    def add(self, prefix, value):
+        network = ipaddress.IPv4Network(prefix, strict=False)
+        length = network.prefixlen
+        if length not in self._tables:
+            self._tables[length] = {}
+            self._levels = tuple((_mask(n), self._tables[n]) for n in sorted(self._tables, reverse=True))
+        self._tables[length][int(network.network_address)] = value
+
+    def lookup(self, addr, default=None):
+        for mask, table in self._levels:
+            value = table.get(addr & mask)
+            if value is not None:
+                return value
+        return default
+
+
+class Zone:
+    """Network zone: its Purdue level and the zones it may exchange traffic with"""
+    __slots__ = ("name", "level", "subnets", "conduits", "description")
+
+    def __init__(self, name, level=None, subnets=(), conduits=(), description=""):
+        self.name = name
+        self.level = level
+        self.subnets = list(subnets)
+        self.conduits = frozenset(conduits) | {name}
+        self.description = description
+
+    def allows(self, other):
+        """Whether traffic between this zone and other is expected; a conduit listed on either side counts"""
+        return other is self or other.name in self.conduits or self.name in other.conduits
+
+    def to_dict(self):
+        return {"name": self.name, "level": self.level, "subnets": self.subnets,
+                "conduits": sorted(self.conduits - {self.name}), "description": self.description}
+
+
+class Asset:
+    """Inventoried device; peers, when given, are the only addresses or zones it should talk to"""
+    __slots__ = ("ip", "name", "role", "level", "zone", "peer_zones", "_peers")
+
+    def __init__(self, ip, name, role=None, level=None, zone=None, peers=None):
+        self.ip = ip
+        self.name = name
+        self.role = role
+        self.level = level
+        self.zone = zone
+        self.peer_zones = None
+        self._peers = None
+        if peers is not None:
+            self.peer_zones = frozenset(peer for peer in peers if parse_addr(peer.split("/")[0]) is None)
+            self._peers = PrefixTable((peer, True) for peer in peers if peer not in self.peer_zones)
+
+    def allows(self, addr, zone):
+        """Whether this asset may talk to addr (in zone); always True without a peer list"""
+        if self._peers is None:
+            return True
+        return zone.name in self.peer_zones or self._peers.lookup(addr, False)
+
+    def to_dict(self):
+        return {"ip": self.ip, "name": self.name, "role": self.role, "level": self.level,
+                "zone": self.zone.name if self.zone is not None else None}
+
+
+class AssetInventory:
+    """Devices and zones from the inventory file, with an LRU-cached (asset, zone) lookup per address
+
+    Assets are found by exact address and zones by longest-prefix match; addresses
+    outside every subnet belong to the "external" zone.
+    """
+
+    def __init__(self, zones=(), assets=(), cache_size=LOOKUP_CACHE_SIZE):
+        self.zones = {}
+        self._subnets = PrefixTable()
+        for entry in zones:
+            zone = Zone(entry["name"], entry.get("level"), entry.get("subnets", ()),
+                        entry.get("conduits", ()), entry.get("description", ""))
+            self.zones[zone.name] = zone
+            for subnet in zone.subnets:
+                self._subnets.add(subnet, zone)
+        self.external = self.zones.setdefault(EXTERNAL_ZONE, Zone(EXTERNAL_ZONE))
+
+        self.assets = {}
+        for entry in assets:
+            addr = parse_addr(entry["ip"])
+            if addr is None:
+                print(f"Skipping asset with invalid address: {entry['ip']!r}")
+                continue
+            zone = self.zones.get(entry.get("zone")) or self._subnets.lookup(addr, self.external)
+            level = entry.get("level", zone.level)
+            self.assets[addr] = Asset(entry["ip"], entry.get("name", entry["ip"]), entry.get("role"), level,
+                                      zone, entry.get("allowed_peers"))
+
+        self.lookup = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __len__(self):
+        return len(self.assets)
+
+    def _lookup(self, addr):
+        asset = self.assets.get(addr)
+        if asset is not None:
+            return asset, asset.zone
+        return None, self._subnets.lookup(addr, self.external)
+
+    def annotate(self, frame):
+        """Set the frame's src/dst asset (None when not inventoried) and zone"""
+        lookup = self.lookup
+        frame.src_asset, frame.src_zone = lookup(frame.src_addr)
+        frame.dst_asset, frame.dst_zone = lookup(frame.dst_addr)
+
+    def describe(self, text):
+        """(asset name, zone name) for a threat's source or target: an address or '<zone> zone'"""
+        addr = parse_addr(text)
+        if addr is None:
+            zone = self.zones.get(text[:-len(" zone")]) if text.endswith(" zone") else None
+            return None, (zone.name if zone is not None else None)
+        asset, zone = self.lookup(addr)
+        return (asset.name if asset is not None else None), zone.name
+
+    def annotate_threat(self, threat):
+        threat["source_asset"], threat["source_zone"] = self.describe(threat["source"])
+        threat["target_asset"], threat["target_zone"] = self.describe(threat["target"])
+        return threat
+
+    def summary(self):
+        cache = self.lookup.cache_info()
+        return {
+            "assets": len(self.assets),
+            "zones": [zone.to_dict() for zone in self.zones.values()],
+            "subnets": len(self._subnets),
+            "cache": {"hits": cache.hits, "misses": cache.misses, "size": cache.currsize}
+        }
+
+
+_loaded = {}
+
+
+def load_inventory(path=DEFAULT_INVENTORY):
+    """AssetInventory from a JSON inventory file, None if there is none
+
+    Loaded once per process and file version, so analysis workers can call it per chunk.
+    """
+    if path is None:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path) as f:
+        config = json.load(f)
+    inventory = AssetInventory(config.get("zones", ()), config.get("assets", ()))
+    _loaded[path] = (mtime, inventory)
+    return inventory
@@ -0,0 +1,263 @@
+import math
+
+import numpy as np
+
+from .decoder import MODBUS_PORT, MODBUS_READS, MODBUS_READ_WRITE, MODBUS_WRITES, ip_to_str
+from .rules import Rule
+
+REGISTER_BLOCK = 100  # Registers per baseline key: addresses 0-99, 100-199, ...
+
+# Scores (z-score-like) at which a frame's event becomes Medium or High
+MEDIUM_SCORE = 3.0
+HIGH_SCORE = 6.0
+NEW_KEY_SCORE = 4.0        # A client/server/unit/function/block first seen after the learning period
+NEW_WRITE_KEY_SCORE = 8.0  # ... when it is a write
+
+_WRITES = frozenset(MODBUS_WRITES)
+_READS = frozenset(MODBUS_READS + (MODBUS_READ_WRITE,))
+
+_ARRAYS = (
+    ("count", np.int64),       # Requests in the current interval
+    ("rate_mean", np.float64), # EWMA of requests/s over past intervals
+    ("rate_var", np.float64),
+    ("rate_n", np.int64),      # Complete intervals observed
+    ("value_mean", np.float64),
+    ("value_var", np.float64),
+    ("value_n", np.int64),
+    ("first_seen", np.float64),
+    ("write", np.bool_)        # Key's function code writes
+)
+
+
+class ModbusRateAnomaly(Rule):
+    threat_type = "Modbus Rate Anomaly"
+    severity = "High"
+    details = "Modbus request rate far outside the learned baseline for this client, device and register range"
+    solution = "Confirm the client's polling configuration and check for scripted or unauthorized access"
+    mitigation_steps = (
+        "Compare the request rate with the HMI/SCADA polling schedule",
+        "Rate limit Modbus requests per client at the firewall",
+        "Review the client host for unauthorized tools"
+    )
+
+
+class ModbusValueAnomaly(Rule):
+    threat_type = "Modbus Value Anomaly"
+    severity = "High"
+    details = "Value written or read far outside the learned range for these registers"
+    solution = "Verify the process value or setpoint with operations staff"
+    mitigation_steps = (
+        "Check the setpoint change against the operator log",
+        "Restrict write function codes to engineering workstations",
+        "Alert on setpoints outside engineering limits"
+    )
+
+
+class NewModbusOperation(Rule):
+    threat_type = "New Modbus Operation"
+    severity = "Medium"
+    details = "Function code and register range not seen from this client during the learning period"
+    solution = "Confirm the new access is part of an approved change"
+    mitigation_steps = (
+        "Review change management records for the device",
+        "Whitelist function codes and register ranges per client"
+    )
+
+
+class ModbusBaseline:
+    """Learned per-key Modbus behaviour, scored against new traffic in vectorized batches
+
+    A key is (client, server, unit ID, function code, register block). observe()
+    is the per-frame part: one dict lookup and a few list appends. flush() takes the
+    frames observed since the last call and, with NumPy over the whole batch,
+    scores them against each key's EWMA request rate (per interval) and value
+    mean/variance, raises their risk, then folds them into the baselines. Keys
+    first seen after the learning period score as new operations.
+    """
+
+    def __init__(self, interval=10.0, alpha=0.1, learning=300.0, warmup=3, value_warmup=20,
+                 max_keys=200000, batch_size=4096):
+        self.interval = interval
+        self.alpha = alpha
+        self.learning = learning
+        self.warmup = warmup
+        self.value_warmup = value_warmup
+        self.max_keys = max_keys
+        self.batch_size = batch_size
+
+        self._index = {}
+        self._keys = []
+        for name, dtype in _ARRAYS:
+            setattr(self, name, np.zeros(1024, dtype=dtype))
+        self.learning_end = None
+        self.interval_end = None
+        self.untracked = 0
+        self.anomalies = 0
+
+        self._pending = []  # (slot, value or nan, is request, frame) since the last flush
+
+    def __len__(self):
+        return len(self._keys)
+
+    def observe(self, frame):
+        """Queue a decoded Modbus frame for the next flush; True once a batch is ready"""
+        fc = frame.modbus_fc
+        if fc is None:
+            return False
+        if fc & 0x80:
+            frame.risk = max(frame.risk, 1)  # Exception response
+            return False
+        addr = frame.modbus_addr
+        block = -1 if addr is None else addr // REGISTER_BLOCK
+        request = frame.dport == MODBUS_PORT
+        if request:
+            value = frame.modbus_value if fc in _WRITES else None
+            key = (frame.src_addr, frame.dst_addr, frame.modbus_unit, fc, block)
+        else:
+            value = frame.modbus_value if fc in _READS else None
+            if value is None:
+                return False  # Responses only contribute the values they read
+            key = (frame.dst_addr, frame.src_addr, frame.modbus_unit, fc, block)
+
+        slot = self._index.get(key)
+        if slot is None:
+            slot = self._add(key, frame.ts)
+            if slot is None:
+                return False
+        pending = self._pending
+        pending.append((slot, math.nan if value is None else value, request, frame))
+        return len(pending) >= self.batch_size
+
+    def _add(self, key, ts):
+        slot = len(self._keys)
+        if slot >= self.max_keys:
+            self.untracked += 1
+            return None
+        if self.learning_end is None:
+            self.learning_end = ts + self.learning
+            self.interval_end = ts + self.interval
+        if slot == len(self.count):
+            for name, _ in _ARRAYS:
+                array = getattr(self, name)
+                grown = np.zeros(len(array) * 2, dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+        self._index[key] = slot
+        self._keys.append(key)
+        self.first_seen[slot] = ts
+        self.write[slot] = key[3] in _WRITES
+        return slot
+
+    def flush(self, threats=None):
+        """Score and learn from everything observed since the last flush; returns the anomalies found"""
+        if not self._pending:
+            return 0
+        slots, values, requests, frames = zip(*self._pending)
+        self._pending = []
+        slots = np.array(slots, dtype=np.intp)
+        values = np.array(values, dtype=np.float64)
+        requests = np.array(requests, dtype=bool)
+
+        now = frames[-1].ts
+        if now >= self.interval_end:
+            self._roll(now)
+        np.add.at(self.count, slots[requests], 1)
+
+        # Requests so far this interval against the expected count; a partial interval
+        # can only under-count, so this flags bursts early without false alarms
+        rate_n = self.rate_n[slots]
+        expected = self.rate_mean[slots] * self.interval
+        spread = np.sqrt(self.rate_var[slots]) * self.interval + 0.1 * expected + 1.0
+        rate_z = np.where(rate_n >= self.warmup, (self.count[slots] - expected) / spread, 0.0)
+
+        has_value = ~np.isnan(values)
+        value_mean = self.value_mean[slots]
+        value_spread = np.sqrt(self.value_var[slots]) + 0.01 * np.abs(value_mean) + 1.0
+        value_z = np.where(has_value & (self.value_n[slots] >= self.value_warmup),
+                           np.abs(np.nan_to_num(values) - value_mean) / value_spread, 0.0)
+
+        new = (self.first_seen[slots] >= self.learning_end) & (rate_n == 0)
+        new_score = np.where(self.write[slots], NEW_WRITE_KEY_SCORE, NEW_KEY_SCORE)
+        score = np.maximum(rate_z, value_z)
+        score = np.where(new, np.maximum(score, new_score), score)
+
+        self._learn_values(slots[has_value], values[has_value])
+
+        flagged = np.flatnonzero(score >= MEDIUM_SCORE)
+        for i in flagged.tolist():
+            frame = frames[i]
+            frame_score = score[i]
+            frame.risk = max(frame.risk, 2 if frame_score >= HIGH_SCORE else 1)
+            if threats is not None:
+                if new[i]:
+                    template = NewModbusOperation
+                elif value_z[i] >= rate_z[i]:
+                    template = ModbusValueAnomaly
+                else:
+                    template = ModbusRateAnomaly
+                threats.record(template, ip_to_str(self._keys[slots[i]][0]), self.describe(slots[i]), frame.ts)
+        self.anomalies += len(flagged)
+        return len(flagged)
+
+    def _learn_values(self, slots, values):
+        """EWMA mean/variance update, one step per key with the batch's samples combined
+
+        Works on the batch's distinct keys only, so the cost doesn't grow with the key count.
+        """
+        if not len(slots):
+            return
+        touched, inverse, n = np.unique(slots, return_inverse=True, return_counts=True)
+        batch_mean = np.bincount(inverse, weights=values) / n
+        batch_var = np.maximum(np.bincount(inverse, weights=values * values) / n - batch_mean * batch_mean, 0.0)
+
+        mean = self.value_mean[touched]
+        var = self.value_var[touched]
+        first = self.value_n[touched] == 0
+        weight = 1.0 - (1.0 - self.alpha) ** n  # Equivalent weight of n single-sample updates
+        delta = batch_mean - mean
+        mean = np.where(first, batch_mean, mean + weight * delta)
+        var = np.where(first, batch_var, (1.0 - weight) * (var + weight * delta * delta) + weight * batch_var)
+        self.value_mean[touched] = mean
+        self.value_var[touched] = var
+        self.value_n[touched] += n
+
+    def _roll(self, now):
+        """Close the current interval: fold each key's request rate into its baseline"""
+        keys = len(self._keys)
+        started = self.interval_end - self.interval
+        rate = self.count[:keys] / self.interval
+        full = self.first_seen[:keys] <= started  # Keys first seen mid-interval would under-count
+        first = full & (self.rate_n[:keys] == 0)
+        update = full & (self.rate_n[:keys] > 0)
+
+        mean = self.rate_mean[:keys]
+        var = self.rate_var[:keys]
+        delta = rate - mean
+        var[update] = (1.0 - self.alpha) * (var[update] + self.alpha * delta[update] ** 2)
+        mean[update] += self.alpha * delta[update]
+        mean[first] = rate[first]
+        self.rate_n[:keys][full] += 1
+        self.count[:keys] = 0
+        # After a gap in traffic, resume on the interval grid
+        self.interval_end += self.interval * (1 + int((now - self.interval_end) // self.interval))
+
+    def describe(self, slot):
+        _, server, unit, fc, block = self._keys[slot]
+        registers = "any registers" if block < 0 else \
+            f"registers {block * REGISTER_BLOCK}-{(block + 1) * REGISTER_BLOCK - 1}"
+        return f"{ip_to_str(server)} unit {unit} fc {fc} {registers}"
+
+    def summary(self, n=10):
+        """Key count and the busiest keys with their learned rates"""
+        keys = len(self._keys)
+        top = np.argsort(self.rate_mean[:keys])[::-1][:n]
+        return {
+            "keys": keys,
+            "untracked": self.untracked,
+            "anomalies": self.anomalies,
+            "busiest": [
+                {"client": ip_to_str(self._keys[slot][0]), "operation": self.describe(slot),
+                 "requests_per_second": round(float(self.rate_mean[slot]), 3)}
+                for slot in top.tolist()
+            ]
+        }
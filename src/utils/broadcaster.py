@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+from collections import deque
+
+from .metrics import stage_histogram
+
+ALL_EVENTS_ROOM = "events:all"
+
+
+def _normalize_filters(filters):
+    """Reduce a client's subscription request to a canonical filter dict"""
+    filters = filters or {}
+    normalized = {}
+    for key in ("severity", "protocol"):
+        values = filters.get(key)
+        if isinstance(values, str):
+            values = [values]
+        if values:
+            normalized[key] = sorted(set(values))
+    ip = filters.get("ip")
+    if ip:
+        normalized["ip"] = ip
+    return normalized
+
+
+def _event_matches(event, filters):
+    severities = filters.get("severity")
+    if severities and event.get("severity") not in severities:
+        return False
+    protocols = filters.get("protocol")
+    if protocols and event.get("protocol") not in protocols:
+        return False
+    ip = filters.get("ip")
+    if ip and ip != event.get("source_ip") and ip != event.get("target_ip"):
+        return False
+    return True
+
+
+class EventBroadcaster:
+    """Queue events and emit them to Socket.IO rooms as batches from a background thread
+
+    Events dropped from a full queue, or cut from an oversized room batch, are
+    counted per room (one room per distinct subscription filter), so each client
+    is only told about the events it would have received.
+    """
+
+    def __init__(self, socketio, interval=0.5, batch_size=200, max_queue=20000, max_room_batch=500):
+        self.socketio = socketio
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.max_room_batch = max_room_batch
+
+        self._queue = deque()
+        self._dropped = {}  # room: {severity: count} since the last flush
+        self._room_dropped = {}  # room: total dropped for its clients
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._rooms = {ALL_EVENTS_ROOM: {}}
+        self._members = {ALL_EVENTS_ROOM: set()}
+        self._client_rooms = {}
+        self._thread = None
+
+        self.published = 0
+        self.dropped = 0
+        self.batches_sent = 0
+        self._emit_seconds = stage_histogram("emit")
+
+    def publish(self, event):
+        """Queue an event for the next batch; never blocks the caller"""
+        if len(self._queue) >= self.max_queue:
+            severity = event.get("severity", "Unknown")
+            with self._lock:
+                for room, filters in self._rooms.items():
+                    if self._members.get(room) and (not filters or _event_matches(event, filters)):
+                        counts = self._dropped.setdefault(room, {})
+                        counts[severity] = counts.get(severity, 0) + 1
+                self.dropped += 1
+            return
+        self._queue.append(event)
+        self.published += 1
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def subscribe(self, sid, filters=None):
+        """Register a client's filters and return the room it should join"""
+        filters = _normalize_filters(filters)
+        room = "events:" + json.dumps(filters, sort_keys=True) if filters else ALL_EVENTS_ROOM
+        with self._lock:
+            self._remove_client(sid)
+            self._rooms.setdefault(room, filters)
+            self._members.setdefault(room, set()).add(sid)
+            self._client_rooms[sid] = room
+        return room
+
+    def unsubscribe(self, sid):
+        """Forget a client; returns the room it was in, if any"""
+        with self._lock:
+            return self._remove_client(sid)
+
+    def _remove_client(self, sid):
+        room = self._client_rooms.pop(sid, None)
+        if room is not None:
+            members = self._members.get(room)
+            members.discard(sid)
+            if not members and room != ALL_EVENTS_ROOM:
+                del self._members[room]
+                del self._rooms[room]
+                self._dropped.pop(room, None)
+                self._room_dropped.pop(room, None)
+        return room
+
+    @property
+    def client_count(self):
+        return len(self._client_rooms)
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def room_stats(self):
+        """Clients and dropped event totals for each subscription room"""
+        with self._lock:
+            return [
+                {"room": room, "filters": self._rooms[room], "clients": len(members),
+                 "dropped": self._room_dropped.get(room, 0)}
+                for room, members in self._members.items() if members
+            ]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Broadcast error: {e}")
+
+    def flush(self):
+        """Emit everything queued so far as one new_events message per room"""
+        queue = self._queue
+        batch = [queue.popleft() for _ in range(len(queue))]
+        with self._lock:
+            dropped, self._dropped = self._dropped, {}
+            if not batch and not dropped:
+                return
+            rooms = [(room, filters) for room, filters in self._rooms.items() if self._members.get(room)]
+        started = time.perf_counter()
+
+        for room, filters in rooms:
+            events = [event for event in batch if _event_matches(event, filters)] if filters else batch
+            summary = dict(dropped.get(room, ()))
+            if len(events) > self.max_room_batch:
+                # Client can't usefully render more than this; summarize the rest
+                for event in events[:-self.max_room_batch]:
+                    severity = event.get("severity", "Unknown")
+                    summary[severity] = summary.get(severity, 0) + 1
+                events = events[-self.max_room_batch:]
+            if not events and not summary:
+                continue
+
+            payload = {"events": events}
+            if summary:
+                payload["dropped"] = summary
+                with self._lock:
+                    if room in self._rooms:
+                        self._room_dropped[room] = self._room_dropped.get(room, 0) + sum(summary.values())
+            self.socketio.emit('new_events', payload, to=room)
+            self.batches_sent += 1
+        self._emit_seconds.observe(time.perf_counter() - started)
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+
+from .metrics import counter
+from .sniffer import RawSniffer
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CONFIG = os.path.join(BASE_DIR, "config", "capture.json")
+
+# Named capture profiles: a kernel BPF filter (None captures everything) and the
+# number of bytes copied out of each frame. 256 bytes covers Ethernet/VLAN, IP and
+# TCP headers with options plus the MBAP header and the start of the Modbus PDU.
+CAPTURE_PROFILES = {
+    "full": {
+        "filter": None,
+        "snaplen": 65535,
+        "description": "Every frame, untruncated"
+    },
+    "modbus-only": {
+        "filter": "tcp port 502",
+        "snaplen": 256,
+        "description": "Modbus TCP only, headers and the start of each PDU"
+    },
+    "ics-protocols": {
+        "filter": ("tcp port 502 or tcp port 102 or tcp port 2404 or tcp port 20000 or tcp port 44818"
+                   " or udp port 2222 or udp port 47808 or tcp port 4840 or udp portrange 34962-34964"),
+        "snaplen": 512,
+        "description": "Modbus, S7, IEC 104, DNP3, EtherNet/IP, BACnet, OPC UA and PROFINET"
+    },
+    "headers": {
+        "filter": None,
+        "snaplen": 128,
+        "description": "Every frame, truncated to its protocol headers"
+    }
+}
+
+
+def load_capture_config(path=DEFAULT_CONFIG):
+    """(interfaces, extra profiles) from the JSON config; one default-interface "full" capture if absent"""
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return [{"iface": None, "profile": "full"}], {}
+    return config.get("interfaces") or [{"iface": None, "profile": "full"}], config.get("profiles", {})
+
+
+class CaptureManager:
+    """One RawSniffer per interface, each with its own profile, switchable at runtime
+
+    Per-interface counters live here rather than in the sniffers, so they survive
+    profile changes and restarts.
+    """
+
+    def __init__(self, interfaces=None, profiles=None):
+        self.profiles = dict(CAPTURE_PROFILES, **(profiles or {}))
+        self.interfaces = {}
+        self.sniffers = {}
+        self.stats = {}
+        self.prn = None
+        self._lock = threading.Lock()
+        for entry in interfaces or [{"iface": None, "profile": "full"}]:
+            self.set_profile(entry.get("iface"), entry.get("profile", "full"))
+
+    def set_profile(self, iface, profile):
+        """Capture iface with the named profile, adding the interface if it is new"""
+        if profile not in self.profiles:
+            raise ValueError(f"Unknown capture profile {profile!r}, expected one of {', '.join(self.profiles)}")
+        with self._lock:
+            self.interfaces[iface] = profile
+            self._counters(iface)
+            sniffer = self.sniffers.pop(iface, None)
+        if sniffer is not None:
+            sniffer.stop()
+            if self.prn is not None:
+                self.ensure_running(self.prn)
+
+    def remove_interface(self, iface):
+        with self._lock:
+            if iface not in self.interfaces:
+                raise KeyError(iface)
+            del self.interfaces[iface]
+            sniffer = self.sniffers.pop(iface, None)
+        if sniffer is not None:
+            sniffer.stop()
+
+    def ensure_running(self, prn):
+        """Start a sniffer for every configured interface that lacks a running one"""
+        self.prn = prn
+        started = 0
+        with self._lock:
+            for iface, profile in self.interfaces.items():
+                sniffer = self.sniffers.get(iface)
+                if sniffer is not None and sniffer.running:
+                    continue
+                if sniffer is not None:
+                    print(f"Sniffer on {iface or 'default interface'} stopped unexpectedly, restarting")
+                settings = self.profiles[profile]
+                sniffer = RawSniffer(prn, iface=iface, filter=settings.get("filter"),
+                                     snaplen=settings.get("snaplen", 65535), stats=self.stats[iface])
+                sniffer.start()
+                self.sniffers[iface] = sniffer
+                started += 1
+        return started
+
+    def stop(self):
+        self.prn = None
+        with self._lock:
+            sniffers = list(self.sniffers.values())
+            self.sniffers.clear()
+        for sniffer in sniffers:
+            sniffer.stop(join=False)
+        for sniffer in sniffers:
+            sniffer.stop()
+
+    def totals(self):
+        totals = {}
+        for stats in list(self.stats.values()):
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def status(self):
+        with self._lock:
+            items = list(self.interfaces.items())
+        result = []
+        for iface, profile in items:
+            settings = self.profiles[profile]
+            sniffer = self.sniffers.get(iface)
+            result.append(dict(
+                self.stats[iface],
+                iface=iface,
+                profile=profile,
+                filter=settings.get("filter"),
+                snaplen=settings.get("snaplen", 65535),
+                running=sniffer is not None and sniffer.running,
+                error=sniffer.error if sniffer is not None else None
+            ))
+        return result
+
+    def _counters(self, iface):
+        """Counter dict for iface, registered with the metrics registry the first time it is seen"""
+        if iface in self.stats:
+            return self.stats[iface]
+        stats = self.stats[iface] = {"packets": 0, "bytes": 0, "dropped": 0, "kernel_packets": 0, "kernel_drops": 0}
+        name = iface or "default"
+        counter("scada_interface_packets_total", "Frames read from each capture interface",
+                fn=lambda: stats["packets"], iface=name)
+        counter("scada_interface_bytes_total", "Captured (post-snaplen) bytes read from each interface",
+                fn=lambda: stats["bytes"], iface=name)
+        counter("scada_interface_dropped_total", "Frames read from each interface but dropped by a full queue",
+                fn=lambda: stats["dropped"], iface=name)
+        counter("scada_interface_kernel_drops_total", "Frames the kernel dropped on each interface",
+                fn=lambda: stats["kernel_drops"], iface=name)
+        return stats
@@ -0,0 +1,319 @@
+import base64
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from .pcap_index import BloomFilter, host_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    start_ts REAL,
+    end_ts REAL,
+    packet_count INTEGER,
+    size INTEGER,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS reports (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    pcap_file TEXT,
+    start_ts REAL,
+    end_ts REAL,
+    packet_count INTEGER,
+    size INTEGER,
+    risk_level TEXT,
+    threat_count INTEGER,
+    created REAL,
+    host_index TEXT
+);
+CREATE TABLE IF NOT EXISTS report_threats (
+    report_name TEXT NOT NULL,
+    threat_type TEXT NOT NULL,
+    count INTEGER
+);
+CREATE TABLE IF NOT EXISTS report_hosts (
+    report_name TEXT NOT NULL,
+    ip TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS report_host_filters (
+    report_name TEXT PRIMARY KEY,
+    hashes INTEGER NOT NULL,
+    filter BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_captures_start ON captures (start_ts);
+CREATE INDEX IF NOT EXISTS idx_reports_start ON reports (start_ts);
+CREATE INDEX IF NOT EXISTS idx_reports_risk ON reports (risk_level, start_ts);
+CREATE INDEX IF NOT EXISTS idx_report_threats ON report_threats (threat_type, report_name);
+CREATE INDEX IF NOT EXISTS idx_report_threats_report ON report_threats (report_name);
+CREATE INDEX IF NOT EXISTS idx_report_hosts ON report_hosts (ip, report_name);
+CREATE INDEX IF NOT EXISTS idx_report_hosts_report ON report_hosts (report_name);
+"""
+
+
+def parse_time(value):
+    """Accept epoch seconds or an ISO date/datetime; returns epoch seconds or None"""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _file_time(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return time.time()
+
+
+# Columns added to existing catalogs since the reports table was created
+_REPORT_COLUMNS = {"host_index": "TEXT"}
+
+
+def _report_hosts(report_data):
+    """(index kind, exact hosts, Bloom filter or None) for a report
+
+    Reports list every host, or carry a Bloom filter of them once there were too
+    many ("exact" or "filter"). Older reports only list their top talkers and
+    threat endpoints, so a host search may miss them ("partial").
+    """
+    hosts = set()
+    stats = report_data.get("network_statistics", {})
+    for key in ("top_sources", "top_destinations", "unique_sources", "unique_destinations"):  # 2.0 and 1.0 names
+        hosts.update(stats.get(key, []))
+    for threat in report_data.get("security_analysis", {}).get("detected_threats", []):
+        for field in ("source", "target"):
+            value = threat.get(field)
+            if value and value[0].isdigit():
+                hosts.add(value.split(':')[0])
+    complete = stats.get("hosts")
+    if not complete:
+        return "partial", hosts, None
+    if complete.get("complete"):
+        return "exact", hosts.union(complete["ips"]), None
+    bloom = BloomFilter(complete["bloom_bits"], complete["bloom_hashes"], base64.b64decode(complete["bloom"]))
+    return "filter", hosts, bloom
+
+
+def _host_in_filter(data, hashes, key):
+    """SQLite function: whether a report's stored Bloom filter may hold the host key"""
+    return key in BloomFilter(len(data) * 8, hashes, data)
+
+
+class Catalog:
+    """SQLite index of capture and report files, kept up to date as they are written"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(reports)")}
+        for column, kind in _REPORT_COLUMNS.items():
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE reports ADD COLUMN {column} {kind}")
+        self._conn.create_function("host_in_filter", 3, _host_in_filter, deterministic=True)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_capture(self, pcap_file, packet_count=None, start_ts=None, end_ts=None, size=None):
+        if size is None:
+            size = os.path.getsize(pcap_file)
+        name = os.path.basename(pcap_file)
+        if name.endswith('.pcap.gz'):
+            name = name[:-len('.gz')]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, pcap_file, start_ts, end_ts, packet_count, size, _file_time(pcap_file))
+            )
+
+    def move_capture(self, name, path, size):
+        """Point a capture at its new file (e.g. after compression), keeping its name and times"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE captures SET path = ?, size = ? WHERE name = ?", (path, size, name))
+
+    def oldest_captures(self, before=None):
+        """Every capture (or those that ended before `before`), oldest first"""
+        clause, params = "", []
+        if before is not None:
+            clause, params = " WHERE COALESCE(end_ts, created) < ?", [before]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM captures{clause} ORDER BY COALESCE(start_ts, created), name", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def reports_before(self, before):
+        """Reports whose traffic ended before `before`, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM reports WHERE COALESCE(end_ts, created) < ? ORDER BY COALESCE(start_ts, created), name",
+                (before,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def storage_totals(self):
+        """Bytes and file counts held by captures and reports"""
+        with self._lock:
+            captures = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM captures").fetchone()
+            reports = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        return {
+            "captures": captures[0], "capture_bytes": captures[1],
+            "reports": reports[0], "report_bytes": reports[1]
+        }
+
+    def add_report(self, report_file, report_data):
+        name = os.path.basename(report_file)
+        metadata = report_data.get("report_metadata", {})
+        security = report_data.get("security_analysis", {})
+        threats = {}
+        for threat in security.get("detected_threats", []):
+            threats[threat["type"]] = threats.get(threat["type"], 0) + threat.get("count", 1)
+        host_index, hosts, host_filter = _report_hosts(report_data)
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM report_threats WHERE report_name = ?", (name,))
+            self._conn.execute("DELETE FROM report_hosts WHERE report_name = ?", (name,))
+            self._conn.execute("DELETE FROM report_host_filters WHERE report_name = ?", (name,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (name, path, pcap_file, start_ts, end_ts, packet_count, size,"
+                " risk_level, threat_count, created, host_index) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name, report_file, metadata.get("pcap_file"),
+                    metadata.get("first_packet_ts"), metadata.get("last_packet_ts"),
+                    report_data.get("network_statistics", {}).get("total_packets"),
+                    os.path.getsize(report_file) if os.path.exists(report_file) else None,
+                    security.get("risk_level"), len(security.get("detected_threats", [])),
+                    _file_time(report_file), host_index
+                )
+            )
+            self._conn.executemany(
+                "INSERT INTO report_threats VALUES (?, ?, ?)",
+                [(name, threat_type, count) for threat_type, count in threats.items()]
+            )
+            self._conn.executemany("INSERT INTO report_hosts VALUES (?, ?)", [(name, ip) for ip in hosts])
+            if host_filter is not None:
+                self._conn.execute("INSERT INTO report_host_filters VALUES (?, ?, ?)",
+                                   (name, host_filter.hashes, bytes(host_filter.data)))
+
+    def remove(self, filename):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM captures WHERE name = ?", (filename,))
+            self._conn.execute("DELETE FROM reports WHERE name = ?", (filename,))
+            self._conn.execute("DELETE FROM report_threats WHERE report_name = ?", (filename,))
+            self._conn.execute("DELETE FROM report_hosts WHERE report_name = ?", (filename,))
+            self._conn.execute("DELETE FROM report_host_filters WHERE report_name = ?", (filename,))
+
+    def get(self, filename):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM captures WHERE name = ?", (filename,)).fetchone()
+            if row is None:
+                row = self._conn.execute("SELECT * FROM reports WHERE name = ?", (filename,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list_captures(self, page=1, per_page=50, since=None, until=None):
+        where, params = self._time_filter(since, until)
+        return self._page("captures", where, params, page, per_page)
+
+    def capture_paths(self, since=None, until=None):
+        """Paths of every capture overlapping [since, until], oldest first"""
+        where, params = self._time_filter(since, until)
+        clause = (" WHERE " + " AND ".join(where)) if where else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT path FROM captures{clause} ORDER BY COALESCE(start_ts, created), name", params
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def list_reports(self, page=1, per_page=50, since=None, until=None, risk=None, host=None, threat_type=None):
+        """Filtered, newest-first page of reports, answered entirely from the index
+
+        A host matches reports that list it and reports whose Bloom filter may hold
+        it, so reports of captures with very many hosts can be false positives.
+        Each item's host_index says how complete its host list is (see _report_hosts).
+        """
+        where, params = self._time_filter(since, until)
+        if risk:
+            where.append("risk_level = ?")
+            params.append(risk)
+        if host:
+            where.append("(name IN (SELECT report_name FROM report_hosts WHERE ip = ?)"
+                         " OR name IN (SELECT report_name FROM report_host_filters WHERE host_in_filter(filter, hashes, ?)))")
+            params.extend((host, host_key(host)))
+        if threat_type:
+            where.append("name IN (SELECT report_name FROM report_threats WHERE threat_type = ?)")
+            params.append(threat_type)
+        result = self._page("reports", where, params, page, per_page)
+        with self._lock:
+            for item in result["items"]:
+                item["threat_types"] = [
+                    row[0] for row in self._conn.execute(
+                        "SELECT threat_type FROM report_threats WHERE report_name = ?", (item["name"],)
+                    )
+                ]
+        return result
+
+    @staticmethod
+    def _time_filter(since, until):
+        where, params = [], []
+        if since is not None:
+            where.append("COALESCE(end_ts, created) >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("COALESCE(start_ts, created) <= ?")
+            params.append(until)
+        return where, params
+
+    def _page(self, table, where, params, page, per_page):
+        clause = (" WHERE " + " AND ".join(where)) if where else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM {table}{clause}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM {table}{clause} ORDER BY COALESCE(start_ts, created) DESC, name DESC"
+                " LIMIT ? OFFSET ?",
+                params + [per_page, (page - 1) * per_page]
+            ).fetchall()
+        return {"items": [dict(row) for row in rows], "total": total, "page": page, "per_page": per_page}
+
+    def sync_directories(self, capture_dir, reports_dir):
+        """One-off backfill: index files written before the catalog existed, drop vanished ones"""
+        with self._lock:
+            known = {row[0] for row in self._conn.execute("SELECT name FROM captures UNION SELECT name FROM reports")}
+            stale = [
+                row[0] for row in self._conn.execute("SELECT name, path FROM captures UNION SELECT name, path FROM reports")
+                if not os.path.exists(row[1])
+            ]
+        for name in stale:
+            self.remove(name)
+
+        added = 0
+        for name in os.listdir(capture_dir) if os.path.isdir(capture_dir) else []:
+            # Archived captures keep the name of the file they were compressed from
+            capture_name = name[:-len('.gz')] if name.endswith('.pcap.gz') else name
+            if capture_name.endswith('.pcap') and capture_name not in known:
+                self.add_capture(os.path.join(capture_dir, name))
+                known.add(capture_name)
+                added += 1
+        for name in os.listdir(reports_dir) if os.path.isdir(reports_dir) else []:
+            if name.endswith(('.json', '.json.gz')) and name not in known:
+                path = os.path.join(reports_dir, name)
+                try:
+                    with (gzip.open if name.endswith('.gz') else open)(path, 'rt') as f:
+                        self.add_report(path, json.load(f))
+                    added += 1
+                except (OSError, ValueError) as e:
+                    print(f"Skipping unreadable report {name}: {e}")
+        return added
@@ -0,0 +1,283 @@
+import socket
+import struct
+
+MODBUS_PORT = 502
+
+ETH_P_IP = 0x0800
+ETH_P_VLAN = (0x8100, 0x88a8)
+
+IP_PROTO_NAMES = {1: 'ICMP', 6: 'TCP', 17: 'UDP'}
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+_ETHERTYPE = struct.Struct('!H')
+_IPV4 = struct.Struct('!BxHxxHxBxxII')    # ver/ihl, total length, frag, proto, src, dst
+_PORTS = struct.Struct('!HH')
+_TCP = struct.Struct('!HHIIB')           # sport, dport, seq, ack, data offset
+_MBAP = struct.Struct('!HHHBB')          # transaction, protocol, length, unit, function
+_U16 = struct.Struct('!H')
+_U16_PAIR = struct.Struct('!HH')
+
+# Function codes by PDU layout
+MODBUS_READS = (1, 2, 3, 4)              # Request: address, quantity; response: byte count, data
+MODBUS_WRITE_SINGLE = (5, 6)             # Request and response: address, value
+MODBUS_WRITE_MULTIPLE = (15, 16)         # Request: address, quantity, byte count, data; response: address, quantity
+MODBUS_MASK_WRITE = 22                   # Address, AND mask, OR mask
+MODBUS_READ_WRITE = 23                   # Read address/quantity, write address/quantity, byte count, data
+MODBUS_WRITES = MODBUS_WRITE_SINGLE + MODBUS_WRITE_MULTIPLE + (MODBUS_MASK_WRITE, MODBUS_READ_WRITE)
+
+_IP_CACHE_SIZE = 65536
+_ip_cache = {}
+
+
+def ip_to_str(value):
+    """Format a 32-bit IPv4 address, caching the result"""
+    text = _ip_cache.get(value)
+    if text is None:
+        if len(_ip_cache) >= _IP_CACHE_SIZE:
+            _ip_cache.clear()
+        text = _ip_cache[value] = socket.inet_ntoa(value.to_bytes(4, 'big'))
+    return text
+
+
+def _mac_to_str(raw):
+    return ':'.join(f'{b:02x}' for b in raw)
+
+
+class DecodedFrame:
+    """Header fields of one raw frame, pulled out without building scapy layers"""
+    __slots__ = (
+        'data', 'ts', 'length', 'ethertype', 'src', 'dst', 'src_addr', 'dst_addr', 'proto',
+        'sport', 'dport', 'flags', 'seq', 'ack', 'payload_offset', 'payload_len',
+        'modbus_tid', 'modbus_unit', 'modbus_fc', 'modbus_addr', 'modbus_qty', 'modbus_value',
+        'modbus_exc', 'risk', 'src_asset', 'src_zone', 'dst_asset', 'dst_zone'
+    )
+
+    def __init__(self, data, ts):
+        self.data = data
+        self.ts = ts
+        self.length = len(data)
+        self.ethertype = None
+        self.src = None
+        self.dst = None
+        self.src_addr = 0
+        self.dst_addr = 0
+        self.proto = None
+        self.sport = None
+        self.dport = None
+        self.flags = 0
+        self.seq = 0
+        self.ack = 0
+        self.payload_offset = 0
+        self.payload_len = 0
+        self.modbus_tid = None
+        self.modbus_unit = None
+        self.modbus_fc = None
+        self.modbus_addr = None
+        self.modbus_qty = None
+        self.modbus_value = None
+        self.modbus_exc = None
+        self.risk = 0  # Event severity rank set during analysis: 0 Low, 1 Medium, 2 High
+        self.src_asset = None  # Set by AssetInventory.annotate when an inventory is loaded
+        self.src_zone = None
+        self.dst_asset = None
+        self.dst_zone = None
+
+    @property
+    def is_ip(self):
+        return self.proto is not None
+
+    @property
+    def is_tcp(self):
+        return self.proto == 6
+
+    @property
+    def is_modbus(self):
+        return self.proto == 6 and (self.sport == MODBUS_PORT or self.dport == MODBUS_PORT)
+
+    @property
+    def protocol_name(self):
+        if self.proto is None:
+            return 'Unknown' if self.ethertype is None else hex(self.ethertype)
+        return IP_PROTO_NAMES.get(self.proto, str(self.proto))
+
+    @property
+    def payload(self):
+        return self.data[self.payload_offset:self.payload_offset + self.payload_len]
+
+    def summary(self):
+        """Short one-line description, in place of scapy's packet.summary()"""
+        if self.proto is None:
+            return f"Ether {self.src} > {self.dst} type={self.protocol_name}"
+        if self.sport is None:
+            return f"IP {self.src} > {self.dst} {self.protocol_name}"
+        text = f"{self.protocol_name} {self.src}:{self.sport} > {self.dst}:{self.dport}"
+        if self.modbus_fc is not None:
+            text += f" Modbus unit={self.modbus_unit} fc={self.modbus_fc}"
+            if self.modbus_exc is not None:
+                text += f" exception={self.modbus_exc}"
+            elif self.modbus_addr is not None:
+                text += f" addr={self.modbus_addr}"
+                if self.modbus_qty is not None:
+                    text += f" qty={self.modbus_qty}"
+        return text
+
+    def to_scapy(self):
+        """Fully dissect the frame with scapy, for the rare packets that need deep inspection"""
+        from scapy.layers.l2 import Ether
+        return Ether(bytes(self.data))
+
+
+def decode_frame(data, ts=0.0):
+    """Decode Ethernet/IPv4/TCP/UDP and the Modbus MBAP header from raw frame bytes"""
+    buf = memoryview(data)
+    frame = DecodedFrame(buf, ts)
+    size = len(buf)
+    if size < 14:
+        return frame
+
+    offset = 12
+    ethertype = _ETHERTYPE.unpack_from(buf, offset)[0]
+    while ethertype in ETH_P_VLAN and size >= offset + 6:
+        offset += 4
+        ethertype = _ETHERTYPE.unpack_from(buf, offset)[0]
+    offset += 2
+    frame.ethertype = ethertype
+
+    if ethertype != ETH_P_IP or size < offset + 20:
+        frame.src = _mac_to_str(buf[6:12])
+        frame.dst = _mac_to_str(buf[0:6])
+        return frame
+
+    ver_ihl, total_length, frag, proto, src, dst = _IPV4.unpack_from(buf, offset)
+    frame.proto = proto
+    frame.src_addr = src
+    frame.dst_addr = dst
+    frame.src = ip_to_str(src)
+    frame.dst = ip_to_str(dst)
+
+    if frag & 0x1fff:
+        return frame  # Non-first fragment carries no transport header
+
+    # Lengths come from the IP header so frames truncated by a capture snaplen still
+    # report their on-the-wire size and payload length; parsing stops at the captured bytes
+    if total_length:
+        ip_end = offset + total_length
+        frame.length = max(size, ip_end)
+    else:
+        ip_end = size
+    offset += (ver_ihl & 0x0f) * 4
+
+    if proto == 6:
+        if ip_end < offset + 20 or size < offset + 20:
+            return frame
+        sport, dport, seq, ack, data_offset = _TCP.unpack_from(buf, offset)
+        frame.sport = sport
+        frame.dport = dport
+        frame.seq = seq
+        frame.ack = ack
+        frame.flags = buf[offset + 13]
+        offset += (data_offset >> 4) * 4
+        frame.payload_offset = offset
+        frame.payload_len = max(0, ip_end - offset)
+
+        if (sport == MODBUS_PORT or dport == MODBUS_PORT) and frame.payload_len >= 8 and size >= offset + 8:
+            tid, pid, _, unit, fc = _MBAP.unpack_from(buf, offset)
+            if pid == 0:
+                frame.modbus_tid = tid
+                frame.modbus_unit = unit
+                frame.modbus_fc = fc
+                _decode_modbus_pdu(frame, buf, offset + 8, min(size, ip_end), dport == MODBUS_PORT)
+    elif proto == 17:
+        if ip_end < offset + 8 or size < offset + 8:
+            return frame
+        frame.sport, frame.dport = _PORTS.unpack_from(buf, offset)
+        frame.payload_offset = offset + 8
+        frame.payload_len = max(0, ip_end - offset - 8)
+
+    return frame
+
+
+def _decode_modbus_pdu(frame, buf, offset, end, request):
+    """Fill in the address, quantity, first data value and exception code of a Modbus PDU
+
+    offset is the first byte after the function code. Read responses carry no
+    address; FlowTable copies it over from the matching request.
+    """
+    fc = frame.modbus_fc
+    available = end - offset
+    if fc & 0x80:
+        if not request and available >= 1:
+            frame.modbus_exc = buf[offset]
+        return
+    if request:
+        if fc in MODBUS_READS or fc in MODBUS_WRITE_MULTIPLE or fc == MODBUS_READ_WRITE:
+            if available >= 4:
+                frame.modbus_addr, frame.modbus_qty = _U16_PAIR.unpack_from(buf, offset)
+            if fc == 16 and available >= 7:
+                frame.modbus_value = _U16.unpack_from(buf, offset + 5)[0]
+            elif fc == 15 and available >= 6:
+                frame.modbus_value = buf[offset + 5]
+            elif fc == MODBUS_READ_WRITE and available >= 11:
+                frame.modbus_value = _U16.unpack_from(buf, offset + 9)[0]
+        elif fc in MODBUS_WRITE_SINGLE or fc == MODBUS_MASK_WRITE:
+            if available >= 4:
+                frame.modbus_addr, frame.modbus_value = _U16_PAIR.unpack_from(buf, offset)
+                frame.modbus_qty = 1
+    elif fc in MODBUS_READS or fc == MODBUS_READ_WRITE:
+        if available >= 1:
+            byte_count = buf[offset]
+            if fc in (1, 2):
+                if available >= 2 and byte_count:
+                    frame.modbus_value = buf[offset + 1]
+            else:
+                frame.modbus_qty = byte_count // 2
+                if available >= 3 and byte_count >= 2:
+                    frame.modbus_value = _U16.unpack_from(buf, offset + 1)[0]
+    elif fc in MODBUS_WRITE_SINGLE or fc in MODBUS_WRITE_MULTIPLE or fc == MODBUS_MASK_WRITE:
+        if available >= 4:
+            frame.modbus_addr, second = _U16_PAIR.unpack_from(buf, offset)
+            if fc in MODBUS_WRITE_MULTIPLE:
+                frame.modbus_qty = second
+            else:
+                frame.modbus_value = second
+                frame.modbus_qty = 1
+
+
+def peek_flow(data):
+    """(src_addr, dst_addr, sport, dport) of an IPv4 frame without a full decode, else None
+
+    Ports are 0 for protocols without them and for non-first fragments.
+    """
+    size = len(data)
+    if size < 14:
+        return None
+    offset = 12
+    ethertype = _ETHERTYPE.unpack_from(data, offset)[0]
+    while ethertype in ETH_P_VLAN and size >= offset + 6:
+        offset += 4
+        ethertype = _ETHERTYPE.unpack_from(data, offset)[0]
+    offset += 2
+    if ethertype != ETH_P_IP or size < offset + 20:
+        return None
+
+    ver_ihl, _, frag, proto, src, dst = _IPV4.unpack_from(data, offset)
+    offset += (ver_ihl & 0x0f) * 4
+    if (proto == 6 or proto == 17) and not frag & 0x1fff and size >= offset + 4:
+        sport, dport = _PORTS.unpack_from(data, offset)
+        return src, dst, sport, dport
+    return src, dst, 0, 0
+
+
+def decode_batch(frames):
+    """Decode an iterable of (data, timestamp) pairs"""
+    return [decode_frame(data, ts) for data, ts in frames]
+
+
+def decode_packet(packet):
+    """Decode a scapy packet through the raw-bytes path"""
+    return decode_frame(bytes(packet), float(packet.time))
@@ -0,0 +1,134 @@
+import sys
+import threading
+from datetime import datetime
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class EventRecord:
+    """Compact representation of one monitoring event"""
+    __slots__ = ('id', 'ts', 'source_ip', 'target_ip', 'protocol', 'severity',
+                 'packet_info', 'modbus_details', 'assets')
+
+    def __init__(self, event_id, ts, source_ip, target_ip, protocol, severity,
+                 packet_info=None, modbus_details=None, assets=None):
+        self.id = event_id
+        self.ts = ts
+        self.source_ip = _intern(source_ip)
+        self.target_ip = _intern(target_ip)
+        self.protocol = _intern(protocol)
+        self.severity = _intern(severity)
+        self.packet_info = packet_info
+        # (function_code, unit_id, data_length) rather than a dict per event
+        self.modbus_details = modbus_details
+        # (source_asset, source_zone, target_asset, target_zone) when an inventory is loaded
+        self.assets = tuple(_intern(value) for value in assets) if assets is not None else None
+
+    def matches(self, severities=None, ip=None):
+        if severities and self.severity not in severities:
+            return False
+        if ip and ip != self.source_ip and ip != self.target_ip:
+            return False
+        return True
+
+    def to_dict(self):
+        event = {
+            "id": self.id,
+            "timestamp": format_ts(self.ts),
+            "source_ip": self.source_ip,
+            "target_ip": self.target_ip,
+            "protocol": self.protocol,
+            "severity": self.severity,
+            "packet_info": self.packet_info
+        }
+        if self.modbus_details is not None:
+            function_code, unit_id, data_length = self.modbus_details
+            event["modbus_details"] = {
+                "function_code": function_code,
+                "unit_id": unit_id,
+                "data_length": data_length
+            }
+        if self.assets is not None:
+            event["source_asset"], event["source_zone"], event["target_asset"], event["target_zone"] = self.assets
+        return event
+
+
+_last_formatted = (None, None)
+
+
+def format_ts(ts):
+    """Format an epoch timestamp, reusing the string for events in the same second"""
+    global _last_formatted
+    second = int(ts)
+    cached_second, text = _last_formatted
+    if cached_second != second:
+        text = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        _last_formatted = (second, text)
+    return text
+
+
+class EventStore:
+    """Fixed-capacity ring buffer of events with monotonically increasing ids
+
+    lock is reentrant and public so callers can update counters derived from the
+    event stream in the same critical section as the append.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._records = [None] * capacity
+        self._next_id = 1
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return min(self._next_id - 1, self.capacity)
+
+    @property
+    def last_id(self):
+        return self._next_id - 1
+
+    def append(self, event):
+        """Store an event dict and return its compact record; event["ts"] is its epoch time"""
+        modbus = event.get("modbus_details")
+        if modbus:
+            modbus = (modbus.get("function_code"), modbus.get("unit_id"), modbus.get("data_length"))
+        assets = None
+        if "source_zone" in event:
+            assets = (event["source_asset"], event["source_zone"], event["target_asset"], event["target_zone"])
+
+        with self.lock:
+            record = EventRecord(
+                self._next_id,
+                event["ts"],
+                event.get("source_ip"),
+                event.get("target_ip"),
+                event.get("protocol"),
+                event.get("severity"),
+                event.get("packet_info"),
+                modbus or None,
+                assets
+            )
+            self._records[self._next_id % self.capacity] = record
+            self._next_id += 1
+        return record
+
+    def query(self, since_id=0, limit=100, severities=None, ip=None):
+        """Return up to limit records newer than since_id, plus the cursor for the next call"""
+        with self.lock:
+            last_id = self._next_id - 1
+            first_id = max(since_id + 1, last_id - self.capacity + 1, 1)
+            if not severities and not ip:
+                last_id = min(last_id, first_id + limit - 1)
+            snapshot = [self._records[i % self.capacity] for i in range(first_id, last_id + 1)]
+
+        results = []
+        cursor = max(since_id, first_id - 1)
+        for record in snapshot:
+            cursor = record.id
+            if record.matches(severities, ip):
+                results.append(record)
+                if len(results) >= limit:
+                    break
+        return results, cursor
@@ -0,0 +1,259 @@
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .decoder import MODBUS_PORT, ip_to_str
+
+# Latency bucket upper bounds in ms: 0.05ms growing by 25% per bucket, up to ~30s
+LATENCY_BUCKETS_MS = tuple(0.05 * 1.25 ** i for i in range(61))
+
+_SEQ_MASK = 0xffffffff
+_SEQ_HALF = 0x80000000
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; mergeable and O(1) memory"""
+    __slots__ = ('counts', 'total', 'sum_ms', 'max_ms')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.sum_ms += other.sum_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, q):
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(LATENCY_BUCKETS_MS[index], self.max_ms) if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self):
+        if not self.total:
+            return {"count": 0}
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 3),
+            "p50_ms": round(self.percentile(0.50), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "max_ms": round(self.max_ms, 3)
+        }
+
+
+class DeviceStats:
+    """Modbus request/response counters and latency for one server (PLC)"""
+    __slots__ = ('requests', 'responses', 'exceptions', 'unanswered', 'latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.responses = 0
+        self.exceptions = 0
+        self.unanswered = 0
+        self.latency = LatencyHistogram()
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.responses += other.responses
+        self.exceptions += other.exceptions
+        self.unanswered += other.unanswered
+        self.latency.merge(other.latency)
+
+
+class NetworkMetrics:
+    """Per-capture network health: Modbus latency per device, retransmissions, exceptions"""
+
+    def __init__(self, max_devices=5000):
+        self.max_devices = max_devices
+        self.devices = {}
+        self.tcp_segments = 0
+        self.retransmissions = 0
+        self.bytes = 0
+        self.first_ts = None
+        self.last_ts = None
+
+    def device(self, ip):
+        stats = self.devices.get(ip)
+        if stats is None:
+            if len(self.devices) >= self.max_devices:
+                return None
+            stats = self.devices[ip] = DeviceStats()
+        return stats
+
+    def merge(self, other):
+        for ip, stats in other.devices.items():
+            mine = self.device(ip)
+            if mine is not None:
+                mine.merge(stats)
+        self.tcp_segments += other.tcp_segments
+        self.retransmissions += other.retransmissions
+        self.bytes += other.bytes
+        if other.first_ts is not None:
+            self.first_ts = other.first_ts if self.first_ts is None else min(self.first_ts, other.first_ts)
+            self.last_ts = other.last_ts if self.last_ts is None else max(self.last_ts, other.last_ts)
+
+    def summary(self):
+        requests = sum(d.requests for d in self.devices.values())
+        responses = sum(d.responses for d in self.devices.values())
+        exceptions = sum(d.exceptions for d in self.devices.values())
+        unanswered = sum(d.unanswered for d in self.devices.values())
+        overall = LatencyHistogram()
+        for stats in self.devices.values():
+            overall.merge(stats.latency)
+
+        duration = (self.last_ts - self.first_ts) if self.first_ts is not None else 0
+        return {
+            "latency": {
+                ip: dict(stats.latency.summary(), requests=stats.requests,
+                         responses=stats.responses, exceptions=stats.exceptions)
+                for ip, stats in self.devices.items()
+            },
+            "overall_latency": overall.summary(),
+            "modbus_requests": requests,
+            "modbus_responses": responses,
+            "exception_rate": round(exceptions / responses, 4) if responses else 0,
+            "retransmission_rate": round(self.retransmissions / self.tcp_segments, 4) if self.tcp_segments else 0,
+            "packet_loss": round(unanswered / requests, 4) if requests else 0,
+            "throughput_bps": round(self.bytes * 8 / duration) if duration > 0 else None
+        }
+
+
+class Flow:
+    """State for one bidirectional TCP connection"""
+    __slots__ = ('last_seen', 'packets', 'seq_end', 'pending')
+
+    def __init__(self, now):
+        self.last_seen = now
+        self.packets = 0
+        self.seq_end = [None, None]  # Highest sequence end seen, per direction
+        self.pending = None          # {transaction_id: (ts, function_code, address)} while requests are open
+
+
+class FlowTable:
+    """TCP flows keyed on the 5-tuple, with idle and capacity-based eviction
+
+    Modbus requests are matched to their responses by MBAP transaction ID and the
+    round trip is recorded against the responding device. Responses that carry no
+    register address (reads) take it from their request.
+    """
+
+    def __init__(self, capacity=200000, idle_timeout=120, max_pending=64):
+        self.capacity = capacity
+        self.idle_timeout = idle_timeout
+        self.max_pending = max_pending
+        self._flows = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._flows)
+
+    def update(self, frame, metrics):
+        if not frame.is_tcp or frame.sport is None:
+            return
+        now = frame.ts
+        metrics.tcp_segments += 1
+        metrics.bytes += frame.length
+        if metrics.first_ts is None:
+            metrics.first_ts = now
+        metrics.last_ts = now
+
+        src = (frame.src_addr, frame.sport)
+        dst = (frame.dst_addr, frame.dport)
+        if src <= dst:
+            key, direction = (src, dst), 0
+        else:
+            key, direction = (dst, src), 1
+
+        flows = self._flows
+        flow = flows.get(key)
+        if flow is None:
+            flow = flows[key] = Flow(now)
+            self._evict(now, metrics)
+        else:
+            flows.move_to_end(key)
+            flow.last_seen = now
+        flow.packets += 1
+
+        if frame.payload_len:
+            end = (frame.seq + frame.payload_len) & _SEQ_MASK
+            seen = flow.seq_end[direction]
+            if seen is not None and (seen - end) & _SEQ_MASK < _SEQ_HALF:
+                metrics.retransmissions += 1
+                return  # A resent request or response was already matched the first time
+            flow.seq_end[direction] = end
+
+        if frame.modbus_tid is not None:
+            self._match_modbus(frame, flow, metrics)
+
+    def _match_modbus(self, frame, flow, metrics):
+        if frame.dport == MODBUS_PORT:
+            device = metrics.device(frame.dst)
+            if device is not None:
+                device.requests += 1
+            if flow.pending is None:
+                flow.pending = {}
+            elif frame.modbus_tid in flow.pending:
+                # Transaction ID reused while still open: the earlier request will never be matched
+                del flow.pending[frame.modbus_tid]
+                if device is not None:
+                    device.unanswered += 1
+            elif len(flow.pending) >= self.max_pending:
+                flow.pending.pop(next(iter(flow.pending)))
+                if device is not None:
+                    device.unanswered += 1
+            flow.pending[frame.modbus_tid] = (frame.ts, frame.modbus_fc, frame.modbus_addr)
+        elif frame.sport == MODBUS_PORT and flow.pending:
+            request = flow.pending.pop(frame.modbus_tid, None)
+            device = metrics.device(frame.src)
+            if request is None:
+                return
+            if frame.modbus_addr is None:
+                frame.modbus_addr = request[2]
+            if device is None:
+                return
+            device.responses += 1
+            if frame.modbus_fc & 0x80:
+                device.exceptions += 1
+            device.latency.record((frame.ts - request[0]) * 1000.0)
+
+    def _evict(self, now, metrics):
+        flows = self._flows
+        while len(flows) > self.capacity:
+            self._drop(flows.popitem(last=False), metrics)
+        # Expire a couple of idle flows from the cold end per new flow
+        for _ in range(2):
+            if not flows:
+                break
+            key, flow = next(iter(flows.items()))
+            if now - flow.last_seen <= self.idle_timeout:
+                break
+            del flows[key]
+            self._drop((key, flow), metrics)
+
+    def _drop(self, item, metrics):
+        key, flow = item
+        self.evicted += 1
+        if flow.pending:
+            # Requests that never got an answer count against the server side of the flow
+            for (addr, port) in key:
+                if port == MODBUS_PORT:
+                    device = metrics.device(ip_to_str(addr))
+                    if device is not None:
+                        device.unanswered += len(flow.pending)
+                    break
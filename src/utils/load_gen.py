@@ -0,0 +1,305 @@
+import argparse
+import math
+import socket
+import struct
+import threading
+import time
+
+from .traffic_gen import TrafficGenerator, DEFAULT_MIX
+
+RATE_PROFILES = ("constant", "ramp", "burst", "sine")
+
+# Traffic mixes for the attack scenarios (weights as in TrafficGenerator)
+SCENARIOS = {
+    "normal": {"modbus": 0.95, "udp": 0.05},
+    "mixed": DEFAULT_MIX,
+    "scan": {"modbus": 0.7, "scan": 0.25, "udp": 0.05},
+    "flood": {"modbus": 0.5, "flood": 0.45, "udp": 0.05},
+    "spoof": {"modbus": 0.8, "spoof": 0.15, "udp": 0.05}
+}
+
+# TrafficGenerator frames are untagged Ethernet + 20-byte IPv4 + 20-byte TCP
+_TCP_SEQ_OFFSET = 38
+_TCP_PAYLOAD_OFFSET = 54
+_SEQ_ACK = struct.Struct('!II')
+_SEQ_MASK = 0xffffffff
+
+
+class FramePool:
+    """Pre-generated frames replayed in a loop, fast enough to offer 100k+ frames/s
+
+    On every pass after the first, each TCP frame's sequence and acknowledgement
+    numbers are moved on by what its direction of the connection sent during one
+    pass, so replayed streams continue rather than looking like retransmissions.
+    """
+
+    def __init__(self, generator, size=65536):
+        self.frames = [data for data, _ in generator.frames(size)]
+        advance = {}
+        for data in self.frames:
+            if data[23] == 6:
+                key = (data[26:30], data[34:36], data[30:34], data[36:38])
+                advance[key] = advance.get(key, 0) + len(data) - _TCP_PAYLOAD_OFFSET
+        self.shifts = []
+        for data in self.frames:
+            if data[23] != 6:
+                self.shifts.append(None)
+                continue
+            forward = (data[26:30], data[34:36], data[30:34], data[36:38])
+            reverse = (data[30:34], data[36:38], data[26:30], data[34:36])
+            self.shifts.append((advance.get(forward, 0), advance.get(reverse, 0)))
+        self.cycle = 0
+        self.position = 0
+
+    def take(self, count):
+        frames = self.frames
+        shifts = self.shifts
+        cycle = self.cycle
+        position = self.position
+        out = []
+        for _ in range(count):
+            data = frames[position]
+            shift = shifts[position]
+            if cycle and shift is not None:
+                data = bytearray(data)
+                seq, ack = _SEQ_ACK.unpack_from(data, _TCP_SEQ_OFFSET)
+                _SEQ_ACK.pack_into(data, _TCP_SEQ_OFFSET, (seq + cycle * shift[0]) & _SEQ_MASK,
+                                   (ack + cycle * shift[1]) & _SEQ_MASK)
+                data = bytes(data)
+            out.append(data)
+            position += 1
+            if position == len(frames):
+                position = 0
+                cycle += 1
+        self.cycle = cycle
+        self.position = position
+        return out
+
+
+class InterfaceSink:
+    """Replay frames onto a network interface (e.g. lo or one end of a veth pair)"""
+
+    def __init__(self, iface):
+        self.iface = iface
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        self.sock.bind((iface, 0))
+
+    def __call__(self, frames):
+        send = self.sock.send
+        sent = 0
+        for data, _ in frames:
+            try:
+                send(data)
+                sent += 1
+            except OSError:
+                pass  # ENOBUFS: the interface queue is full, count it as refused
+        return sent
+
+    def close(self):
+        self.sock.close()
+
+
+class LoadGenerator:
+    """Offer synthetic SCADA traffic to a sink at a target rate and measure what was achieved
+
+    sink(frames) takes a list of (data, ts) pairs and returns how many it accepted.
+    The rate follows one of RATE_PROFILES: constant, ramp (10% to 100% over period),
+    burst (burst_factor times the rate for a tenth of every period) or sine (rate
+    +/- 50% over period). If the generator can't keep up it skips ahead rather than
+    bursting, and reports how far it fell behind. processed, if given, returns a
+    running count of frames the system under test has analyzed; on_finish, if
+    given, is called from the generator thread once the run ends for any reason.
+    """
+
+    def __init__(self, sink, rate=10000.0, profile="constant", scenario="mixed", duration=None,
+                 period=60.0, burst_factor=5.0, seed=0, pool_size=65536, batch=1024, processed=None,
+                 on_finish=None):
+        if profile not in RATE_PROFILES:
+            raise ValueError(f"Unknown rate profile {profile!r}, expected one of {', '.join(RATE_PROFILES)}")
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {scenario!r}, expected one of {', '.join(SCENARIOS)}")
+        self.sink = sink
+        self.rate = float(rate)
+        self.profile = profile
+        self.scenario = scenario
+        self.duration = duration
+        self.period = period
+        self.burst_factor = burst_factor
+        self.batch = batch
+        self.processed = processed
+        self.on_finish = on_finish
+        self.pool = FramePool(TrafficGenerator(seed, rate=rate, mix=SCENARIOS[scenario]), pool_size)
+
+        self.running = False
+        self.started = None
+        self.elapsed = 0.0
+        self.scheduled = 0.0
+        self.offered = 0
+        self.accepted = 0
+        self.behind = 0
+        self.recent_pps = 0.0
+        self._processed_start = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def rate_at(self, elapsed):
+        """Target frames/s at elapsed seconds into the run"""
+        phase = (elapsed % self.period) / self.period
+        if self.profile == "ramp":
+            return self.rate * (0.1 + 0.9 * min(1.0, elapsed / self.period))
+        if self.profile == "burst":
+            return self.rate * (self.burst_factor if phase < 0.1 else 1.0)
+        if self.profile == "sine":
+            return self.rate * (1.0 + 0.5 * math.sin(2 * math.pi * phase))
+        return self.rate
+
+    def start(self):
+        self._stop_event.clear()
+        self.running = True
+        self._processed_start = self.processed() if self.processed else 0
+        self._thread = threading.Thread(target=self._run, name="load-generator", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        clock = time.monotonic
+        started = clock()
+        self.started = time.time()
+        last = 0.0
+        window_start, window_accepted = 0.0, 0
+        try:
+            while not self._stop_event.is_set():
+                elapsed = clock() - started
+                if self.duration is not None and elapsed >= self.duration:
+                    break
+                rate = self.rate_at(elapsed)
+                self.scheduled += rate * (elapsed - last)
+                last = elapsed
+                self.elapsed = elapsed
+
+                due = int(self.scheduled) - self.offered
+                if due > rate:
+                    # More than a second behind: drop the backlog instead of bursting to catch up
+                    self.behind += due - int(rate * 0.01)
+                    self.offered += due - int(rate * 0.01)
+                    due = int(rate * 0.01)
+                if due <= 0:
+                    time.sleep(min(0.002, 1.0 / max(rate, 1.0)))
+                    continue
+
+                count = min(due, self.batch)
+                now = time.time()
+                spacing = 1.0 / rate
+                frames = [(data, now + i * spacing) for i, data in enumerate(self.pool.take(count))]
+                accepted = self.sink(frames)
+                self.offered += count
+                self.accepted += accepted
+                window_accepted += accepted
+                if elapsed - window_start >= 1.0:
+                    self.recent_pps = window_accepted / (elapsed - window_start)
+                    window_start, window_accepted = elapsed, 0
+        except Exception as e:
+            print(f"Load generator error: {e}")
+        finally:
+            self.elapsed = clock() - started
+            self.running = False
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+    def status(self):
+        elapsed = self.elapsed or 1e-9
+        status = {
+            "running": self.running,
+            "profile": self.profile,
+            "scenario": self.scenario,
+            "target_pps": self.rate,
+            "current_target_pps": round(self.rate_at(self.elapsed), 1),
+            "mean_target_pps": round(self.scheduled / elapsed, 1),
+            "achieved_pps": round(self.accepted / elapsed, 1),
+            "recent_pps": round(self.recent_pps, 1),
+            "elapsed": round(self.elapsed, 3),
+            "duration": self.duration,
+            "offered": self.offered,
+            "accepted": self.accepted,
+            "refused": self.offered - self.accepted - self.behind,
+            "behind": self.behind,
+            "started": self.started
+        }
+        if self.processed is not None:
+            processed = self.processed() - self._processed_start
+            status["processed"] = processed
+            status["processed_pps"] = round(processed / elapsed, 1)
+        return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offer synthetic SCADA traffic at a target rate, in process or onto an interface")
+    parser.add_argument("--rate", type=float, default=10000.0, help="Target frames per second")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--profile", choices=RATE_PROFILES, default="constant")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--period", type=float, default=60.0, help="Seconds per ramp/burst/sine cycle")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iface", default=None,
+                        help="Replay onto this interface instead of analyzing in process (needs root)")
+    args = parser.parse_args(argv)
+
+    if args.iface:
+        sink = InterfaceSink(args.iface)
+        processed = None
+    else:
+        sink, processed = _analysis_sink()
+    generator = LoadGenerator(sink, args.rate, args.profile, args.scenario, args.duration,
+                              period=args.period, seed=args.seed, processed=processed)
+    generator.start()
+    try:
+        while generator.running:
+            time.sleep(1)
+            status = generator.status()
+            print(f"{status['elapsed']:6.1f}s  target {status['current_target_pps']:>9} pps  "
+                  f"offered {status['recent_pps']:>9} pps  processed {status.get('processed_pps', '-')}")
+    except KeyboardInterrupt:
+        generator.stop()
+    print(generator.status())
+
+
+def _analysis_sink():
+    """In-process sink for the CLI: decode, analyze and build events on this process's own thread"""
+    import queue
+    from .analysis import new_analysis, analyze_frame, score_frames, frame_event
+    from .decoder import decode_frame
+
+    frames_queue = queue.Queue(maxsize=1000)
+    analysis = new_analysis("load_test")
+    counts = {"processed": 0}
+
+    def consume():
+        while True:
+            batch = frames_queue.get()
+            frames = [decode_frame(data, ts) for data, ts in batch]
+            for frame in frames:
+                analyze_frame(frame, analysis)
+            score_frames(analysis)
+            for frame in frames:
+                frame_event(frame)
+            counts["processed"] += len(batch)
+
+    def sink(frames):
+        try:
+            frames_queue.put_nowait(frames)
+            return len(frames)
+        except queue.Full:
+            return 0
+
+    threading.Thread(target=consume, daemon=True).start()
+    return sink, lambda: counts["processed"]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# Latency bucket upper bounds in seconds: 1us to ~16s, doubling
+DEFAULT_BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Gauge:
+    """Point-in-time value, either set() directly or read from fn at scrape time"""
+    __slots__ = ('value', 'fn')
+
+    def __init__(self, fn=None):
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        if self.fn is not None:
+            try:
+                return [(name, labels, self.fn())]
+            except Exception:
+                return []
+        return [(name, labels, self.value)]
+
+
+class Counter(Gauge):
+    """Monotonic count; inc() is a plain attribute add so it is cheap on hot paths
+
+    Existing counters elsewhere can be exposed without double counting by passing fn.
+    """
+    __slots__ = ()
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """Fixed-bucket latency histogram in seconds, rendered as a Prometheus histogram"""
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+        return self.buckets[-1]
+
+    def samples(self, name, labels):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append((name + "_bucket", labels + (("le", f"{bound:.6g}"),), cumulative))
+        samples.append((name + "_bucket", labels + (("le", "+Inf"),), self.count))
+        samples.append((name + "_sum", labels, self.sum))
+        samples.append((name + "_count", labels, self.count))
+        return samples
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.sum, 6),
+            "p50_seconds": self.quantile(0.50),
+            "p99_seconds": self.quantile(0.99)
+        }
+
+
+class Registry:
+    """Named metric families, each holding one metric per label set"""
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (kind, help_text, {})
+            elif family[0] != kind:
+                raise ValueError(f"Metric {name} already registered as a {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+        return metric
+
+    def counter(self, name, help_text="", fn=None, **labels):
+        return self._get("counter", name, help_text, labels, lambda: Counter(fn))
+
+    def gauge(self, name, help_text="", fn=None, **labels):
+        return self._get("gauge", name, help_text, labels, lambda: Gauge(fn))
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS, **labels):
+        return self._get("histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            families = sorted(self._families.items())
+        for name, (kind, help_text, metrics) in families:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in list(metrics.items()):
+                for sample_name, sample_labels, value in metric.samples(name, labels):
+                    lines.append(f"{sample_name}{_label_text(sample_labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """JSON-friendly view: {name: value} or {name: {label_text: value}} for labelled families"""
+        result = {}
+        with self._lock:
+            families = sorted(self._families.items())
+        for name, (kind, _, metrics) in families:
+            values = {}
+            for labels, metric in list(metrics.items()):
+                if kind == "histogram":
+                    value = metric.summary()
+                else:
+                    samples = metric.samples(name, labels)
+                    if not samples:
+                        continue
+                    value = samples[0][2]
+                values[",".join(f"{k}={v}" for k, v in labels)] = value
+            result[name] = values[""] if list(values) == [""] else values
+        return result
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def stage_histogram(stage):
+    """Per-item latency of one processing stage, all in the scada_stage_seconds family"""
+    return histogram("scada_stage_seconds", "Seconds per frame, report or broadcast flush in each processing stage", stage=stage)
+
+
+class SamplingProfiler:
+    """Statistical profiler for one thread: samples its stack every interval seconds
+
+    Runs in its own thread and reads sys._current_frames(), so the profiled thread
+    pays nothing; the cost is one stack walk per sample. Results are collapsed
+    stacks (flame graph input) with sample counts.
+    """
+
+    def __init__(self, thread_name, interval=0.005, max_depth=64):
+        self.thread_name = thread_name
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = {}
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=None):
+        target = next((t for t in threading.enumerate() if t.name == self.thread_name), None)
+        if target is None:
+            raise ValueError(f"No running thread named {self.thread_name!r}")
+        self._stop_event.clear()
+        self.started = time.time()
+        self.stopped = None
+        self._thread = threading.Thread(target=self._run, args=(target.ident, duration), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _run(self, ident, duration):
+        deadline = time.monotonic() + duration if duration else None
+        stacks = self.stacks
+        while not self._stop_event.wait(self.interval):
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            frame = sys._current_frames().get(ident)
+            if frame is None:
+                break  # Profiled thread has exited
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(names))
+            stacks[key] = stacks.get(key, 0) + 1
+            self.samples += 1
+        self.stopped = time.time()
+
+    def collapsed(self):
+        """'outer;inner count' lines for flamegraph.pl / speedscope"""
+        return "\n".join(f"{stack} {count}" for stack, count in
+                         sorted(self.stacks.items(), key=lambda kv: kv[1], reverse=True)) + "\n"
+
+    def top(self, n=20):
+        """Functions by self time (leaf samples) and inclusive samples"""
+        own = {}
+        inclusive = {}
+        for stack, count in self.stacks.items():
+            names = stack.split(";")
+            own[names[-1]] = own.get(names[-1], 0) + count
+            for name in set(names):
+                inclusive[name] = inclusive.get(name, 0) + count
+        total = self.samples or 1
+        return [
+            {"function": name, "self_pct": round(count * 100.0 / total, 2),
+             "inclusive_pct": round(inclusive[name] * 100.0 / total, 2)}
+            for name, count in sorted(own.items(), key=lambda kv: kv[1], reverse=True)[:n]
+        ]
+
+    def status(self):
+        return {
+            "thread": self.thread_name,
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.samples,
+            "started": self.started,
+            "stopped": self.stopped
+        }
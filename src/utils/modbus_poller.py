@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import threading
+import time
+
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusException
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CONFIG = os.path.join(BASE_DIR, "config", "modbus_devices.json")
+
+# Modbus limits on the quantity read by one request
+MAX_READ_REGISTERS = 125
+MAX_READ_BITS = 2000
+
+# table: (client method, function code, bit table)
+TABLES = {
+    "coil": ("read_coils", 1, True),
+    "discrete": ("read_discrete_inputs", 2, True),
+    "holding": ("read_holding_registers", 3, False),
+    "input": ("read_input_registers", 4, False)
+}
+
+DEVICE_DEFAULTS = {
+    "port": 502,
+    "unit_id": 1,
+    "interval": 5.0,
+    "timeout": 2.0,
+    "max_gap": 0,
+    "failure_threshold": 3,
+    "reset_timeout": 30.0
+}
+
+# The unit id keyword was renamed across pymodbus 3.x releases
+_READ_PARAMS = inspect.signature(AsyncModbusTcpClient.read_holding_registers).parameters
+UNIT_KWARG = next((name for name in ("device_id", "slave", "unit") if name in _READ_PARAMS), "slave")
+
+
+class Point:
+    """One named value to poll: count registers or bits starting at address"""
+    __slots__ = ('name', 'table', 'address', 'count')
+
+    def __init__(self, name, table, address, count=1):
+        if table not in TABLES:
+            raise ValueError(f"Unknown Modbus table {table!r} for point {name}")
+        limit = MAX_READ_BITS if TABLES[table][2] else MAX_READ_REGISTERS
+        if not 1 <= count <= limit:
+            raise ValueError(f"Point {name} reads {count} {table} values; one request reads 1 to {limit}")
+        self.name = name
+        self.table = table
+        self.address = address
+        self.count = count
+
+
+class ReadBlock:
+    """A single read request covering one or more points of the same table"""
+    __slots__ = ('table', 'address', 'count', 'points')
+
+    def __init__(self, table, address, count, points):
+        self.table = table
+        self.address = address
+        self.count = count
+        self.points = points
+
+
+def coalesce(points, max_gap=0, max_registers=MAX_READ_REGISTERS, max_bits=MAX_READ_BITS):
+    """Merge points into the fewest reads that respect the protocol's per-request limits
+
+    Points of the same table are merged while the combined span fits in one request
+    and the unused addresses between them are no more than max_gap. A point larger
+    than one request raises ValueError.
+    """
+    blocks = []
+    by_table = {}
+    for point in points:
+        by_table.setdefault(point.table, []).append(point)
+
+    for table, table_points in by_table.items():
+        limit = max_bits if TABLES[table][2] else max_registers
+        block = None
+        for point in sorted(table_points, key=lambda p: p.address):
+            if point.count > limit:
+                raise ValueError(f"Point {point.name} reads {point.count} {table} values; one request reads at most {limit}")
+            end = point.address + point.count
+            if (block is not None and point.address - (block.address + block.count) <= max_gap
+                    and end - block.address <= limit):
+                block.count = max(block.count, end - block.address)
+                block.points.append(point)
+            else:
+                block = ReadBlock(table, point.address, point.count, [point])
+                blocks.append(block)
+    return blocks
+
+
+class CircuitBreaker:
+    """Stop polling a device after repeated failures, probing again after reset_timeout"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0
+
+    def allow(self, now):
+        if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"  # Let one poll through as a probe
+        return self.state != "open"
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def failure(self, now):
+        """Count a failure; returns True when this failure opened the breaker"""
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = now
+            return True
+        return False
+
+
+class ConnectionPool:
+    """One persistent client per host:port, shared by every unit id behind it"""
+
+    def __init__(self):
+        self._clients = {}
+
+    def get(self, host, port, timeout):
+        key = (host, port)
+        entry = self._clients.get(key)
+        if entry is None:
+            client = AsyncModbusTcpClient(host, port=port, timeout=timeout, retries=0)
+            entry = self._clients[key] = (client, asyncio.Lock())
+        return entry
+
+    def close(self):
+        for client, _ in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+
+class Device:
+    """Polling schedule, read plan and health counters for one PLC"""
+
+    def __init__(self, config):
+        settings = dict(DEVICE_DEFAULTS, **config)
+        self.name = settings.get("name") or settings["host"]
+        self.host = settings["host"]
+        self.port = settings["port"]
+        self.unit_id = settings["unit_id"]
+        self.interval = float(settings["interval"])
+        self.timeout = float(settings["timeout"])
+        self.points = [
+            Point(p["name"], p["table"], p["address"], p.get("count", 1))
+            for p in settings.get("points", [])
+        ]
+        self.blocks = coalesce(self.points, settings["max_gap"])
+        self.breaker = CircuitBreaker(settings["failure_threshold"], settings["reset_timeout"])
+
+        self.polls = 0
+        self.failures = 0
+        self.requests = 0
+        self.last_poll = None
+        self.last_latency_ms = None
+        self.last_error = None
+        self.values = {}
+
+    def status(self):
+        return {
+            "name": self.name,
+            "host": self.host,
+            "port": self.port,
+            "unit_id": self.unit_id,
+            "interval": self.interval,
+            "points": len(self.points),
+            "requests_per_poll": len(self.blocks),
+            "breaker": self.breaker.state,
+            "polls": self.polls,
+            "failures": self.failures,
+            "requests": self.requests,
+            "last_poll": self.last_poll,
+            "last_latency_ms": self.last_latency_ms,
+            "last_error": self.last_error,
+            "values": self.values
+        }
+
+
+def load_config(path=DEFAULT_CONFIG):
+    """Devices from the JSON config; file-level "defaults" apply to every device"""
+    with open(path) as f:
+        config = json.load(f)
+    defaults = config.get("defaults", {})
+    return [
+        Device(dict(defaults, **device))
+        for device in config.get("devices", []) if device.get("enabled", True)
+    ]
+
+
+class ModbusPoller:
+    """Poll many PLCs concurrently on one asyncio loop in a background thread
+
+    Each device runs as its own task with its own timeout and circuit breaker, so
+    a slow or dead PLC only delays itself. on_reading(device, values, latency_ms)
+    and on_failure(device, error, breaker_opened) are called from the poller thread.
+    """
+
+    def __init__(self, devices, on_reading=None, on_failure=None):
+        self.devices = list(devices)
+        self.on_reading = on_reading
+        self.on_failure = on_failure
+        self.running = False
+        self._loop = None
+        self._thread = None
+        self._pool = None
+
+    def start(self):
+        if self._thread is None:
+            self.running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self.running = False
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: None)  # Wake the loop so tasks notice
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self):
+        return [device.status() for device in self.devices]
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self.run())
+        except Exception as e:
+            print(f"Modbus poller error: {e}")
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    async def run(self):
+        self._pool = ConnectionPool()
+        try:
+            await asyncio.gather(*(self._poll_device(device) for device in self.devices))
+        finally:
+            self._pool.close()
+
+    async def _poll_device(self, device):
+        next_poll = time.monotonic()
+        while self.running:
+            await self.poll_once(device)
+            next_poll += device.interval
+            now = time.monotonic()
+            if next_poll < now:
+                next_poll = now  # Overran the interval: skip the missed slots rather than bursting
+            while self.running and time.monotonic() < next_poll:
+                await asyncio.sleep(min(0.5, next_poll - time.monotonic()))
+
+    async def poll_once(self, device):
+        now = time.time()
+        if not device.blocks or not device.breaker.allow(now):
+            return
+        client, lock = self._pool.get(device.host, device.port, device.timeout)
+        started = time.monotonic()
+        try:
+            async with lock:
+                if not client.connected:
+                    await asyncio.wait_for(client.connect(), device.timeout)
+                    if not client.connected:
+                        raise ConnectionError(f"Cannot connect to {device.host}:{device.port}")
+                values = {}
+                for block in device.blocks:
+                    values.update(await asyncio.wait_for(self._read(client, device, block), device.timeout))
+        except (asyncio.TimeoutError, ConnectionError, OSError, ModbusException) as e:
+            error = str(e) or type(e).__name__
+            device.failures += 1
+            device.last_error = error
+            opened = device.breaker.failure(now)
+            if isinstance(e, asyncio.TimeoutError):
+                client.close()  # Drop the connection so a late response can't answer the next request
+            if self.on_failure:
+                self.on_failure(device, error, opened)
+            return
+
+        latency_ms = (time.monotonic() - started) * 1000.0
+        device.breaker.success()
+        device.polls += 1
+        device.last_poll = now
+        device.last_latency_ms = round(latency_ms, 3)
+        device.last_error = None
+        device.values = values
+        if self.on_reading:
+            self.on_reading(device, values, latency_ms)
+
+    async def _read(self, client, device, block):
+        method, _, is_bits = TABLES[block.table]
+        device.requests += 1
+        response = await getattr(client, method)(block.address, count=block.count, **{UNIT_KWARG: device.unit_id})
+        if response.isError():
+            raise ModbusException(f"{block.table} {block.address}+{block.count}: {response}")
+        data = response.bits if is_bits else response.registers
+        values = {}
+        for point in block.points:
+            offset = point.address - block.address
+            chunk = data[offset:offset + point.count]
+            if is_bits:
+                chunk = [bool(bit) for bit in chunk]
+            values[point.name] = chunk[0] if point.count == 1 else list(chunk)
+        return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll the configured Modbus devices and print readings")
+    parser.add_argument("config", nargs="?", default=DEFAULT_CONFIG)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to poll before exiting")
+    args = parser.parse_args(argv)
+
+    def show_reading(device, values, latency_ms):
+        print(f"{device.name}: {values} ({latency_ms:.1f} ms)")
+
+    def show_failure(device, error, opened):
+        print(f"{device.name}: {error}{' (circuit open)' if opened else ''}")
+
+    poller = ModbusPoller(load_config(args.config), show_reading, show_failure)
+    poller.start()
+    try:
+        time.sleep(args.duration)
+    finally:
+        poller.stop()
+    for status in poller.status():
+        print(f"{status['name']}: {status['polls']} polls, {status['failures']} failures, "
+              f"{status['requests_per_poll']} requests/poll, breaker {status['breaker']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+import base64
+import ipaddress
+import json
+import os
+import struct
+from bisect import bisect_right
+
+from .decoder import decode_frame
+from .pcap_reader import GLOBAL_HEADER_SIZE, RECORD_HEADER_SIZE, COMPRESSED_SUFFIX, read_header, iter_records, \
+    open_pcap, PcapFormatError
+from .sketches import hash64
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+_ADDR = struct.Struct('!I')
+# Microsecond little-endian header for Ethernet frames, used when an extract has no file to copy one from
+EMPTY_PCAP_HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+
+
+def index_path(pcap_file):
+    """Sidecar path; offsets are uncompressed, so a capture keeps its index when archived"""
+    if pcap_file.endswith(COMPRESSED_SUFFIX):
+        pcap_file = pcap_file[:-len(COMPRESSED_SUFFIX)]
+    return pcap_file + INDEX_SUFFIX
+
+
+def host_key(addr):
+    """Bloom filter key for an IPv4 address given as an int or a string"""
+    if isinstance(addr, str):
+        addr = int(ipaddress.IPv4Address(addr))
+    return _ADDR.pack(addr)
+
+
+class BloomFilter:
+    """Fixed-size set membership test with no false negatives"""
+
+    def __init__(self, bits=65536, hashes=4, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray(bits // 8)
+
+    def _positions(self, key):
+        h = hash64(key)
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for bit in self._positions(key):
+            self.data[bit >> 3] |= 1 << (bit & 7)
+
+    def __contains__(self, key):
+        return all(self.data[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(key))
+
+    def update(self, other):
+        """Union with a filter of the same size and hash count"""
+        if (other.bits, other.hashes) != (self.bits, self.hashes):
+            raise ValueError("Cannot merge Bloom filters of different shapes")
+        self.data = bytearray(a | b for a, b in zip(self.data, other.data))
+
+
+class HostSet:
+    """Every IPv4 host an analysis saw, in bounded memory
+
+    The first `limit` addresses are kept exactly. Every address also goes into a
+    Bloom filter, so past the limit membership tests still have no false negatives
+    (only occasional false positives).
+    """
+
+    def __init__(self, limit=1024, bloom_bits=65536, bloom_hashes=4, cache_size=65536):
+        self.limit = limit
+        self.cache_size = cache_size
+        self.exact = set()
+        self.complete = True
+        self.filter = BloomFilter(bloom_bits, bloom_hashes)
+        self._cache = set()  # Recent addresses past the limit, so repeats skip the hashing
+
+    def add(self, addr):
+        """Add an IPv4 address given as an int"""
+        if addr in self.exact or addr in self._cache:
+            return
+        if len(self.exact) < self.limit:
+            self.exact.add(addr)
+        else:
+            self.complete = False
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache.add(addr)
+        self.filter.add(_ADDR.pack(addr))
+
+    def update(self, other):
+        self.filter.update(other.filter)
+        self.complete = self.complete and other.complete
+        for addr in other.exact:
+            if addr not in self.exact:
+                if len(self.exact) >= self.limit:
+                    self.complete = False
+                    break
+                self.exact.add(addr)
+
+    def __contains__(self, ip):
+        return host_key(ip) in self.filter
+
+    def to_dict(self):
+        """Report form: the exact address list while complete, the Bloom filter after that"""
+        if self.complete:
+            return {"complete": True, "ips": [str(ipaddress.IPv4Address(addr)) for addr in sorted(self.exact)]}
+        return {
+            "complete": False,
+            "bloom_bits": self.filter.bits,
+            "bloom_hashes": self.filter.hashes,
+            "bloom": base64.b64encode(bytes(self.filter.data)).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, data, limit=1024):
+        if data.get("complete"):
+            hosts = cls(limit)
+            for ip in data["ips"]:
+                hosts.add(int(ipaddress.IPv4Address(ip)))
+            return hosts
+        hosts = cls(limit, data["bloom_bits"], data["bloom_hashes"])
+        hosts.filter.data = bytearray(base64.b64decode(data["bloom"]))
+        hosts.complete = False
+        return hosts
+
+
+class PcapIndex:
+    """Sparse timestamp -> byte offset index plus a host bloom filter for one PCAP file
+
+    One entry is kept per `interval` seconds of capture time, pointing at the first
+    record of that interval, so a time window can be read without scanning the file
+    from the start.
+    """
+
+    def __init__(self, interval=1.0, bloom_bits=65536, bloom_hashes=4):
+        self.interval = interval
+        self.timestamps = []
+        self.offsets = []
+        self.hosts = BloomFilter(bloom_bits, bloom_hashes)
+        self._seen_hosts = set()
+        self.packet_count = 0
+        self.first_ts = None
+        self.last_ts = None
+
+    def add(self, offset, ts, hosts=()):
+        """Record one packet written at byte offset; hosts are IPv4 ints or strings"""
+        if not self.timestamps or ts - self.timestamps[-1] >= self.interval:
+            self.timestamps.append(ts)
+            self.offsets.append(offset)
+        for addr in hosts:
+            if addr is not None and addr not in self._seen_hosts:
+                self._seen_hosts.add(addr)
+                self.hosts.add(host_key(addr))
+        self.packet_count += 1
+        if self.first_ts is None or ts < self.first_ts:
+            self.first_ts = ts
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+
+    def may_contain(self, ip):
+        return host_key(ip) in self.hosts
+
+    def overlaps(self, start_ts, end_ts):
+        if self.first_ts is None:
+            return False
+        return (start_ts is None or self.last_ts >= start_ts) and (end_ts is None or self.first_ts <= end_ts)
+
+    def seek_offset(self, start_ts):
+        """Byte offset of the last index entry at or before start_ts"""
+        if start_ts is None or not self.timestamps:
+            return GLOBAL_HEADER_SIZE
+        position = bisect_right(self.timestamps, start_ts) - 1
+        return self.offsets[position] if position >= 0 else GLOBAL_HEADER_SIZE
+
+    def save(self, path):
+        data = {
+            "version": INDEX_VERSION,
+            "interval": self.interval,
+            "packet_count": self.packet_count,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "entries": list(zip(self.timestamps, self.offsets)),
+            "bloom_bits": self.hosts.bits,
+            "bloom_hashes": self.hosts.hashes,
+            "bloom": base64.b64encode(bytes(self.hosts.data)).decode('ascii')
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in {path}")
+        index = cls(data["interval"], data["bloom_bits"], data["bloom_hashes"])
+        index.hosts.data = bytearray(base64.b64decode(data["bloom"]))
+        index.timestamps = [entry[0] for entry in data["entries"]]
+        index.offsets = [entry[1] for entry in data["entries"]]
+        index.packet_count = data["packet_count"]
+        index.first_ts = data["first_ts"]
+        index.last_ts = data["last_ts"]
+        return index
+
+
+def build_index(pcap_file, interval=1.0):
+    """Index an existing PCAP by reading it once, and save the sidecar file next to it"""
+    index = PcapIndex(interval)
+    with open_pcap(pcap_file) as fh:
+        header = read_header(fh)
+        for data, ts, offset in iter_records(fh, header):
+            frame = decode_frame(data, ts)
+            index.add(offset, ts, (frame.src_addr, frame.dst_addr))
+    index.save(index_path(pcap_file))
+    return index
+
+
+def load_index(pcap_file, build=True):
+    """The sidecar index for pcap_file, (re)building it when missing or unreadable"""
+    path = index_path(pcap_file)
+    try:
+        return PcapIndex.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        if not build:
+            return None
+        if os.path.exists(path):
+            print(f"Rebuilding index for {pcap_file}: {e}")
+        return build_index(pcap_file)
+
+
+def _matches(frame, addr, port):
+    if addr is not None and frame.src_addr != addr and frame.dst_addr != addr:
+        return False
+    if port is not None and frame.sport != port and frame.dport != port:
+        return False
+    return True
+
+
+def _first_header(pcap_files):
+    """Global header of the first readable file in pcap_files, else EMPTY_PCAP_HEADER"""
+    for pcap_file in pcap_files:
+        try:
+            with open_pcap(pcap_file) as fh:
+                global_header = fh.read(GLOBAL_HEADER_SIZE)
+                fh.seek(0)
+                read_header(fh)
+            return global_header
+        except (OSError, PcapFormatError):
+            continue
+    return EMPTY_PCAP_HEADER
+
+
+def extract_pcap(pcap_files, start_ts=None, end_ts=None, ip=None, port=None):
+    """Yield the bytes of one PCAP holding the matching packets from pcap_files, in order
+
+    Each file's index is used to skip files outside the window or (via the bloom
+    filter) without the host, and to seek straight to the first relevant interval.
+    The output always starts with a global header, so an extract that matches
+    nothing is still a valid, empty PCAP.
+    """
+    addr = int(ipaddress.IPv4Address(ip)) if ip else None
+    filtered = addr is not None or port is not None
+    header_sent = None
+
+    for pcap_file in pcap_files:
+        try:
+            index = load_index(pcap_file)
+        except FileNotFoundError:
+            print(f"Skipping {pcap_file}: deleted before it could be extracted")
+            continue
+        if not index.overlaps(start_ts, end_ts):
+            continue
+        if ip and header_sent is not None and not index.may_contain(ip):
+            continue
+
+        try:
+            fh = open_pcap(pcap_file)
+        except FileNotFoundError:
+            print(f"Skipping {pcap_file}: deleted before it could be extracted")
+            continue
+        with fh:
+            global_header = fh.read(GLOBAL_HEADER_SIZE)
+            fh.seek(0)
+            header = read_header(fh)
+            # Records are copied verbatim, so every file must share byte order, precision and link type
+            file_format = (global_header[:4], header.linktype)
+            if header_sent is None:
+                header_sent = file_format
+                yield global_header
+            elif file_format != header_sent:
+                print(f"Skipping {pcap_file}: PCAP format differs from the first file in the extract")
+                continue
+            if ip and not index.may_contain(ip):
+                continue  # Only opened to emit the global header
+
+            # Records are only roughly time-ordered; allow one index interval of slack
+            stop_ts = end_ts + index.interval if end_ts is not None else None
+            records = iter_records(fh, header, index.seek_offset(start_ts), with_header=True)
+            for record, ts, _ in records:
+                if stop_ts is not None and ts > stop_ts:
+                    break
+                if (start_ts is not None and ts < start_ts) or (end_ts is not None and ts > end_ts):
+                    continue
+                if filtered and not _matches(decode_frame(record[RECORD_HEADER_SIZE:], ts), addr, port):
+                    continue
+                yield record
+
+    if header_sent is None:
+        yield _first_header(pcap_files)
@@ -1,16 +1,216 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from .analysis import new_analysis, analyze_frame, score_frames, merge_analysis, \
+    generate_security_recommendations, generate_report, REPORT_SUFFIXES
+from .decoder import decode_frame
+from .assets import DEFAULT_INVENTORY, load_inventory
+from .rules import RuleEngine, default_rules
+from .flows import FlowTable
+from .baseline import ModbusBaseline
+from .pcap_reader import COMPRESSED_SUFFIX, iter_pcap, split_pcap, overlap_start, lock_shared
+from .catalog import Catalog
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CAPTURE_DIR = os.path.join(BASE_DIR, "data", "pcaps")
+DEFAULT_REPORTS_DIR = os.path.join(BASE_DIR, "data", "reports")
+DEFAULT_CATALOG_DB = os.path.join(BASE_DIR, "data", "catalog.db")
+# Records before a chunk replayed to warm up its windows; covers the 10 s rule windows at ~3 Mbit/s
+CHUNK_OVERLAP_BYTES = 4 * 1024 * 1024
+
+
+def _capture_timestamp(pcap_file):
+    name = os.path.basename(pcap_file)
+    if name.endswith(COMPRESSED_SUFFIX):
+        name = name[:-len(COMPRESSED_SUFFIX)]
+    if name.startswith("capture_") and name.endswith(".pcap"):
+        return name[len("capture_"):-len(".pcap")]
+    return os.path.splitext(name)[0]
+
+
+def analyze_chunk(pcap_file, start=None, end=None, inventory_path=None, warmup_start=None):
+    """Analyze the records of pcap_file that start within [start, end)
+
+    With warmup_start, the records from there up to start are run through the same
+    rule engine, flow table and baseline first and then discarded, so detection
+    windows and open connections carry over the chunk boundary. Those records are
+    counted by the previous chunk, not this one.
+    """
+    inventory = load_inventory(inventory_path)
+    rule_engine = RuleEngine(default_rules(inventory=inventory))
+    flow_table = FlowTable()
+    baseline = ModbusBaseline()
+    if warmup_start is not None and start is not None and warmup_start < start:
+        warmup = new_analysis(None, rule_engine, flow_table, baseline, inventory)
+        for data, ts in iter_pcap(pcap_file, warmup_start, start):
+            analyze_frame(decode_frame(data, ts), warmup)
+        score_frames(warmup)
+
+    analysis = new_analysis(_capture_timestamp(pcap_file), rule_engine, flow_table, baseline, inventory)
+    analysis["chunks"] = 1
+    for data, ts in iter_pcap(pcap_file, start, end):
+        analyze_frame(decode_frame(data, ts), analysis)
+    score_frames(analysis)
+    # Detection, connection and baseline state stays in the worker
+    analysis.pop("rule_engine")
+    analysis.pop("flow_table")
+    analysis.pop("baseline")
+    analysis.pop("inventory")
+    return analysis
+
+
 class PcapManager:
-    def __init__(self):
-        pass
-    
+    def __init__(self, capture_dir=DEFAULT_CAPTURE_DIR, reports_dir=DEFAULT_REPORTS_DIR,
+                 workers=None, chunk_bytes=128 * 1024 * 1024, catalog=None, report_encoding="indent",
+                 inventory_path=None, overlap_bytes=CHUNK_OVERLAP_BYTES):
+        self.capture_dir = capture_dir
+        self.reports_dir = reports_dir
+        self.catalog = catalog
+        self.report_encoding = report_encoding
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_bytes = chunk_bytes
+        self.overlap_bytes = overlap_bytes
+        self.inventory_path = inventory_path
+        self.capture_active = False
+        self.current_pcap = None
+
     def analyze_pcap(self, pcap_file):
-        # Add your pcap analysis logic here
-        pass
-    
+        """Stream one PCAP through the analysis pipeline in this process"""
+        analysis = analyze_chunk(pcap_file, inventory_path=self.inventory_path)
+        generate_security_recommendations(analysis)
+        return analysis
+
+    def list_captures(self):
+        return sorted(
+            os.path.join(self.capture_dir, f)
+            for f in os.listdir(self.capture_dir) if f.endswith(('.pcap', '.pcap' + COMPRESSED_SUFFIX))
+        )
+
+    def analyze_files(self, pcap_files=None, combined=False):
+        """Analyze PCAPs in parallel, splitting large files into chunks across a process pool
+
+        Each chunk replays the overlap_bytes before it to warm up its rule windows and
+        flows, but Modbus baselines still start learning afresh in every chunk, so a
+        split file can score differently from a single pass; the number of chunks is
+        kept in analysis["chunks"]. With one worker, files are not split.
+        Returns {pcap_file: analysis}, or a single merged analysis when combined is set.
+        """
+        pcap_files = list(pcap_files) if pcap_files else self.list_captures()
+        # Read-locked for the whole job, so retention leaves them alone between chunks
+        locks = []
+        try:
+            for pcap_file in pcap_files:
+                locks.append(lock_shared(pcap_file))
+            return self._analyze_locked([lock.name for lock in locks], combined)
+        finally:
+            for lock in locks:
+                lock.close()
+
+    def _analyze_locked(self, pcap_files, combined):
+        tasks = []
+        for pcap_file in pcap_files:
+            if self.workers > 1:
+                ranges = split_pcap(pcap_file, self.chunk_bytes)
+            else:
+                ranges = [(None, None)]
+            for start, end in ranges:
+                warmup_start = overlap_start(pcap_file, start, self.overlap_bytes) if start else None
+                tasks.append((pcap_file, start, end, self.inventory_path, warmup_start))
+
+        results = {}
+        if self.workers > 1 and len(tasks) > 1:
+            # Spawned, like the capture pipeline, so workers don't inherit the app's threads and locks
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks)),
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [(task[0], pool.submit(analyze_chunk, *task)) for task in tasks]
+                for pcap_file, future in futures:
+                    self._merge_partial(results, pcap_file, future.result())
+        else:
+            for task in tasks:
+                self._merge_partial(results, task[0], analyze_chunk(*task))
+
+        if combined:
+            merged = new_analysis(datetime.now().strftime("%Y%m%d_%H%M%S"))
+            for analysis in results.values():
+                merge_analysis(merged, analysis)
+            generate_security_recommendations(merged)
+            return merged
+
+        for analysis in results.values():
+            generate_security_recommendations(analysis)
+        return results
+
+    @staticmethod
+    def _merge_partial(results, pcap_file, partial):
+        if pcap_file in results:
+            merge_analysis(results[pcap_file], partial)
+        else:
+            results[pcap_file] = partial
+
+    def reanalyze(self, pcap_files=None, combined=False, overwrite=False):
+        """Re-analyze stored captures and write reports; returns the report paths
+
+        Per-file reports get a _reanalyzed_<now> suffix so the report written at
+        capture time is kept, unless overwrite is set.
+        """
+        pcap_files = list(pcap_files) if pcap_files else self.list_captures()
+        if not pcap_files:
+            return []
+        os.makedirs(self.reports_dir, exist_ok=True)
+        suffix = "" if overwrite else "_reanalyzed_" + datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if combined:
+            analysis = self.analyze_files(pcap_files, combined=True)
+            report_file = os.path.join(self.reports_dir, f"report_combined_{analysis['timestamp']}{REPORT_SUFFIXES[self.report_encoding]}")
+            self._write_report(analysis, f"{len(pcap_files)} files", report_file)
+            return [report_file]
+
+        report_files = []
+        for pcap_file, analysis in self.analyze_files(pcap_files).items():
+            report_file = os.path.join(self.reports_dir, f"report_{analysis['timestamp']}{suffix}{REPORT_SUFFIXES[self.report_encoding]}")
+            self._write_report(analysis, pcap_file, report_file)
+            report_files.append(report_file)
+        return report_files
+
+    def _write_report(self, analysis, pcap_file, report_file):
+        report_data = generate_report(analysis, pcap_file, report_file, self.report_encoding,
+                                      load_inventory(self.inventory_path))
+        if self.catalog is not None:
+            self.catalog.add_report(report_file, report_data)
+
     def start_capture(self):
         self.capture_active = True
-    
+
     def stop_capture(self):
         self.capture_active = False
-    
+
     def get_current_pcap(self):
-        return self.current_pcap
\ No newline at end of file
+        return self.current_pcap
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-analyze stored PCAP captures")
+    parser.add_argument("pcap_files", nargs="*", help="PCAP files (default: every capture in data/pcaps)")
+    parser.add_argument("--combined", action="store_true", help="Write one merged report instead of one per file")
+    parser.add_argument("--workers", type=int, default=None, help="Analysis processes (default: CPU count)")
+    parser.add_argument("--reports-dir", default=DEFAULT_REPORTS_DIR)
+    parser.add_argument("--report-encoding", choices=sorted(REPORT_SUFFIXES), default="indent")
+    parser.add_argument("--inventory", default=DEFAULT_INVENTORY, help="Asset inventory JSON (skipped if missing)")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Replace the capture-time reports instead of writing *_reanalyzed_<now> ones")
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(DEFAULT_CATALOG_DB) if os.path.isdir(os.path.dirname(DEFAULT_CATALOG_DB)) else None
+    manager = PcapManager(reports_dir=args.reports_dir, workers=args.workers, catalog=catalog,
+                          report_encoding=args.report_encoding, inventory_path=args.inventory)
+    started = datetime.now()
+    report_files = manager.reanalyze(args.pcap_files, combined=args.combined, overwrite=args.overwrite)
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"Wrote {len(report_files)} report(s) in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+import fcntl
+import gzip
+import os
+import struct
+from bisect import bisect_right
+
+_MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+
+GLOBAL_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+_READ_SIZE = 1024 * 1024
+
+COMPRESSED_SUFFIX = ".gz"
+# Chunk-framed gzip: every member carries its own compressed size in an FEXTRA
+# subfield (like BGZF), so member boundaries can be found without decompressing
+GZIP_MEMBER_HEADER = struct.Struct('<4sIBBH2sHI')  # magic+flags, mtime, xfl, os, xlen, subfield id, len, size
+GZIP_CHUNK_ID = b'SC'
+
+
+class PcapFormatError(Exception):
+    pass
+
+
+class PcapHeader:
+    """Global header fields of a classic libpcap file"""
+    __slots__ = ('endian', 'ts_scale', 'snaplen', 'linktype', 'record')
+
+    def __init__(self, endian, ts_scale, snaplen, linktype):
+        self.endian = endian
+        self.ts_scale = ts_scale
+        self.snaplen = snaplen
+        self.linktype = linktype
+        self.record = struct.Struct(endian + 'IIII')
+
+
+def read_header(fh):
+    raw = fh.read(GLOBAL_HEADER_SIZE)
+    if len(raw) < GLOBAL_HEADER_SIZE or raw[:4] not in _MAGICS:
+        raise PcapFormatError("Not a libpcap file")
+    endian, ts_scale = _MAGICS[raw[:4]]
+    snaplen, linktype = struct.unpack(endian + 'II', raw[16:24])
+    return PcapHeader(endian, ts_scale, snaplen, linktype)
+
+
+def iter_records(fh, header, start=GLOBAL_HEADER_SIZE, end=None, with_header=False):
+    """Yield (data, ts, offset) for each record starting in [start, end)
+
+    The file is read in large blocks and frames are sliced out of them, so memory
+    use does not depend on the file size. With with_header set, data includes the
+    16-byte record header so records can be copied out verbatim.
+    """
+    skip = 0 if with_header else RECORD_HEADER_SIZE
+    unpack_from = header.record.unpack_from
+    ts_scale = header.ts_scale
+    offset = start
+    fh.seek(start)
+    buf = b''
+    pos = 0
+
+    while end is None or offset < end:
+        if len(buf) - pos < RECORD_HEADER_SIZE:
+            buf = buf[pos:] + fh.read(_READ_SIZE)
+            pos = 0
+            if len(buf) < RECORD_HEADER_SIZE:
+                return
+        ts_sec, ts_frac, caplen, _ = unpack_from(buf, pos)
+        record_end = pos + RECORD_HEADER_SIZE + caplen
+        if record_end > len(buf):
+            buf = buf[pos:] + fh.read(max(_READ_SIZE, caplen + RECORD_HEADER_SIZE))
+            pos = 0
+            if RECORD_HEADER_SIZE + caplen > len(buf):
+                return  # Truncated final record
+            continue
+
+        yield buf[pos + skip:record_end], ts_sec + ts_frac * ts_scale, offset
+        offset += record_end - pos
+        pos = record_end
+
+
+def gzip_chunks(fh):
+    """([(uncompressed_offset, compressed_offset)] per member, uncompressed size) of a chunk-framed gzip
+
+    Returns None for gzip files written without chunk framing.
+    """
+    chunks = []
+    fh.seek(0, os.SEEK_END)
+    size = fh.tell()
+    compressed = uncompressed = 0
+    while compressed < size:
+        fh.seek(compressed)
+        raw = fh.read(GZIP_MEMBER_HEADER.size)
+        if len(raw) < GZIP_MEMBER_HEADER.size:
+            return None
+        magic, _, _, _, _, subfield, _, member_size = GZIP_MEMBER_HEADER.unpack(raw)
+        if magic != b'\x1f\x8b\x08\x04' or subfield != GZIP_CHUNK_ID or member_size < GZIP_MEMBER_HEADER.size + 8:
+            return None
+        fh.seek(compressed + member_size - 4)
+        chunks.append((uncompressed, compressed))
+        uncompressed += struct.unpack('<I', fh.read(4))[0]
+        compressed += member_size
+    return chunks, uncompressed
+
+
+class ChunkedGzipReader:
+    """Seekable read-only file object over a compressed capture
+
+    Seeking jumps to the member holding the target offset and decompresses from
+    there, so reading a window costs at most one chunk of wasted work. Plain gzip
+    files work too, but every backwards seek restarts from the beginning.
+    """
+
+    def __init__(self, path):
+        self.raw = lock_shared(path)
+        framing = gzip_chunks(self.raw)
+        self.chunks, self.size = framing if framing is not None else ([(0, 0)], None)
+        self._starts = [chunk[0] for chunk in self.chunks]
+        self._gz = None
+        self._chunk = None
+        self.pos = 0
+        self.seek(0)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence != os.SEEK_SET:
+            raise ValueError("Compressed captures only support absolute seeks")
+        chunk = bisect_right(self._starts, offset) - 1
+        if chunk != self._chunk or offset < self.pos:
+            start, compressed = self.chunks[chunk]
+            self.raw.seek(compressed)
+            self._gz = gzip.GzipFile(fileobj=self.raw, mode='rb')
+            self._chunk = chunk
+            self.pos = start
+        while self.pos < offset:
+            skipped = len(self._gz.read(min(_READ_SIZE, offset - self.pos)))
+            if not skipped:
+                break
+            self.pos += skipped
+        return self.pos
+
+    def read(self, size=-1):
+        data = self._gz.read(size)
+        self.pos += len(data)
+        return data
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def resolve_capture(path):
+    """The file currently holding a capture: path itself, or its compressed form once archived"""
+    if not path.endswith(COMPRESSED_SUFFIX) and not os.path.exists(path) \
+            and os.path.exists(path + COMPRESSED_SUFFIX):
+        return path + COMPRESSED_SUFFIX
+    return path
+
+
+def lock_shared(path):
+    """Open a capture (or report) under a shared lock, held until the file is closed
+
+    Retention takes the exclusive lock before compressing or deleting a file and
+    skips files it can't lock, so readers in any process never lose a file mid-read.
+    A reader that waited out a compression reopens the .gz that replaced the file.
+    """
+    for _ in range(3):
+        fh = open(resolve_capture(path), 'rb')
+        fcntl.flock(fh, fcntl.LOCK_SH)
+        try:
+            if os.path.samestat(os.fstat(fh.fileno()), os.stat(fh.name)):
+                return fh
+        except FileNotFoundError:
+            pass
+        fh.close()
+    raise FileNotFoundError(f"{path} was replaced while opening it")
+
+
+def lock_exclusive(path):
+    """Open path under an exclusive lock before replacing or deleting it; None while it has readers"""
+    fh = open(path, 'rb')
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        fh.close()
+        return None
+    return fh
+
+
+def open_pcap(path):
+    """Binary file object for a plain or compressed (.pcap.gz) capture, read-locked while open"""
+    path = resolve_capture(path)
+    if path.endswith(COMPRESSED_SUFFIX):
+        return ChunkedGzipReader(path)
+    return lock_shared(path)
+
+
+def pcap_size(path):
+    """Uncompressed size of a capture in bytes"""
+    path = resolve_capture(path)
+    if not path.endswith(COMPRESSED_SUFFIX):
+        return os.path.getsize(path)
+    with ChunkedGzipReader(path) as reader:
+        if reader.size is None:
+            while reader.read(_READ_SIZE):
+                pass
+            return reader.tell()
+        return reader.size
+
+
+def iter_pcap(path, start=None, end=None):
+    """Stream (data, ts) pairs from a plain or compressed PCAP, optionally limited to a byte range"""
+    with open_pcap(path) as fh:
+        header = read_header(fh)
+        if start is None or start < GLOBAL_HEADER_SIZE:
+            start = GLOBAL_HEADER_SIZE
+        for data, ts, _ in iter_records(fh, header, start, end):
+            yield data, ts
+
+
+def _plausible(header, raw, pos, first_ts):
+    ts_sec, ts_frac, caplen, length = header.record.unpack_from(raw, pos)
+    return (caplen <= header.snaplen and caplen <= length <= 262144
+            and ts_frac < (1000000 if header.ts_scale == 1e-6 else 1000000000)
+            and first_ts - 1 <= ts_sec <= first_ts + 366 * 86400)
+
+
+def _resync(fh, header, offset, first_ts, chain=3):
+    """Find the first record boundary at or after offset by chaining plausible headers"""
+    fh.seek(offset)
+    raw = fh.read(_READ_SIZE)
+    limit = len(raw) - RECORD_HEADER_SIZE
+    for pos in range(0, max(0, limit) + 1):
+        cursor = pos
+        for _ in range(chain):
+            if cursor > limit:
+                break
+            if not _plausible(header, raw, cursor, first_ts):
+                break
+            caplen = header.record.unpack_from(raw, cursor)[2]
+            cursor += RECORD_HEADER_SIZE + caplen
+        else:
+            return offset + pos
+        if cursor > limit and cursor != pos:
+            return offset + pos  # Ran off the buffer while every header checked out
+    return None
+
+
+def split_pcap(path, chunk_bytes):
+    """Split a PCAP into [(start, end)] byte ranges that begin on record boundaries"""
+    path = resolve_capture(path)
+    if path.endswith(COMPRESSED_SUFFIX):
+        return _split_compressed(path, chunk_bytes)
+    size = os.path.getsize(path)
+    if size <= GLOBAL_HEADER_SIZE + chunk_bytes:
+        return [(GLOBAL_HEADER_SIZE, size)]
+
+    with open(path, 'rb') as fh:
+        header = read_header(fh)
+        first = fh.read(RECORD_HEADER_SIZE)
+        if len(first) < RECORD_HEADER_SIZE:
+            return [(GLOBAL_HEADER_SIZE, size)]
+        first_ts = header.record.unpack(first)[0]
+
+        boundaries = [GLOBAL_HEADER_SIZE]
+        target = GLOBAL_HEADER_SIZE + chunk_bytes
+        while target < size:
+            boundary = _resync(fh, header, target, first_ts)
+            if boundary is None or boundary >= size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+            target = boundary + chunk_bytes
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def overlap_start(path, start, overlap_bytes):
+    """Record boundary about overlap_bytes before start, where a chunk's warm-up replay begins"""
+    target = start - overlap_bytes
+    if target <= GLOBAL_HEADER_SIZE:
+        return GLOBAL_HEADER_SIZE
+    path = resolve_capture(path)
+    if path.endswith(COMPRESSED_SUFFIX):
+        with ChunkedGzipReader(path) as reader:
+            starts = [chunk[0] for chunk in reader.chunks if chunk[0] <= target]
+        return max(starts[-1] if starts else 0, GLOBAL_HEADER_SIZE)
+    with open(path, 'rb') as fh:
+        header = read_header(fh)
+        first_ts = header.record.unpack(fh.read(RECORD_HEADER_SIZE))[0]
+        boundary = _resync(fh, header, target, first_ts)
+    return boundary if boundary is not None and boundary < start else start
+
+
+def _split_compressed(path, chunk_bytes):
+    """Compressed members already start on record boundaries, so ranges are whole members"""
+    with ChunkedGzipReader(path) as reader:
+        starts, size = [chunk[0] for chunk in reader.chunks], reader.size
+    if size is None:
+        return [(GLOBAL_HEADER_SIZE, None)]
+    boundaries = [GLOBAL_HEADER_SIZE]
+    for start in starts[1:]:
+        if start - boundaries[-1] >= chunk_bytes:
+            boundaries.append(start)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
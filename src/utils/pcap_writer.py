@@ -0,0 +1,138 @@
+import os
+import struct
+import time
+from datetime import datetime
+
+from .pcap_index import PcapIndex, index_path
+
+PCAP_MAGIC = 0xa1b2c3d4
+LINKTYPE_ETHERNET = 1
+
+_GLOBAL_HEADER = struct.Struct('<IHHiIII')
+_RECORD_HEADER = struct.Struct('<IIII')
+
+
+def write_pcap(path, frames, snaplen=65535, linktype=LINKTYPE_ETHERNET):
+    """Write (data, ts) pairs to a single PCAP file; returns the number of records"""
+    count = 0
+    with open(path, 'wb', buffering=1024 * 1024) as fh:
+        fh.write(_GLOBAL_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, snaplen, linktype))
+        for data, ts in frames:
+            caplen = min(len(data), snaplen)
+            seconds = int(ts)
+            fh.write(_RECORD_HEADER.pack(seconds, int((ts - seconds) * 1000000), caplen, len(data)))
+            fh.write(data[:caplen])
+            count += 1
+    return count
+
+
+class RotatingPcapWriter:
+    """Stream raw frames into a series of PCAP files, rolling over by size or age"""
+
+    def __init__(self, directory, prefix="capture", max_bytes=64 * 1024 * 1024,
+                 max_seconds=300, snaplen=65535, linktype=LINKTYPE_ETHERNET,
+                 on_rotate=None, index_interval=1.0):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.snaplen = snaplen
+        self.linktype = linktype
+        self.on_rotate = on_rotate
+        self.index_interval = index_interval
+
+        self.current_file = None
+        self._fh = None
+        self._opened_at = 0
+        self._bytes_written = 0
+        self._packet_count = 0
+        self._first_ts = None
+        self._last_ts = None
+        self._index = None
+
+    def _next_path(self):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, f"{self.prefix}_{stamp}.pcap")
+        sequence = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{self.prefix}_{stamp}_{sequence}.pcap")
+            sequence += 1
+        return path
+
+    def _open(self):
+        self.current_file = self._next_path()
+        self._fh = open(self.current_file, 'wb', buffering=1024 * 1024)
+        self._fh.write(_GLOBAL_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, self.snaplen, self.linktype))
+        self._opened_at = time.monotonic()
+        self._bytes_written = _GLOBAL_HEADER.size
+        self._packet_count = 0
+        self._first_ts = None
+        self._last_ts = None
+        self._index = PcapIndex(self.index_interval) if self.index_interval else None
+
+    def write(self, data, ts=None, hosts=(), orig_len=None):
+        """Append one raw frame, opening or rotating the output file as needed
+
+        hosts are the frame's IPv4 addresses, recorded in the file's sidecar index.
+        orig_len is the on-the-wire length when data was truncated at capture.
+        """
+        if self._fh is None:
+            self._open()
+        if ts is None:
+            ts = time.time()
+
+        caplen = min(len(data), self.snaplen)
+        if self._index is not None:
+            self._index.add(self._bytes_written, ts, hosts)
+        seconds = int(ts)
+        self._fh.write(_RECORD_HEADER.pack(seconds, int((ts - seconds) * 1000000), caplen,
+                                           max(len(data), orig_len or 0)))
+        self._fh.write(data[:caplen])
+
+        self._bytes_written += _RECORD_HEADER.size + caplen
+        self._packet_count += 1
+        if self._first_ts is None:
+            self._first_ts = ts
+        self._last_ts = ts
+
+        if self._bytes_written >= self.max_bytes:
+            self.rotate()
+
+    def maybe_rotate(self):
+        """Roll over the current file if it has been open longer than max_seconds"""
+        if self._fh is not None and time.monotonic() - self._opened_at >= self.max_seconds:
+            self.rotate()
+
+    def rotate(self):
+        """Close the current file and notify on_rotate; the next write opens a new one"""
+        if self._fh is None:
+            return
+        self._fh.close()
+        index_file = None
+        if self._index is not None:
+            index_file = index_path(self.current_file)
+            try:
+                self._index.save(index_file)
+            except OSError as e:
+                print(f"PCAP index write error: {e}")
+                index_file = None
+        closed = {
+            "pcap_file": self.current_file,
+            "packet_count": self._packet_count,
+            "size": self._bytes_written,
+            "first_ts": self._first_ts,
+            "last_ts": self._last_ts,
+            "index_file": index_file
+        }
+        self._fh = None
+        self._index = None
+        self.current_file = None
+
+        if self.on_rotate:
+            try:
+                self.on_rotate(closed)
+            except Exception as e:
+                print(f"PCAP rotation callback error: {e}")
+
+    def close(self):
+        self.rotate()
@@ -0,0 +1,550 @@
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from .analysis import new_analysis, analyze_frame, score_frames, merge_analysis, RISK_SEVERITIES
+from .baseline import ModbusBaseline
+from .decoder import decode_frame, peek_flow
+from .event_store import format_ts
+from .flows import FlowTable
+from .metrics import counter, gauge
+from .rules import RuleEngine, ThreatAggregator, default_rules, SEVERITY_RISK
+from .assets import load_inventory
+
+_POSITIONS = struct.Struct('<Q')
+_RECORD = struct.Struct('<Id')  # length, timestamp
+_WRITE_POS = 0
+_READ_POS = 64  # Separate cache line from the producer's counter
+_HEADER_SIZE = 128
+
+_WRAP = 0xffffffff   # Rest of the buffer is unused; continue at offset 0
+_MARKER = 0xfffffffe  # Epoch boundary; the timestamp field carries the epoch number
+
+
+class ShmRing:
+    """Single-producer, single-consumer byte ring in shared memory
+
+    The producer only advances the write counter and the consumer only the read
+    counter, each after its data is in place, so no lock is needed. Counters are
+    aligned 8-byte fields that only ever grow; offsets are taken modulo capacity.
+    """
+
+    def __init__(self, capacity=None, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + capacity)
+            self.shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.capacity = self.shm.size - _HEADER_SIZE if capacity is None else capacity
+        self.buf = self.shm.buf
+        self.data = self.shm.buf[_HEADER_SIZE:_HEADER_SIZE + self.capacity]
+
+    def _load(self, position):
+        return _POSITIONS.unpack_from(self.buf, position)[0]
+
+    def _store(self, position, value):
+        _POSITIONS.pack_into(self.buf, position, value)
+
+    def free_space(self):
+        return self.capacity - (self._load(_WRITE_POS) - self._load(_READ_POS))
+
+    def _reserve(self, write, read, need):
+        """Write position for a record of need bytes, wrapping if required; None when full"""
+        capacity = self.capacity
+        offset = write % capacity
+        tail = capacity - offset
+        if tail < need:
+            if capacity - (write - read) < tail + need:
+                return None
+            if tail >= _RECORD.size:
+                _RECORD.pack_into(self.data, offset, _WRAP, 0.0)
+            write += tail
+        elif capacity - (write - read) < need:
+            return None
+        return write
+
+    def put_batch(self, frames):
+        """Append (data, ts) pairs; returns how many fit (the rest are the caller's to drop)"""
+        data = self.data
+        capacity = self.capacity
+        read = self._load(_READ_POS)
+        write = self._load(_WRITE_POS)
+        written = 0
+        for frame, ts in frames:
+            need = _RECORD.size + len(frame)
+            position = self._reserve(write, read, need)
+            if position is None:
+                break
+            offset = position % capacity
+            _RECORD.pack_into(data, offset, len(frame), ts)
+            data[offset + _RECORD.size:offset + need] = frame
+            write = position + need
+            written += 1
+        self._store(_WRITE_POS, write)
+        return written
+
+    def put_marker(self, epoch, timeout=5.0):
+        """Append an epoch boundary, waiting for space; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            write = self._load(_WRITE_POS)
+            position = self._reserve(write, self._load(_READ_POS), _RECORD.size)
+            if position is not None:
+                _RECORD.pack_into(self.data, position % self.capacity, _MARKER, float(epoch))
+                self._store(_WRITE_POS, position + _RECORD.size)
+                return True
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+
+    def get_batch(self, max_items=256):
+        """Pop up to max_items records: (data, ts) for frames, (None, epoch) for markers"""
+        data = self.data
+        capacity = self.capacity
+        write = self._load(_WRITE_POS)
+        read = self._load(_READ_POS)
+        items = []
+        while read < write and len(items) < max_items:
+            offset = read % capacity
+            if capacity - offset < _RECORD.size:
+                read += capacity - offset
+                continue
+            length, ts = _RECORD.unpack_from(data, offset)
+            if length == _WRAP:
+                read += capacity - offset
+            elif length == _MARKER:
+                items.append((None, int(ts)))
+                read += _RECORD.size
+            else:
+                start = offset + _RECORD.size
+                items.append((bytes(data[start:start + length]), ts))
+                read += _RECORD.size + length
+        self._store(_READ_POS, read)
+        return items
+
+    def close(self):
+        self.data.release()
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def shard_for(flow, shards):
+    """Shard index for a flow; symmetric, so both directions land on the same worker"""
+    if flow is None:
+        return 0
+    src, dst, sport, dport = flow
+    h = (src ^ dst) ^ ((sport ^ dport) << 16)
+    # Multiplicative hash; the range is taken from the high bits, as the low ones barely mix
+    return (((h * 2654435761) & 0xffffffff) * shards) >> 32
+
+
+def _worker_main(ring_name, shard, shards, results, settings):
+    """Analysis worker: decode, detect and track flows for one shard of the traffic"""
+    ring = ShmRing(name=ring_name)
+    inventory = load_inventory(settings["inventory_path"])
+    rule_engine = RuleEngine(default_rules(shards, inventory))
+    flow_table = FlowTable(settings["flow_capacity"], settings["flow_idle_timeout"])
+    baseline = ModbusBaseline(settings["baseline_interval"], learning=settings["baseline_learning"],
+                              max_keys=settings["baseline_max_keys"])
+    analysis = new_analysis(None, rule_engine, flow_table, baseline, inventory)
+    event_batch = settings["event_batch"]
+    event_interval = settings["event_interval"]
+    frames = []
+    events = _EventBatch(settings["event_rate"])
+    last_sent = time.monotonic()
+    idle = 0.0005
+
+    try:
+        while True:
+            items = ring.get_batch()
+            if not items:
+                time.sleep(idle)
+                idle = min(idle * 2, 0.01)
+            else:
+                idle = 0.0005
+            for data, ts in items:
+                if data is None:
+                    if ts < 0:
+                        return  # Shutdown marker
+                    # Epoch boundary: hand this shard's share of the closed file to the coordinator
+                    _frame_events(frames, analysis, events)
+                    counts = rule_engine.drain()
+                    if events.rows or events.suppressed or counts:
+                        results.put(events.message(shard, counts))
+                    analysis.pop("rule_engine")
+                    analysis.pop("flow_table")
+                    analysis.pop("baseline")
+                    analysis.pop("inventory")
+                    results.put(("partial", shard, ts, analysis))
+                    analysis = new_analysis(None, rule_engine, flow_table, baseline, inventory)
+                    continue
+                frame = decode_frame(data, ts)
+                analyze_frame(frame, analysis)
+                frames.append(frame)
+            _frame_events(frames, analysis, events)
+
+            now = time.monotonic()
+            if len(events.rows) >= event_batch or now - last_sent >= event_interval:
+                # Rate-rule counts ride along; the coordinator adds them up across shards
+                counts = rule_engine.drain()
+                if events.rows or events.suppressed or counts:
+                    results.put(events.message(shard, counts))
+                    last_sent = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+def _frame_events(frames, analysis, events):
+    """Score the batch's Modbus frames against their baselines, then turn the batch into events"""
+    if not frames:
+        return
+    score_frames(analysis)
+    for frame in frames:
+        if frame.src is not None:
+            events.add(frame)
+    frames.clear()
+
+
+class _EventBatch:
+    """A worker's pending live events, kept as tuples rather than frame_event() dicts
+
+    Tuples pickle in well under half the time, which matters because every event
+    crosses the results queue to the one coordinator thread. With a rate set,
+    Low-severity events beyond rate per second are only counted.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.rows = []
+        self.suppressed = 0
+        self._window = time.monotonic()
+        self._sent = 0
+
+    def add(self, frame):
+        severity = RISK_SEVERITIES[frame.risk]
+        if self.rate is not None:
+            now = time.monotonic()
+            if now - self._window >= 1.0:
+                self._window = now
+                self._sent = 0
+            if self._sent >= self.rate and severity == "Low":
+                self.suppressed += 1
+                return
+            self._sent += 1
+        is_modbus = frame.is_modbus
+        zones = None
+        if frame.src_zone is not None:
+            zones = (frame.src_asset.name if frame.src_asset is not None else None, frame.src_zone.name,
+                     frame.dst_asset.name if frame.dst_asset is not None else None, frame.dst_zone.name)
+        self.rows.append((
+            frame.ts, frame.src, frame.dst, "Modbus TCP" if is_modbus else frame.protocol_name, severity, frame.summary(),
+            (frame.modbus_fc, frame.modbus_unit, frame.payload_len) if is_modbus else None,
+            zones
+        ))
+
+    def message(self, shard, counts=None):
+        message = ("events", shard, self.rows, self.suppressed, counts)
+        self.rows = []
+        self.suppressed = 0
+        return message
+
+
+def expand_events(rows):
+    """Rebuild the frame_event() dicts for a worker's event rows"""
+    events = []
+    for ts, src, dst, protocol, severity, packet_info, modbus, zones in rows:
+        event = {
+            "ts": ts,
+            "timestamp": format_ts(ts),
+            "source_ip": src,
+            "target_ip": dst if dst is not None else 'Unknown',
+            "protocol": protocol,
+            "severity": severity,
+            "packet_info": packet_info,
+            "modbus_details": {
+                "function_code": modbus[0] if modbus[0] is not None else "Unknown",
+                "unit_id": modbus[1] if modbus[1] is not None else "Unknown",
+                "data_length": modbus[2]
+            } if modbus is not None else None
+        }
+        if zones is not None:
+            event["source_asset"], event["source_zone"], event["target_asset"], event["target_zone"] = zones
+        events.append(event)
+    return events
+
+
+class ShardedPipeline:
+    """Fan raw frames out to analysis worker processes by flow hash and merge their results
+
+    The capture side calls submit() for each batch and mark_epoch() whenever a PCAP
+    file is closed. Every worker keeps its own flow and detection state, sized by the
+    flow_* and baseline_* settings; at an epoch boundary each sends its partial
+    analysis, and once all have arrived the merged analysis is passed to
+    on_epoch(info, analysis). A source's or destination's flows are spread over
+    the workers, so the port-scan and DoS rules only count in the workers and the
+    coordinator applies their thresholds to the summed counts. Live events are passed to on_events(events) from the
+    coordinator thread; with event_rate set, each worker sends at most that many
+    Low-severity events per second and counts the rest in events_suppressed.
+
+    The coordinator thread also restarts workers that exit, retries epoch markers
+    that did not fit in a ring, and gives up on epochs after epoch_timeout seconds.
+    """
+
+    def __init__(self, workers, on_events=None, on_epoch=None, ring_bytes=32 * 1024 * 1024,
+                 event_batch=256, event_interval=0.2, inventory_path=None, flow_capacity=200000,
+                 flow_idle_timeout=120, baseline_interval=10.0, baseline_learning=300.0, baseline_max_keys=200000,
+                 event_rate=None, epoch_timeout=120.0):
+        self.workers = workers
+        self.on_events = on_events
+        self.on_epoch = on_epoch
+        self.ring_bytes = ring_bytes
+        self.epoch_timeout = epoch_timeout
+        self.settings = {
+            "event_batch": event_batch,
+            "event_interval": event_interval,
+            "event_rate": event_rate,
+            "inventory_path": inventory_path,
+            "flow_capacity": flow_capacity,
+            "flow_idle_timeout": flow_idle_timeout,
+            "baseline_interval": baseline_interval,
+            "baseline_learning": baseline_learning,
+            "baseline_max_keys": baseline_max_keys
+        }
+
+        self.rings = []
+        self.processes = []
+        self.dropped = 0
+        self.shard_dropped = [0] * workers
+        self.submitted = 0
+        self.events_suppressed = 0
+        self.failed_epochs = 0
+        self.worker_restarts = 0
+        self._epoch = 0
+        self._pending = {}
+        self._rules = {rule.threat_type: rule for rule in default_rules() if rule.mergeable}
+        self._threats = {}  # Epoch: ThreatAggregator of the hits on summed rule counts
+        self._shard_epoch = [0] * workers  # Last epoch each worker sent its share of
+        self._pending_lock = threading.Lock()
+        self._unsent = []  # Per shard: epoch markers still waiting for ring space, oldest first
+        self._producer_lock = threading.Lock()  # Each ring has one producer: submit() or the marker retry
+        self._context = None
+        self._results = None
+        self._coordinator = None
+        self._running = False
+        self._stopping = False
+
+    def start(self):
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._stopping = False
+        for shard in range(self.workers):
+            self.rings.append(ShmRing(self.ring_bytes))
+            self.processes.append(self._spawn(shard))
+            self._unsent.append([])
+            # Rebound on every start so a scrape reads the running pipeline
+            gauge("scada_pipeline_worker_backlog_bytes", "Bytes waiting in each analysis worker's ring",
+                  worker=str(shard)).fn = lambda shard=shard: self.backlog()[shard]
+            counter("scada_pipeline_worker_dropped_total", "Frames dropped because an analysis worker's ring was full",
+                    worker=str(shard)).fn = lambda shard=shard: self.shard_dropped[shard]
+        self._running = True
+        self._coordinator = threading.Thread(target=self._coordinate, daemon=True)
+        self._coordinator.start()
+        return self._coordinator
+
+    def _spawn(self, shard):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.rings[shard].name, shard, self.workers, self._results, self.settings),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def submit(self, frames, flows=None):
+        """Shard a batch of (data, ts) pairs across the workers; returns the number dropped
+
+        flows may carry the peek_flow() result for each frame when the caller has it.
+        """
+        shards = self.workers
+        if flows is None:
+            flows = [peek_flow(item[0]) for item in frames]
+        buckets = [[] for _ in range(shards)]
+        for item, flow in zip(frames, flows):
+            buckets[shard_for(flow, shards)].append(item)
+        dropped = 0
+        with self._producer_lock:
+            for shard, (ring, bucket) in enumerate(zip(self.rings, buckets)):
+                if bucket:
+                    lost = len(bucket) - ring.put_batch(bucket)
+                    self.shard_dropped[shard] += lost
+                    dropped += lost
+        self.submitted += len(frames) - dropped
+        self.dropped += dropped
+        return dropped
+
+    def mark_epoch(self, info=None):
+        """Close the current epoch; on_epoch(info, merged) fires once every worker reports
+
+        Never blocks the capture side: a marker that does not fit in a full ring is
+        queued and retried by the coordinator thread, so frames submitted meanwhile
+        count towards the closing epoch. An epoch still short of a share after
+        epoch_timeout seconds (say its worker died) is reported with the shares that
+        arrived and the missing shards listed in analysis["missing_shards"], or
+        dropped if none did; either way it is counted in failed_epochs.
+        """
+        self._epoch += 1
+        epoch = self._epoch
+        with self._pending_lock:
+            self._pending[epoch] = {"epoch": epoch, "info": info, "analysis": None, "shards": set(),
+                                    "created": time.monotonic()}
+        with self._producer_lock:
+            for ring, unsent in zip(self.rings, self._unsent):
+                if unsent or not ring.put_marker(epoch, timeout=0):
+                    unsent.append(epoch)
+        return epoch
+
+    def backlog(self):
+        return [ring.capacity - ring.free_space() for ring in self.rings]
+
+    def stop(self):
+        self._stopping = True
+        with self._producer_lock:
+            for ring, unsent, process in zip(self.rings, self._unsent, self.processes):
+                if process.is_alive():
+                    for epoch in unsent:
+                        ring.put_marker(epoch)
+                    ring.put_marker(-1)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._running = False
+        if self._coordinator is not None:
+            self._coordinator.join(timeout=5)
+        for ring in self.rings:
+            ring.close()
+        self.rings = []
+        self.processes = []
+        self._unsent = []
+
+    def _coordinate(self):
+        last_check = time.monotonic()
+        while self._running or not self._results.empty():
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                message = None
+            try:
+                now = time.monotonic()
+                if now - last_check >= 0.5:
+                    last_check = now
+                    self._retry_markers()
+                    self._check_workers()
+                    self._expire_epochs(now)
+                if message is None:
+                    continue
+                if message[0] == "events":
+                    self.events_suppressed += message[3]
+                    if message[4]:
+                        self._merge_counts(message[1], message[4])
+                    if self.on_events and message[2]:
+                        self.on_events(expand_events(message[2]))
+                elif message[0] == "partial":
+                    self._merge_partial(message[1], message[2], message[3])
+            except Exception as e:
+                print(f"Pipeline coordinator error: {e}")
+
+    def _retry_markers(self):
+        with self._producer_lock:
+            for ring, unsent in zip(self.rings, self._unsent):
+                while unsent and ring.put_marker(unsent[0], timeout=0):
+                    unsent.pop(0)
+
+    def _check_workers(self):
+        """Restart exited workers on their rings; epochs a dead worker held time out"""
+        if self._stopping:
+            return
+        for shard, process in enumerate(self.processes):
+            if not process.is_alive():
+                print(f"Pipeline worker {shard} exited with code {process.exitcode}; restarting it")
+                self.worker_restarts += 1
+                self.processes[shard] = self._spawn(shard)
+
+    def _expire_epochs(self, now):
+        with self._pending_lock:
+            expired = [epoch for epoch, pending in self._pending.items()
+                       if now - pending["created"] > self.epoch_timeout]
+            expired = [self._pending.pop(epoch) for epoch in expired]
+        for pending in expired:
+            self.failed_epochs += 1
+            missing = sorted(set(range(self.workers)) - pending["shards"])
+            print(f"Pipeline epoch timed out without the share of workers {missing}")
+            if pending["analysis"] is not None:
+                pending["analysis"]["missing_shards"] = missing
+            self._finish(pending)
+
+    def _merge_counts(self, shard, counts):
+        """Add a worker's rate-rule counts; a hit goes into the epoch that worker is on and out as a live event"""
+        rows = []
+        for threat_type, shard_counts in counts.items():
+            rule = self._rules[threat_type]
+            for source, target, ts in rule.merge(shard_counts):
+                with self._pending_lock:
+                    threats = self._threats.setdefault(self._shard_epoch[shard] + 1, ThreatAggregator())
+                    threats.record(rule, source, target, ts)
+                severity = RISK_SEVERITIES[SEVERITY_RISK.get(rule.severity, 1)]
+                rows.append((ts, source, target, "TCP", severity, f"{threat_type}: {rule.details}", None, None))
+        if self.on_events and rows:
+            self.on_events(expand_events(rows))
+
+    def _merge_partial(self, shard, epoch, partial):
+        with self._pending_lock:
+            self._shard_epoch[shard] = max(self._shard_epoch[shard], epoch)
+            pending = self._pending.get(epoch)
+            if pending is None:
+                # A late share of an epoch that timed out goes into the next open epoch's report
+                later = [e for e in self._pending if e > epoch]
+                if later:
+                    target = self._pending[min(later)]
+                    if target["analysis"] is None:
+                        target["analysis"] = partial
+                    else:
+                        merge_analysis(target["analysis"], partial)
+                return
+            if pending["analysis"] is None:
+                pending["analysis"] = partial
+            else:
+                merge_analysis(pending["analysis"], partial)
+            pending["shards"].add(shard)
+            complete = self._complete(epoch, pending)
+        if complete:
+            self._finish(pending)
+
+    def _complete(self, epoch, pending):
+        """Remove the epoch once every worker's share is in (caller holds the lock)"""
+        if len(pending["shards"]) < self.workers:
+            return False
+        del self._pending[epoch]
+        return True
+
+    def _finish(self, pending):
+        with self._pending_lock:
+            closed = [epoch for epoch in self._threats if epoch <= pending["epoch"]]
+            threats = [self._threats.pop(epoch) for epoch in closed]
+        if pending["analysis"] is not None:
+            for hits in threats:
+                pending["analysis"]["security_analysis"]["detected_threats"].merge(hits)
+        if pending["analysis"] is None:
+            print("Pipeline epoch dropped: no worker sent its share")
+        elif self.on_epoch:
+            self.on_epoch(pending["info"], pending["analysis"])
@@ -0,0 +1,498 @@
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from .analysis import ANALYSIS_VERSION, REPORT_HOST_LIMIT, REPORT_SUFFIXES, REPORT_TOP_TALKERS, write_report, \
+    load_report
+from .pcap_index import HostSet, index_path
+from .pcap_reader import (GLOBAL_HEADER_SIZE, COMPRESSED_SUFFIX, GZIP_MEMBER_HEADER, GZIP_CHUNK_ID,
+                          read_header, iter_records, lock_exclusive)
+
+CHUNK_BYTES = 1024 * 1024  # Uncompressed capture bytes per gzip member (the seek granularity)
+ROLLUP_PREFIX = "report_daily_"
+COMBINED_PREFIX = "report_combined_"  # Re-analysis of several captures at once; never rolled up
+RISK_ORDER = ("Low", "Medium", "High", "Critical")
+
+
+def _gzip_member(data, level):
+    """One gzip member whose FEXTRA subfield records the member's total size"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    body = compressor.compress(data) + compressor.flush()
+    size = GZIP_MEMBER_HEADER.size + len(body) + 8
+    header = GZIP_MEMBER_HEADER.pack(b'\x1f\x8b\x08\x04', 0, 0, 255, 8, GZIP_CHUNK_ID, 4, size)
+    return header + body + struct.pack('<II', zlib.crc32(data), len(data) & 0xffffffff)
+
+
+def compress_pcap(pcap_file, chunk_bytes=CHUNK_BYTES, level=6):
+    """Replace pcap_file with a chunk-framed pcap_file.gz; returns the new path
+
+    Members start on record boundaries, so the file stays seekable by offset and
+    still opens with zcat, gunzip or Wireshark.
+    """
+    gz_file = pcap_file + COMPRESSED_SUFFIX
+    tmp_file = gz_file + ".tmp"
+    with open(pcap_file, 'rb') as src, open(tmp_file, 'wb') as dst:
+        header = read_header(src)
+        src.seek(0)
+        pending = [src.read(GLOBAL_HEADER_SIZE)]
+        pending_bytes = GLOBAL_HEADER_SIZE
+        for record, _, _ in iter_records(src, header, with_header=True):
+            pending.append(record)
+            pending_bytes += len(record)
+            if pending_bytes >= chunk_bytes:
+                dst.write(_gzip_member(b''.join(pending), level))
+                pending = []
+                pending_bytes = 0
+        if pending:
+            dst.write(_gzip_member(b''.join(pending), level))
+    os.replace(tmp_file, gz_file)
+    os.remove(pcap_file)
+    return gz_file
+
+
+def new_rollup(day):
+    """Empty daily rollup in the same shape as a per-capture report"""
+    return {
+        "report_metadata": {
+            "capture_time": day,
+            "pcap_file": None,
+            "report_generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "analysis_version": ANALYSIS_VERSION,
+            "first_packet_ts": None,
+            "last_packet_ts": None,
+            "rollup_date": day,
+            "reports": []
+        },
+        "network_statistics": {
+            "total_packets": 0,
+            "protocol_distribution": {},
+            "top_sources": [],
+            "top_destinations": [],
+            "unique_source_count": 0,
+            "unique_destination_count": 0,
+            "hosts": HostSet(REPORT_HOST_LIMIT).to_dict(),
+            "top_talkers": []
+        },
+        "modbus_analysis": {
+            "total_modbus_packets": 0,
+            "function_codes": {},
+            "unit_ids": [],
+            "suspicious_operations": []
+        },
+        "security_analysis": {
+            "risk_level": "Low",
+            "detected_threats": [],
+            "suppressed_threats": 0,
+            "recommendations": []
+        },
+        "network_health": new_rollup_health()
+    }
+
+
+def new_rollup_health():
+    return {
+        "latency_stats": {},
+        "packet_loss_rate": 0,
+        "bandwidth_status": "Normal",
+        "retransmission_rate": 0,
+        "exception_response_rate": 0,
+        "performance_metrics": {
+            "average_response_time": "N/A",
+            "response_time_percentiles": {"count": 0},
+            "packet_error_rate": 0,
+            "network_utilization": "N/A"
+        }
+    }
+
+
+def upgrade_rollup(rollup):
+    """Bring a rollup written by an earlier analysis version to the current report shape"""
+    stats = rollup["network_statistics"]
+    for old, new in (("unique_sources", "top_sources"), ("unique_destinations", "top_destinations")):
+        if old in stats:
+            stats[new] = stats.pop(old)
+    rollup.setdefault("network_health", new_rollup_health())
+    rollup["report_metadata"]["analysis_version"] = ANALYSIS_VERSION
+    return rollup
+
+
+def _add_counts(target, source):
+    for key, count in source.items():
+        target[key] = target.get(key, 0) + count
+
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def _weighted(a, weight_a, b, weight_b):
+    if not weight_b or b is None:
+        return a
+    if not weight_a or a is None:
+        return b
+    return round((a * weight_a + b * weight_b) / (weight_a + weight_b), 4)
+
+
+def _merge_latency(target, source):
+    """Combine two latency summaries: counts summed, means weighted, percentiles the larger (an upper bound)"""
+    merged = {key: target.get(key, 0) + source.get(key, 0)
+              for key in ("count", "requests", "responses", "exceptions") if key in target or key in source}
+    if target.get("count") and source.get("count"):
+        merged["mean_ms"] = _weighted(target["mean_ms"], target["count"], source["mean_ms"], source["count"])
+        for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms"):
+            merged[key] = max(target[key], source[key])
+    else:
+        merged.update({key: value for key, value in (target if target.get("count") else source).items()
+                       if key.endswith("_ms")})
+    return merged
+
+
+def _duration(meta):
+    first, last = meta.get("first_packet_ts"), meta.get("last_packet_ts")
+    return last - first if first is not None and last is not None else 0
+
+
+def _merge_health(rollup, report):
+    """Fold a report's network_health into the rollup's, weighting each rate by what it is a rate of"""
+    health = rollup.setdefault("network_health", new_rollup_health())
+    report_health = report.get("network_health")
+    if not report_health:
+        return
+    devices = health["latency_stats"]
+    report_devices = report_health.get("latency_stats", {})
+    requests = sum(d.get("requests", 0) for d in devices.values())
+    report_requests = sum(d.get("requests", 0) for d in report_devices.values())
+    responses = sum(d.get("responses", 0) for d in devices.values())
+    report_responses = sum(d.get("responses", 0) for d in report_devices.values())
+    packets = rollup["network_statistics"]["total_packets"]
+    report_packets = report.get("network_statistics", {}).get("total_packets", 0)
+
+    health["packet_loss_rate"] = _weighted(health["packet_loss_rate"], requests,
+                                           report_health.get("packet_loss_rate"), report_requests)
+    health["exception_response_rate"] = _weighted(health["exception_response_rate"], responses,
+                                                  report_health.get("exception_response_rate"), report_responses)
+    health["retransmission_rate"] = _weighted(health["retransmission_rate"], packets,
+                                              report_health.get("retransmission_rate"), report_packets)
+    for ip, stats in report_devices.items():
+        devices[ip] = _merge_latency(devices.get(ip, {}), stats)
+
+    metrics = health["performance_metrics"]
+    report_metrics = report_health.get("performance_metrics", {})
+    overall = _merge_latency(metrics["response_time_percentiles"], report_metrics.get("response_time_percentiles", {}))
+    metrics["response_time_percentiles"] = overall
+    metrics["average_response_time"] = f"{overall['mean_ms']} ms" if overall.get("mean_ms") is not None else "N/A"
+    metrics["packet_error_rate"] = health["retransmission_rate"]
+    # Throughput: total bits over total capture time, from each capture's duration
+    seconds = sum(_duration(entry) for entry in rollup["report_metadata"]["reports"])
+    report_seconds = _duration(report.get("report_metadata", {}))
+    bps = metrics["network_utilization"].split()[0] if metrics["network_utilization"] != "N/A" else None
+    report_bps = report_metrics.get("network_utilization", "N/A")
+    report_bps = report_bps.split()[0] if report_bps != "N/A" else None
+    bps = _weighted(float(bps) if bps else None, seconds, float(report_bps) if report_bps else None, report_seconds)
+    metrics["network_utilization"] = f"{round(bps)} bit/s" if bps is not None else "N/A"
+
+
+def merge_into_rollup(rollup, name, report):
+    """Fold one per-capture report into a daily rollup
+
+    Counts are summed and threats merged by (type, source, target). Unique host
+    counts can't be combined exactly, so the rollup keeps the largest per-capture
+    figure as a lower bound; the host lists (or Bloom filters) are unioned. Network
+    health rates are weighted averages, and latency percentiles the largest seen.
+    """
+    _merge_health(rollup, report)  # Before the totals it weights by include this report
+    meta = rollup["report_metadata"]
+    report_meta = report.get("report_metadata", {})
+    meta["first_packet_ts"] = _min(meta["first_packet_ts"], report_meta.get("first_packet_ts"))
+    meta["last_packet_ts"] = _max(meta["last_packet_ts"], report_meta.get("last_packet_ts"))
+    security = report.get("security_analysis", {})
+    meta["reports"].append({
+        "name": name,
+        "pcap_file": report_meta.get("pcap_file"),
+        "first_packet_ts": report_meta.get("first_packet_ts"),
+        "last_packet_ts": report_meta.get("last_packet_ts"),
+        "total_packets": report.get("network_statistics", {}).get("total_packets", 0),
+        "risk_level": security.get("risk_level"),
+        "threat_count": len(security.get("detected_threats", [])),
+        "packet_loss_rate": report.get("network_health", {}).get("packet_loss_rate")
+    })
+    meta["pcap_file"] = f"{len(meta['reports'])} captures"
+
+    stats = rollup["network_statistics"]
+    report_stats = report.get("network_statistics", {})
+    stats["total_packets"] += report_stats.get("total_packets", 0)
+    _add_counts(stats["protocol_distribution"], report_stats.get("protocol_distribution", {}))
+    stats["unique_source_count"] = max(stats["unique_source_count"], report_stats.get("unique_source_count", 0))
+    stats["unique_destination_count"] = max(stats["unique_destination_count"],
+                                            report_stats.get("unique_destination_count", 0))
+    talkers = {talker["ip"]: talker["packets"] for talker in stats["top_talkers"]}
+    _add_counts(talkers, {talker["ip"]: talker["packets"] for talker in report_stats.get("top_talkers", [])})
+    stats["top_talkers"] = [
+        {"ip": ip, "packets": packets}
+        for ip, packets in sorted(talkers.items(), key=lambda kv: kv[1], reverse=True)[:REPORT_TOP_TALKERS]
+    ]
+    stats["top_sources"] = [talker["ip"] for talker in stats["top_talkers"]]
+    # Version 1.0 reports called the list unique_destinations
+    report_destinations = report_stats.get("top_destinations", report_stats.get("unique_destinations", []))
+    destinations = stats["top_destinations"] + [
+        ip for ip in report_destinations if ip not in stats["top_destinations"]
+    ]
+    stats["top_destinations"] = destinations[:REPORT_TOP_TALKERS]
+    if "hosts" not in report_stats:
+        stats.pop("hosts", None)  # A 1.0 report lists only some of its hosts, so the rollup can't list them all
+    elif "hosts" in stats:
+        hosts = HostSet.from_dict(stats["hosts"], REPORT_HOST_LIMIT)
+        hosts.update(HostSet.from_dict(report_stats["hosts"], REPORT_HOST_LIMIT))
+        stats["hosts"] = hosts.to_dict()
+
+    modbus = rollup["modbus_analysis"]
+    report_modbus = report.get("modbus_analysis", {})
+    modbus["total_modbus_packets"] += report_modbus.get("total_modbus_packets", 0)
+    _add_counts(modbus["function_codes"], report_modbus.get("function_codes", {}))
+    modbus["unit_ids"] = sorted(set(modbus["unit_ids"]) | set(report_modbus.get("unit_ids", [])))
+
+    rolled = rollup["security_analysis"]
+    risk = security.get("risk_level", "Low")
+    if risk in RISK_ORDER and RISK_ORDER.index(risk) > RISK_ORDER.index(rolled["risk_level"]):
+        rolled["risk_level"] = risk
+    rolled["suppressed_threats"] += security.get("suppressed_threats", 0)
+    for recommendation in security.get("recommendations", []):
+        if recommendation not in rolled["recommendations"]:
+            rolled["recommendations"].append(recommendation)
+    threats = {(t["type"], t["source"], t["target"]): t for t in rolled["detected_threats"]}
+    for threat in security.get("detected_threats", []):
+        key = (threat["type"], threat["source"], threat["target"])
+        mine = threats.get(key)
+        if mine is None:
+            threats[key] = dict(threat)
+            continue
+        mine["count"] += threat.get("count", 1)
+        mine["first_seen"] = _min(mine.get("first_seen"), threat.get("first_seen"))
+        mine["last_seen"] = _max(mine.get("last_seen"), threat.get("last_seen"))
+        mine["timestamp"] = threat.get("timestamp", mine.get("timestamp"))
+    rolled["detected_threats"] = list(threats.values())
+    return rollup
+
+
+def _capture_name(report):
+    """The capture a report (or rollup entry) covers, by file name so a later .gz of it matches"""
+    pcap_file = report.get("pcap_file")
+    if not pcap_file:
+        return report["name"]
+    name = os.path.basename(pcap_file)
+    return name[:-len(COMPRESSED_SUFFIX)] if name.endswith(COMPRESSED_SUFFIX) else name
+
+
+class RetentionManager:
+    """Background housekeeping that keeps capture and report storage bounded
+
+    Each pass compresses closed captures older than compress_after seconds, deletes
+    the oldest captures while their total exceeds max_bytes or they are older than
+    max_age seconds, and folds reports older than rollup_after seconds into one
+    report per day. Only the newest report of each capture is folded in (re-analysis
+    keeps the original); older ones and reports of a capture the day's rollup
+    already holds are removed without counting their traffic again. Files being read (downloads, extracts, re-analysis) are left for
+    a later pass and counted as in_use. on_change(summary) is called after a pass
+    that changed anything.
+    """
+
+    def __init__(self, catalog, reports_dir, compress_after=0, max_bytes=None, max_age=None,
+                 rollup_after=None, report_encoding="indent", interval=60, on_change=None):
+        self.catalog = catalog
+        self.reports_dir = reports_dir
+        self.compress_after = compress_after
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.rollup_after = rollup_after
+        self.report_encoding = report_encoding
+        self.interval = interval
+        self.on_change = on_change
+        self.last_run = None
+        self.totals = {"compressed": 0, "deleted": 0, "rolled_up": 0, "saved_bytes": 0, "freed_bytes": 0, "in_use": 0}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Retention error: {e}")
+
+    def run_once(self, now=None):
+        """One housekeeping pass; returns what it did"""
+        now = time.time() if now is None else now
+        started = time.monotonic()
+        summary = {"compressed": 0, "deleted": 0, "rolled_up": 0, "saved_bytes": 0, "freed_bytes": 0, "in_use": 0}
+        self._compress(now, summary)
+        self._enforce_budget(now, summary)
+        if self.rollup_after is not None:
+            self._rollup(now, summary)
+        for key, value in summary.items():
+            self.totals[key] += value
+        summary["seconds"] = round(time.monotonic() - started, 3)
+        summary["finished"] = now
+        self.last_run = summary
+        if self.on_change and (summary["compressed"] or summary["deleted"] or summary["rolled_up"]):
+            self.on_change(summary)
+        return summary
+
+    def status(self):
+        return {
+            "compress_after": self.compress_after,
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            "rollup_after": self.rollup_after,
+            "report_encoding": self.report_encoding,
+            "storage": self.catalog.storage_totals(),
+            "last_run": self.last_run,
+            "totals": self.totals
+        }
+
+    def _compress(self, now, summary):
+        for capture in self.catalog.oldest_captures(now - self.compress_after):
+            path = capture["path"]
+            if path.endswith(COMPRESSED_SUFFIX) or not os.path.exists(path):
+                continue
+            try:
+                lock = lock_exclusive(path)
+                if lock is None:
+                    summary["in_use"] += 1
+                    continue
+                try:
+                    gz_file = compress_pcap(path)
+                finally:
+                    lock.close()
+            except (OSError, ValueError) as e:
+                print(f"Cannot compress {path}: {e}")
+                continue
+            size = os.path.getsize(gz_file)
+            self.catalog.move_capture(capture["name"], gz_file, size)
+            summary["compressed"] += 1
+            summary["saved_bytes"] += (capture["size"] or 0) - size
+
+    def _delete_capture(self, capture, summary):
+        try:
+            lock = lock_exclusive(capture["path"])
+        except FileNotFoundError:
+            lock = None
+        else:
+            if lock is None:
+                summary["in_use"] += 1
+                return False
+        try:
+            for path in (capture["path"], index_path(capture["path"])):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Cannot delete {path}: {e}")
+                    return False
+        finally:
+            if lock is not None:
+                lock.close()
+        self.catalog.remove(capture["name"])
+        summary["deleted"] += 1
+        summary["freed_bytes"] += capture["size"] or 0
+        return True
+
+    def _enforce_budget(self, now, summary):
+        if self.max_age is not None:
+            for capture in self.catalog.oldest_captures(now - self.max_age):
+                self._delete_capture(capture, summary)
+        if self.max_bytes is not None:
+            total = self.catalog.storage_totals()["capture_bytes"]
+            for capture in self.catalog.oldest_captures():
+                if total <= self.max_bytes:
+                    break
+                if self._delete_capture(capture, summary):
+                    total -= capture["size"] or 0
+
+    def _rollup(self, now, summary):
+        newest = {}
+        reports = []
+        for report in self.catalog.reports_before(now - self.rollup_after):
+            if report["name"].startswith((ROLLUP_PREFIX, COMBINED_PREFIX)):
+                continue
+            reports.append(report)
+            capture = _capture_name(report)
+            latest = newest.get(capture)
+            if latest is None or (report["created"] or 0, report["name"]) > (latest["created"] or 0, latest["name"]):
+                newest[capture] = report
+        by_day = {}
+        for report in reports:
+            ts = report["start_ts"] or report["created"]
+            by_day.setdefault(datetime.fromtimestamp(ts).strftime("%Y%m%d"), []).append(report)
+
+        for day, reports in sorted(by_day.items()):
+            previous_file, rollup = self._load_rollup(day)
+            held = {_capture_name(entry) for entry in rollup["report_metadata"]["reports"]}
+            merged = []
+            locks = []
+            try:
+                for report in reports:
+                    try:
+                        lock = lock_exclusive(report["path"])
+                        if lock is None:
+                            summary["in_use"] += 1  # Being downloaded; rolled up on a later pass
+                            continue
+                        locks.append(lock)
+                        capture = _capture_name(report)
+                        if newest[capture] is report and capture not in held:
+                            merge_into_rollup(rollup, report["name"], load_report(report["path"]))
+                            held.add(capture)
+                        merged.append(report)  # A superseded report goes without adding its traffic
+                    except (OSError, ValueError, KeyError) as e:
+                        print(f"Cannot roll up {report['path']}: {e}")
+                if merged:
+                    self._write_rollup(day, rollup, previous_file, merged, summary)
+            finally:
+                for lock in locks:
+                    lock.close()
+
+    def _write_rollup(self, day, rollup, previous_file, merged, summary):
+        """Write the day's rollup, then remove the reports it now holds"""
+        rollup_file = os.path.join(self.reports_dir, f"{ROLLUP_PREFIX}{day}{REPORT_SUFFIXES[self.report_encoding]}")
+        write_report(rollup, rollup_file, self.report_encoding)
+        self.catalog.add_report(rollup_file, rollup)
+        if previous_file is not None and previous_file != rollup_file:
+            os.remove(previous_file)  # Written in an earlier encoding
+            self.catalog.remove(os.path.basename(previous_file))
+        for report in merged:
+            try:
+                os.remove(report["path"])
+            except OSError:
+                pass
+            self.catalog.remove(report["name"])
+            summary["rolled_up"] += 1
+
+    def _load_rollup(self, day):
+        """(path, data) of the existing rollup for day in whatever encoding it was written, or (None, new)"""
+        for suffix in set(REPORT_SUFFIXES.values()):
+            existing = self.catalog.get(f"{ROLLUP_PREFIX}{day}{suffix}")
+            if existing is not None and os.path.exists(existing["path"]):
+                try:
+                    return existing["path"], upgrade_rollup(load_report(existing["path"]))
+                except (OSError, ValueError) as e:
+                    print(f"Rewriting unreadable rollup {existing['path']}: {e}")
+        return None, new_rollup(day)
@@ -0,0 +1,435 @@
+import ipaddress
+from collections import OrderedDict
+from datetime import datetime
+
+from .decoder import TCP_SYN, TCP_ACK, MODBUS_PORT
+from .sketches import HyperLogLog
+
+
+# DecodedFrame.risk raised by a rule hit of each severity
+SEVERITY_RISK = {"Low": 0, "Medium": 1, "High": 2, "Critical": 2}
+
+
+def _format_time(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ExpiringTable:
+    """Bounded per-key state: least recently updated entries go first, and nothing outlives ttl"""
+
+    def __init__(self, capacity=10000, ttl=60):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    def put(self, key, value, now):
+        entries = self._entries
+        entries[key] = (now, value)
+        entries.move_to_end(key)
+        while len(entries) > self.capacity:
+            entries.popitem(last=False)
+        # Drop a few stale entries from the cold end on every write
+        for _ in range(2):
+            if not entries:
+                break
+            oldest_key, (stamp, _value) = next(iter(entries.items()))
+            if now - stamp <= self.ttl:
+                break
+            del entries[oldest_key]
+
+
+class Rule:
+    """Base detection rule; subclasses set the threat template and implement evaluate()
+
+    protocols/ports decide which dispatch-table buckets the rule lands in: None
+    means any IP protocol / any port. Mergeable rules can also run as partial
+    counters for one shard of the traffic: evaluate() then never fires, drain()
+    hands over the counts since the last call, and merge() on a full instance of
+    the rule adds them up and returns the hits.
+    """
+    protocols = None
+    ports = None
+    mergeable = False
+
+    threat_type = None
+    severity = "Medium"
+    details = ""
+    solution = ""
+    mitigation_steps = ()
+
+    def evaluate(self, frame):
+        """Return (source, target) when the frame trips the rule, otherwise None"""
+        raise NotImplementedError
+
+    def drain(self):
+        """Partial counts since the last call (partial rules only), or None"""
+        return None
+
+    def merge(self, counts):
+        """Fold one shard's drained counts in; returns [(source, target, ts)] for thresholds crossed"""
+        raise NotImplementedError
+
+
+class PortScanRule(Rule):
+    """Too many connection attempts (bare SYNs) from one source within a window; fires once per window"""
+    protocols = (6,)
+    mergeable = True
+
+    threat_type = "Port Scanning"
+    severity = "High"
+    details = "Potential port scanning detected"
+    solution = "Implement firewall rules to limit Modbus access to known IP addresses"
+    mitigation_steps = (
+        "Configure firewall to whitelist known Modbus devices",
+        "Implement rate limiting for Modbus connections",
+        "Enable logging for all Modbus connection attempts"
+    )
+
+    def __init__(self, threshold=20, window=10, capacity=20000, partial=False):
+        self.threshold = threshold
+        self.window = window
+        self.partial = partial
+        self._sources = ExpiringTable(capacity, ttl=window)
+        self._counts = {}  # Partial mode: {source: [syns, first_ts, target]} since the last drain
+
+    def evaluate(self, frame):
+        if frame.flags & (TCP_SYN | TCP_ACK) != TCP_SYN:
+            return None
+        target = f"{frame.dst}:{frame.dport}" if frame.dport == MODBUS_PORT else frame.dst
+        if self.partial:
+            counts = self._counts.get(frame.src)
+            if counts is None:
+                self._counts[frame.src] = [1, frame.ts, target]
+            else:
+                counts[0] += 1
+                counts[2] = target
+            return None
+        if self._count(frame.src, 1, frame.ts):
+            return frame.src, target
+        return None
+
+    def _count(self, source, syns, now):
+        """Add syns to the source's window; True when that crosses the threshold"""
+        state = self._sources.get(source, now)
+        if state is None or now - state[0] > self.window:
+            state = [now, 0]
+        before = state[1]
+        state[1] += syns
+        self._sources.put(source, state, now)
+        return before < self.threshold <= state[1]
+
+    def drain(self):
+        counts, self._counts = self._counts, {}
+        return counts
+
+    def merge(self, counts):
+        return [(source, target, ts) for source, (syns, ts, target) in counts.items() if self._count(source, syns, ts)]
+
+
+class DoSRule(Rule):
+    """Too many distinct sources converging on one destination within a window; fires once per window"""
+    protocols = (6,)
+    mergeable = True
+
+    threat_type = "Potential DoS Attack"
+    severity = "Critical"
+    details = "Unusual number of source IPs detected"
+    solution = "Implement rate limiting and DoS protection mechanisms"
+    mitigation_steps = (
+        "Deploy DoS protection at network edge",
+        "Configure SYN flood protection",
+        "Set up traffic monitoring and alerting"
+    )
+
+    def __init__(self, threshold=100, window=10, capacity=10000, partial=False):
+        self.threshold = threshold
+        self.window = window
+        self.partial = partial
+        self._targets = ExpiringTable(capacity, ttl=window)
+        self._sketches = {}  # Partial mode: {destination: (first_ts, sources)} since the last drain
+
+    def evaluate(self, frame):
+        if self.partial:
+            entry = self._sketches.get(frame.dst)
+            if entry is None:
+                entry = self._sketches[frame.dst] = (frame.ts, HyperLogLog(7))
+            entry[1].add(frame.src)
+            return None
+        state = self._window(frame.dst, frame.ts)
+        state[1].add(frame.src)
+        if self._fires(state):
+            return "Multiple Sources", frame.dst
+        return None
+
+    def _window(self, target, now):
+        state = self._targets.get(target, now)
+        if state is None or now - state[0] > self.window:
+            state = [now, HyperLogLog(7), False]  # Window start, sources, fired
+        self._targets.put(target, state, now)
+        return state
+
+    def _fires(self, state):
+        if not state[2] and len(state[1]) > self.threshold:
+            state[2] = True
+            return True
+        return False
+
+    def drain(self):
+        sketches, self._sketches = self._sketches, {}
+        return sketches
+
+    def merge(self, counts):
+        hits = []
+        for target, (ts, sources) in counts.items():
+            state = self._window(target, ts)
+            state[1].update(sources)
+            if self._fires(state):
+                hits.append(("Multiple Sources", target, ts))
+        return hits
+
+
+class SpoofingRule(Rule):
+    """Source address inside a prefix that should never appear on the wire"""
+
+    threat_type = "IP Spoofing"
+    severity = "High"
+    details = "Potentially spoofed IP address detected"
+    solution = "Implement IP filtering and validation mechanisms"
+    mitigation_steps = (
+        "Configure ingress filtering",
+        "Implement reverse path forwarding checks",
+        "Set up IP reputation monitoring"
+    )
+
+    DEFAULT_PREFIXES = ("0.0.0.0/8", "127.0.0.0/8")
+
+    def __init__(self, prefixes=DEFAULT_PREFIXES):
+        # {mask: {network, ...}} so a lookup is one AND plus one set probe per prefix length
+        self._networks = {}
+        for prefix in prefixes:
+            network = ipaddress.IPv4Network(prefix)
+            self._networks.setdefault(int(network.netmask), set()).add(int(network.network_address))
+        self._masks = tuple(self._networks.items())
+
+    def evaluate(self, frame):
+        addr = frame.src_addr
+        for mask, networks in self._masks:
+            if addr & mask in networks:
+                return frame.src, frame.dst
+        return None
+
+
+_MULTICAST = 0xe0000000  # 224.0.0.0 and up: multicast, reserved and broadcast destinations
+
+
+class UnknownAssetRule(Rule):
+    """Source inside a configured zone that isn't in the asset inventory (needs AssetInventory.annotate)"""
+
+    threat_type = "Unknown Asset"
+    severity = "Medium"
+    details = "Traffic from a device that is not in the asset inventory"
+    solution = "Identify the device and add it to the inventory, or remove it from the network"
+    mitigation_steps = (
+        "Locate the device by its switch port or MAC address",
+        "Enable port security on control network switches",
+        "Keep the asset inventory up to date with change management"
+    )
+
+    def evaluate(self, frame):
+        zone = frame.src_zone
+        if zone is None or frame.src_asset is not None or not zone.subnets:
+            return None
+        return frame.src, f"{zone.name} zone"
+
+
+class CrossZoneRule(Rule):
+    """Traffic between zones with no conduit between them (needs AssetInventory.annotate)"""
+
+    threat_type = "Cross-Zone Traffic"
+    severity = "High"
+    details = "Traffic between network zones that are not connected by a conduit"
+    solution = "Block the traffic at the zone boundary or document the conduit"
+    mitigation_steps = (
+        "Review firewall rules between the zones",
+        "Route cross-level traffic through the DMZ",
+        "Add approved conduits to the asset inventory"
+    )
+
+    def evaluate(self, frame):
+        src_zone = frame.src_zone
+        if src_zone is None or frame.dst_addr >= _MULTICAST or src_zone.allows(frame.dst_zone):
+            return None
+        if frame.src_asset is None:
+            return f"{src_zone.name} zone", frame.dst  # One threat per zone, so floods can't fill the aggregator
+        return frame.src, frame.dst
+
+
+class UnauthorizedPeerRule(Rule):
+    """Inventoried device talking to an address outside its allowed peers (needs AssetInventory.annotate)"""
+
+    threat_type = "Unauthorized Communication"
+    severity = "High"
+    details = "Device communicated with a peer that is not in its allowed peer list"
+    solution = "Confirm whether the connection is approved and update the allowed peers or block it"
+    mitigation_steps = (
+        "Restrict the device's connections at the firewall to its allowed peers",
+        "Investigate the peer host for unauthorized tools"
+    )
+
+    def evaluate(self, frame):
+        src_asset = frame.src_asset
+        dst_asset = frame.dst_asset
+        if src_asset is not None and not src_asset.allows(frame.dst_addr, frame.dst_zone):
+            return frame.src, frame.dst
+        if dst_asset is not None and not dst_asset.allows(frame.src_addr, frame.src_zone):
+            return frame.src, frame.dst
+        return None
+
+
+def default_rules(shards=1, inventory=None):
+    """The built-in rule set; with an asset inventory the zone and asset rules are added too
+
+    With shards > 1 each engine sees only some of every source's and destination's
+    flows, so the rate rules run as partial counters whose counts a coordinator
+    merges into full instances (see Rule).
+    """
+    partial = shards > 1
+    rules = [PortScanRule(partial=partial), DoSRule(partial=partial), SpoofingRule()]
+    if inventory is not None:
+        rules += [UnknownAssetRule(), CrossZoneRule(), UnauthorizedPeerRule()]
+    return rules
+
+
+class RuleEngine:
+    """Rules compiled into a dispatch table keyed on (protocol, port)
+
+    A frame only ever visits the rules registered for its protocol and ports, so
+    the per-packet cost doesn't grow with the size of the rule set.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = list(rules) if rules is not None else default_rules()
+        self._any = ()
+        self._by_proto = {}
+        self._by_port = {}
+        self.compile()
+
+    def compile(self):
+        any_rules = []
+        by_proto = {}
+        by_port = {}
+        for rule in self.rules:
+            if rule.protocols is None:
+                any_rules.append(rule)
+            elif rule.ports is None:
+                for proto in rule.protocols:
+                    by_proto.setdefault(proto, []).append(rule)
+            else:
+                for proto in rule.protocols:
+                    for port in rule.ports:
+                        by_port.setdefault((proto, port), []).append(rule)
+        self._any = tuple(any_rules)
+        self._by_proto = {proto: tuple(rules) + self._any for proto, rules in by_proto.items()}
+        self._by_port = {key: tuple(rules) for key, rules in by_port.items()}
+
+    def drain(self):
+        """{threat_type: counts} from the partial rules that counted anything since the last call"""
+        drained = {}
+        for rule in self.rules:
+            counts = rule.drain()
+            if counts:
+                drained[rule.threat_type] = counts
+        return drained
+
+    def evaluate(self, frame, threats):
+        """Run the matching rules for an IP frame, recording any hits in threats and raising the frame's risk"""
+        proto = frame.proto
+        for rule in self._by_proto.get(proto, self._any):
+            hit = rule.evaluate(frame)
+            if hit is not None:
+                threats.record(rule, hit[0], hit[1], frame.ts)
+                frame.risk = max(frame.risk, SEVERITY_RISK.get(rule.severity, 1))
+
+        if self._by_port and frame.sport is not None:
+            rules = self._by_port.get((proto, frame.dport), ())
+            if frame.sport != frame.dport:
+                rules += self._by_port.get((proto, frame.sport), ())
+            for rule in rules:
+                hit = rule.evaluate(frame)
+                if hit is not None:
+                    threats.record(rule, hit[0], hit[1], frame.ts)
+                    frame.risk = max(frame.risk, SEVERITY_RISK.get(rule.severity, 1))
+
+
+class ThreatAggregator:
+    """Collapse repeated hits of the same rule/source/target into one threat with counts"""
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._threats = {}
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self._threats)
+
+    def __iter__(self):
+        return iter(self._threats.values())
+
+    def record(self, rule, source, target, ts, count=1):
+        key = (rule.threat_type, source, target)
+        threat = self._threats.get(key)
+        if threat is not None:
+            threat["count"] += count
+            threat["last_seen"] = max(threat["last_seen"], ts)
+            return
+        if len(self._threats) >= self.capacity:
+            self.suppressed += count
+            return
+        self._threats[key] = {
+            "type": rule.threat_type,
+            "severity": rule.severity,
+            "source": source,
+            "target": target,
+            "details": rule.details,
+            "solution": rule.solution,
+            "mitigation_steps": list(rule.mitigation_steps),
+            "count": count,
+            "first_seen": ts,
+            "last_seen": ts
+        }
+
+    def merge(self, other):
+        for key, threat in other._threats.items():
+            mine = self._threats.get(key)
+            if mine is not None:
+                mine["count"] += threat["count"]
+                mine["first_seen"] = min(mine["first_seen"], threat["first_seen"])
+                mine["last_seen"] = max(mine["last_seen"], threat["last_seen"])
+            elif len(self._threats) < self.capacity:
+                self._threats[key] = dict(threat)
+            else:
+                self.suppressed += threat["count"]
+        self.suppressed += other.suppressed
+
+    def to_list(self):
+        """Threats for a report, most frequent first, with readable timestamps"""
+        threats = []
+        for threat in sorted(self._threats.values(), key=lambda t: t["count"], reverse=True):
+            threat = dict(threat)
+            threat["timestamp"] = _format_time(threat["first_seen"])
+            threat["first_seen"] = threat["timestamp"]
+            threat["last_seen"] = _format_time(threat["last_seen"])
+            threats.append(threat)
+        return threats
@@ -0,0 +1,337 @@
+import json
+import socket
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from .event_store import EventRecord
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL,
+    source_ip TEXT,
+    target_ip TEXT,
+    protocol TEXT,
+    severity TEXT,
+    packet_info TEXT,
+    function_code,
+    unit_id,
+    data_length INTEGER,
+    source_asset TEXT,
+    source_zone TEXT,
+    target_asset TEXT,
+    target_zone TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    data TEXT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    payload TEXT,
+    result TEXT,
+    created REAL,
+    reply_port INTEGER
+);
+"""
+
+MESSAGE_RETENTION = 60  # Seconds relayed Socket.IO messages and finished commands are kept
+COMMAND_POLL_INTERVAL = 1.0  # Fallback re-check of the commands table if a wake-up datagram is lost
+NOTIFY_HOST = "127.0.0.1"   # Commands and their results are announced by a datagram on loopback
+
+
+def _event_row(record):
+    modbus = record.modbus_details or (None, None, None)
+    assets = record.assets or (None, None, None, None)
+    return (record.id, record.ts, record.source_ip, record.target_ip, record.protocol,
+            record.severity, record.packet_info) + tuple(modbus) + assets
+
+
+def _event_record(row):
+    modbus = row[7:10] if row[7] is not None or row[8] is not None else None
+    assets = row[10:14] if row[11] is not None else None
+    return EventRecord(*row[:7], modbus_details=modbus, assets=assets)
+
+
+def _notify(sock, port, command_id):
+    try:
+        sock.sendto(str(command_id).encode(), (NOTIFY_HOST, port))
+    except OSError:
+        pass  # The other side re-checks the table on its own
+
+
+class SharedState:
+    """SQLite (WAL) store shared by one capture daemon and any number of web workers
+
+    The daemon writes events (batched by a background thread), JSON snapshots and
+    Socket.IO messages, and runs commands the web workers queue. Web workers only
+    read, apart from queueing commands, so they hold no live state of their own.
+    """
+
+    def __init__(self, db_path, event_capacity=50000, interval=0.5, max_queue=100000):
+        self.db_path = db_path
+        self.event_capacity = event_capacity
+        self.interval = interval
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        self._queue = deque()
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._command_socket = None
+        self.published = 0
+        self.dropped = 0
+
+    def close(self):
+        """Stop the background threads and close the database"""
+        self._stop_event.set()
+        with self._lock:
+            self._conn.close()
+        if self._command_socket is not None:
+            self._command_socket.close()
+
+    def reset(self):
+        """Daemon start: event ids restart at 1, so forget the previous run's events, messages and commands
+
+        The tables are recreated, which also brings a state file from an older version up to date.
+        """
+        with self._lock, self._conn:
+            for table in ("events", "snapshots", "messages", "commands"):
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+
+    # Events
+
+    def publish(self, record):
+        """Queue a stored EventRecord for the next batch write; never blocks the caller"""
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(record)
+        self.published += 1
+
+    def flush(self):
+        """Write queued events in one transaction and trim the table to event_capacity"""
+        queue = self._queue
+        rows = [_event_row(queue.popleft()) for _ in range(len(queue))]
+        with self._lock, self._conn:
+            if rows:
+                self._conn.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._conn.execute("DELETE FROM events WHERE id <= ?", (rows[-1][0] - self.event_capacity,))
+            self._conn.execute("DELETE FROM messages WHERE created < ?", (time.time() - MESSAGE_RETENTION,))
+            self._conn.execute("DELETE FROM commands WHERE result IS NOT NULL AND created < ?",
+                               (time.time() - MESSAGE_RETENTION,))
+
+    @property
+    def last_id(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def query(self, since_id=0, limit=100, severities=None, ip=None):
+        """Same contract as EventStore.query: up to limit records newer than since_id, plus the next cursor"""
+        where, params = ["id > ?"], [since_id]
+        if severities:
+            where.append(f"severity IN ({', '.join('?' * len(severities))})")
+            params.extend(severities)
+        if ip:
+            where.append("(source_ip = ? OR target_ip = ?)")
+            params.extend((ip, ip))
+        with self._lock:
+            last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM events WHERE {' AND '.join(where)} AND id <= ? ORDER BY id LIMIT ?",
+                params + [last_id, limit]
+            ).fetchall()
+        records = [_event_record(row) for row in rows]
+        cursor = records[-1].id if len(records) >= limit else max(since_id, last_id)
+        return records, cursor
+
+    # Snapshots
+
+    def put(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)",
+                               (key, json.dumps(value), time.time()))
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM snapshots WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    # Socket.IO relay
+
+    def emit(self, event, data=None, to=None):
+        """socketio.emit stand-in: queue a message for every web worker to re-emit to its clients"""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO messages (event, data, created) VALUES (?, ?, ?)",
+                               (event, json.dumps(data), time.time()))
+
+    def messages(self, since_id=0):
+        """[(id, event, data)] emitted after since_id"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, event, data FROM messages WHERE id > ? ORDER BY id",
+                                      (since_id,)).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def last_message_id(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+
+    # Commands
+
+    def call(self, name, payload=None, timeout=10.0):
+        """Queue a command for the daemon and wait for its result; None if it doesn't answer in time
+
+        The daemon is woken by a datagram to the port it published, and answers with
+        one to this call's own port, so neither side polls the table in a loop.
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as reply:
+            reply.bind((NOTIFY_HOST, 0))
+            with self._lock, self._conn:
+                command_id = self._conn.execute(
+                    "INSERT INTO commands (name, payload, created, reply_port) VALUES (?, ?, ?, ?)",
+                    (name, json.dumps(payload), time.time(), reply.getsockname()[1])).lastrowid
+            daemon_port = self.get("command_port")
+            if daemon_port is not None:
+                _notify(reply, daemon_port, command_id)
+            deadline = time.monotonic() + timeout
+            while True:
+                with self._lock:
+                    row = self._conn.execute("SELECT result FROM commands WHERE id = ?", (command_id,)).fetchone()
+                if row is not None and row[0] is not None:
+                    return json.loads(row[0])
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                reply.settimeout(min(remaining, COMMAND_POLL_INTERVAL))
+                try:
+                    reply.recv(64)
+                except OSError:
+                    pass  # Timed out: re-check in case the datagram was lost
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM commands WHERE id = ? AND result IS NULL", (command_id,))
+        return None
+
+    def serve(self, handler):
+        """Daemon: run handler(name, payload) for each queued command in a background thread"""
+        self._command_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._command_socket.bind((NOTIFY_HOST, 0))
+        self._command_socket.settimeout(COMMAND_POLL_INTERVAL)
+        self.put("command_port", self._command_socket.getsockname()[1])
+        thread = threading.Thread(target=self._serve, args=(handler,), name="shared-state-commands", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def _serve(self, handler):
+        commands = self._command_socket
+        while True:
+            try:
+                commands.recv(64)
+            except OSError:
+                pass  # Timed out: run anything whose wake-up datagram was lost
+            if self._stop_event.is_set():
+                return
+            try:
+                with self._lock:
+                    pending = self._conn.execute("SELECT id, name, payload, reply_port FROM commands "
+                                                 "WHERE result IS NULL ORDER BY id").fetchall()
+                for command_id, name, payload, reply_port in pending:
+                    try:
+                        result = handler(name, json.loads(payload))
+                    except Exception as e:
+                        print(f"Command {name} failed: {e}")
+                        result = {"error": str(e)}
+                    with self._lock, self._conn:
+                        self._conn.execute("UPDATE commands SET result = ? WHERE id = ?",
+                                           (json.dumps(result), command_id))
+                    if reply_port is not None:
+                        _notify(commands, reply_port, command_id)
+            except sqlite3.Error as e:
+                print(f"Shared state command error: {e}")
+
+    def start(self):
+        """Daemon: write queued events every interval"""
+        thread = threading.Thread(target=self._run, name="shared-state-writer", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Shared state write error: {e}")
+
+
+class BroadcastRelay:
+    """Web worker side of the Socket.IO stand-in
+
+    Tails the daemon's events into this worker's EventBroadcaster (which applies
+    each client's room filters) and re-emits the daemon's other messages as-is.
+    Events are skipped, not queued, while the worker has no clients.
+    """
+
+    def __init__(self, shared_state, socketio, broadcaster, interval=0.5, batch_limit=20000):
+        self.shared_state = shared_state
+        self.socketio = socketio
+        self.broadcaster = broadcaster
+        self.interval = interval
+        self.batch_limit = batch_limit
+        self.event_cursor = shared_state.last_id
+        self.message_cursor = shared_state.last_message_id()
+        self.relayed = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="broadcast-relay", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Broadcast relay error: {e}")
+
+    def poll(self):
+        state = self.shared_state
+        last_id = state.last_id
+        if last_id < self.event_cursor:
+            self.event_cursor = 0  # The daemon restarted and event ids began again
+        if self.broadcaster.client_count:
+            # Too far behind to be useful live: jump ahead like EventBroadcaster's bounded queue
+            self.event_cursor = max(self.event_cursor, last_id - self.batch_limit)
+            records, self.event_cursor = state.query(self.event_cursor, self.batch_limit)
+            for record in records:
+                self.broadcaster.publish(record.to_dict())
+            self.relayed += len(records)
+        else:
+            self.event_cursor = last_id
+
+        for message_id, event, data in state.messages(self.message_cursor):
+            self.socketio.emit(event, data)
+            self.message_cursor = message_id
@@ -0,0 +1,185 @@
+import math
+import time
+from hashlib import blake2b
+
+
+def hash64(item):
+    """Stable 64-bit hash, identical across processes (unlike the built-in hash())"""
+    if isinstance(item, str):
+        item = item.encode()
+    return int.from_bytes(blake2b(item, digest_size=8).digest(), 'little')
+
+
+class HyperLogLog:
+    """Fixed-size distinct counter; 2**p one-byte registers, ~1.04/sqrt(2**p) relative error
+
+    Supports add()/update()/len() so it can stand in for a set of IP strings.
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self._rank_bits = 64 - p
+        self._cached = 0
+
+    def add(self, item):
+        self.add_hash(hash64(item))
+
+    def add_hash(self, h):
+        index = h >> self._rank_bits
+        rank = self._rank_bits - (h & ((1 << self._rank_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            self._cached = None
+
+    def update(self, other):
+        """Merge another sketch with the same precision into this one"""
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        self._cached = None
+
+    def count(self):
+        if self._cached is None:
+            m = self.m
+            alpha = 0.7213 / (1 + 1.079 / m)
+            estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+            zeros = self.registers.count(0)
+            if estimate <= 2.5 * m and zeros:
+                estimate = m * math.log(m / zeros)  # Linear counting for small cardinalities
+            self._cached = int(round(estimate))
+        return self._cached
+
+    def __len__(self):
+        return self.count()
+
+    def clear(self):
+        self.registers = bytearray(self.m)
+        self._cached = 0
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in O(k) memory (Metwally et al. space-saving algorithm)"""
+
+    def __init__(self, k=32):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self._eviction_candidates = []
+
+    def add(self, item, weight=1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += weight
+        elif len(counts) < self.k:
+            counts[item] = weight
+            self.errors[item] = 0
+        else:
+            victim = self._pop_minimum()
+            floor = counts.pop(victim)
+            del self.errors[victim]
+            counts[item] = floor + weight
+            self.errors[item] = floor
+
+    def _pop_minimum(self):
+        """Return a key holding the minimum count, amortizing the O(k) scan over evictions"""
+        counts = self.counts
+        candidates = self._eviction_candidates
+        while candidates:
+            key, count = candidates.pop()
+            if counts.get(key) == count:
+                return key
+        floor = min(counts.values())
+        candidates.extend((key, count) for key, count in counts.items() if count == floor)
+        return candidates.pop()[0]
+
+    def update(self, other):
+        for item, count in other.counts.items():
+            self.add(item, count)
+
+    def top(self, n=10):
+        """[(item, estimated_count)] ordered by count, largest first"""
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+    def clear(self):
+        self.counts.clear()
+        self.errors.clear()
+        self._eviction_candidates.clear()
+
+
+class _Bucket:
+    __slots__ = ('index', 'packets', 'sources', 'talkers')
+
+    def __init__(self, index, p, k):
+        self.index = index
+        self.packets = 0
+        self.sources = HyperLogLog(p)
+        self.talkers = SpaceSaving(k)
+
+
+class SlidingWindow:
+    """Distinct sources and top talkers over the last span seconds, kept as rotating buckets"""
+
+    def __init__(self, span, buckets, p=10, k=32):
+        self.span = span
+        self.width = span / buckets
+        self.p = p
+        self.k = k
+        self._buckets = [None] * buckets
+
+    def add(self, item, h, now, count=1):
+        index = int(now // self.width)
+        slot = index % len(self._buckets)
+        bucket = self._buckets[slot]
+        if bucket is None or bucket.index != index:
+            bucket = self._buckets[slot] = _Bucket(index, self.p, self.k)
+        bucket.packets += count
+        bucket.sources.add_hash(h)
+        bucket.talkers.add(item, count)
+
+    def snapshot(self, now, top_n=10):
+        oldest = int(now // self.width) - len(self._buckets) + 1
+        sources = HyperLogLog(self.p)
+        talkers = SpaceSaving(self.k)
+        packets = 0
+        for bucket in self._buckets:
+            if bucket is not None and bucket.index >= oldest:
+                packets += bucket.packets
+                sources.update(bucket.sources)
+                talkers.update(bucket.talkers)
+        return {
+            "packets": packets,
+            "unique_sources": sources.count(),
+            "top_talkers": [{"ip": ip, "count": count} for ip, count in talkers.top(top_n)]
+        }
+
+
+class StreamingStats:
+    """Fixed-memory traffic statistics: all-time distinct sources plus 1m/5m/1h windows"""
+
+    WINDOWS = {"1m": (60, 12), "5m": (300, 10), "1h": (3600, 12)}
+
+    def __init__(self, p=14, window_p=10, k=32):
+        self.total_sources = HyperLogLog(p)
+        self.windows = {
+            name: SlidingWindow(span, buckets, window_p, k)
+            for name, (span, buckets) in self.WINDOWS.items()
+        }
+
+    def add_source(self, ip, now=None, count=1):
+        """Count packets from ip; count lets a caller fold a batch's packets per source into one call"""
+        if now is None:
+            now = time.time()
+        h = hash64(ip)
+        self.total_sources.add_hash(h)
+        for window in self.windows.values():
+            window.add(ip, h, now, count)
+
+    def unique_sources(self):
+        return self.total_sources.count()
+
+    def snapshot(self, now=None, top_n=10):
+        if now is None:
+            now = time.time()
+        return {name: window.snapshot(now, top_n) for name, window in self.windows.items()}
@@ -0,0 +1,96 @@
+import struct
+import threading
+import time
+
+# Linux AF_PACKET socket statistics (what libpcap reports as ps_recv / ps_drop)
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+_PACKET_STATS = struct.Struct('II')
+STATS_EVERY = 4096  # Packets between kernel statistics reads
+
+
+class RawSniffer:
+    """Background sniffer that hands raw frame bytes to a callback without scapy dissection
+
+    filter is a BPF expression attached to the socket, so unwanted frames never leave
+    the kernel, and only the first snaplen bytes of each frame are copied out. prn may
+    return False to report that it had to drop the frame.
+    """
+
+    def __init__(self, prn, iface=None, filter=None, snaplen=65535, poll_interval=0.5, stats=None):
+        self.prn = prn
+        self.iface = iface
+        self.filter = filter
+        self.snaplen = snaplen
+        self.poll_interval = poll_interval
+        self.running = False
+        self.error = None
+        # Counters are accumulated into this dict, which may outlive the sniffer
+        self.stats = stats if stats is not None else {}
+        for key in ("packets", "bytes", "dropped", "kernel_packets", "kernel_drops"):
+            self.stats.setdefault(key, 0)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self.error = None
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, join=True):
+        self._stop_event.set()
+        if join and self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 4)
+
+    def _run(self):
+        from scapy.config import conf
+        import scapy.arch  # noqa: F401 - sets conf.L2listen for this platform
+
+        sock = None
+        stats = self.stats
+        received = size = dropped = 0
+        try:
+            sock = conf.L2listen(iface=self.iface, filter=self.filter)
+            prn = self.prn
+            snaplen = self.snaplen
+            while not self._stop_event.is_set():
+                if sock.select([sock], self.poll_interval):
+                    _, data, ts = sock.recv_raw(snaplen)
+                    if data:
+                        if prn(data, ts if ts is not None else time.time()) is False:
+                            dropped += 1
+                        received += 1
+                        size += len(data)
+                    if received < STATS_EVERY:
+                        continue
+                # Publish counters every STATS_EVERY frames and whenever the interface is idle
+                stats["packets"] += received
+                stats["bytes"] += size
+                stats["dropped"] += dropped
+                received = size = dropped = 0
+                self._read_kernel_stats(sock)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Sniffer error on {self.iface or 'default interface'}: {e}")
+        finally:
+            if sock is not None:
+                stats["packets"] += received
+                stats["bytes"] += size
+                stats["dropped"] += dropped
+                self._read_kernel_stats(sock)
+                sock.close()
+            self.running = False
+
+    def _read_kernel_stats(self, sock):
+        """Add the kernel's received/dropped counts since the last read (reading resets them)"""
+        raw = getattr(sock, 'ins', None)
+        if raw is None or not hasattr(raw, 'getsockopt'):
+            return
+        try:
+            packets, drops = _PACKET_STATS.unpack(raw.getsockopt(SOL_PACKET, PACKET_STATISTICS, _PACKET_STATS.size))
+        except (OSError, struct.error):
+            return
+        self.stats["kernel_packets"] += packets
+        self.stats["kernel_drops"] += drops
@@ -0,0 +1,115 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+SEVERITIES = ("High", "Medium", "Low")
+PROTOCOLS = ("Modbus TCP", "TCP", "UDP", "ICMP", "Other")
+COLUMNS = SEVERITIES + PROTOCOLS
+
+# name: (bucket width in seconds, buckets kept)
+RESOLUTIONS = {
+    "1s": (1, 3600),      # Last hour at one-second resolution
+    "1m": (60, 1440),     # Last day per minute
+    "1h": (3600, 720)     # Last 30 days per hour
+}
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value):
+    """'90', '90s', '15m', '6h' or '7d' to seconds; ValueError unless finite and positive"""
+    text = str(value).strip().lower()
+    if text and text[-1] in _DURATION_UNITS:
+        seconds = float(text[:-1]) * _DURATION_UNITS[text[-1]]
+    else:
+        seconds = float(text)
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"Duration must be a positive number of seconds, got {value!r}")
+    return seconds
+
+
+class RingSeries:
+    """Fixed-size ring of count buckets, one row per bucket and one column per counter"""
+
+    def __init__(self, width, buckets, columns=len(COLUMNS)):
+        self.width = width
+        self.buckets = buckets
+        self.counts = np.zeros((buckets, columns), dtype=np.int64)
+        self.index = np.full(buckets, -1, dtype=np.int64)  # Absolute bucket number held by each slot
+
+    def add(self, ts, row):
+        """Add a row of counts to the bucket containing ts"""
+        bucket = int(ts // self.width)
+        slot = bucket % self.buckets
+        if self.index[slot] != bucket:
+            self.index[slot] = bucket
+            self.counts[slot] = 0
+        self.counts[slot] += row
+
+    def window(self, now, count):
+        """(bucket start times, counts[count, columns]) for the last count buckets up to now"""
+        count = min(count, self.buckets)
+        last = int(now // self.width)
+        wanted = np.arange(last - count + 1, last + 1, dtype=np.int64)
+        slots = wanted % self.buckets
+        counts = self.counts[slots]
+        counts[self.index[slots] != wanted] = 0
+        return wanted * self.width, counts
+
+
+class TimeSeries:
+    """Severity and protocol counts rolled up per second, minute and hour
+
+    record() only touches a small pending array; tick() folds it into every
+    resolution once per interval and returns the delta for pushing to clients.
+    """
+
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.series = {name: RingSeries(width, buckets) for name, (width, buckets) in resolutions.items()}
+        self._column = {name: i for i, name in enumerate(COLUMNS)}
+        self._other = self._column["Other"]
+        self._pending = np.zeros(len(COLUMNS), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def record(self, severity, protocol):
+        column = self._column
+        with self._lock:
+            pending = self._pending
+            if severity in column:
+                pending[column[severity]] += 1
+            pending[column.get(protocol, self._other)] += 1
+
+    def tick(self, now=None):
+        """Fold pending counts into the rings; returns {"ts", "counts"} with non-zero columns"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            row = self._pending
+            self._pending = np.zeros(len(COLUMNS), dtype=np.int64)
+            if row.any():
+                for series in self.series.values():
+                    series.add(now, row)
+        return {
+            "ts": int(now),
+            "counts": {COLUMNS[i]: int(row[i]) for i in np.flatnonzero(row)}
+        }
+
+    def query(self, resolution, range_seconds, now=None):
+        """Buckets covering the last range_seconds at the given resolution, one list per column"""
+        if resolution not in self.series:
+            raise ValueError(f"Unknown resolution {resolution!r}, expected one of {', '.join(self.series)}")
+        if now is None:
+            now = time.time()
+        series = self.series[resolution]
+        count = max(1, int(range_seconds // series.width))
+        with self._lock:
+            starts, counts = series.window(now, count)
+        return {
+            "resolution": resolution,
+            "step": series.width,
+            "timestamps": starts.tolist(),
+            "columns": list(COLUMNS),
+            "series": {name: counts[:, i].tolist() for i, name in enumerate(COLUMNS)}
+        }
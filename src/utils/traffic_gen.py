@@ -0,0 +1,214 @@
+import argparse
+import random
+import struct
+
+from .decoder import MODBUS_PORT, TCP_SYN, TCP_ACK, TCP_PSH
+from .pcap_writer import write_pcap
+
+DEFAULT_MIX = {"modbus": 0.85, "scan": 0.04, "spoof": 0.02, "flood": 0.05, "udp": 0.04}
+
+_ETH = struct.Struct('!6s6sH')
+_IPV4 = struct.Struct('!BBHHHBBH4s4s')
+_TCP = struct.Struct('!HHIIBBHHH')
+_UDP = struct.Struct('!HHHH')
+_MBAP = struct.Struct('!HHHB')
+
+
+def _addr(a, b, c, d):
+    return bytes((a, b, c, d))
+
+
+def _mac(addr):
+    return b'\x02\x00' + addr
+
+
+def _checksum(header):
+    total = sum(struct.unpack('!10H', header))
+    total = (total & 0xffff) + (total >> 16)
+    total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def ipv4_frame(src, dst, proto, transport, ident=0):
+    """Ethernet + IPv4 frame around an already built transport segment"""
+    header = _IPV4.pack(0x45, 0, 20 + len(transport), ident & 0xffff, 0x4000, 64, proto, 0, src, dst)
+    header = header[:10] + struct.pack('!H', _checksum(header)) + header[12:]
+    return _ETH.pack(_mac(dst), _mac(src), 0x0800) + header + transport
+
+
+def tcp_frame(src, dst, sport, dport, seq, ack, flags, payload=b'', ident=0):
+    segment = _TCP.pack(sport, dport, seq & 0xffffffff, ack & 0xffffffff, 0x50, flags, 8192, 0, 0)
+    return ipv4_frame(src, dst, 6, segment + payload, ident)
+
+
+def udp_frame(src, dst, sport, dport, payload=b'', ident=0):
+    return ipv4_frame(src, dst, 17, _UDP.pack(sport, dport, 8 + len(payload), 0) + payload, ident)
+
+
+def modbus_adu(transaction_id, unit_id, pdu):
+    return _MBAP.pack(transaction_id & 0xffff, 0, len(pdu) + 1, unit_id) + pdu
+
+
+class _Connection:
+    __slots__ = ('client', 'plc', 'sport', 'client_seq', 'plc_seq', 'tid', 'pending')
+
+    def __init__(self, client, plc, sport, rnd):
+        self.client = client
+        self.plc = plc
+        self.sport = sport
+        self.client_seq = rnd.getrandbits(32)
+        self.plc_seq = rnd.getrandbits(32)
+        self.tid = rnd.getrandbits(16)
+        self.pending = None
+
+
+class TrafficGenerator:
+    """Deterministic synthetic SCADA traffic: Modbus polling plus scans, spoofing and floods
+
+    The same seed, rate and mix always produce byte-identical frames, so PCAPs made
+    on different machines or commits can be compared directly.
+    """
+
+    def __init__(self, seed=0, start_ts=1700000000.0, rate=10000.0, clients=20, plcs=50, mix=None):
+        self.rnd = random.Random(seed)
+        self.start_ts = start_ts
+        self.rate = rate
+        mix = dict(mix or DEFAULT_MIX)
+        total = float(sum(mix.values()))
+        self.scenarios = []
+        cumulative = 0.0
+        for name, weight in mix.items():
+            if weight > 0:
+                cumulative += weight / total
+                self.scenarios.append((cumulative, getattr(self, f"_{name}")))
+
+        rnd = self.rnd
+        self.clients = [_addr(10, 10, 0, i + 1) for i in range(clients)]
+        self.plcs = [_addr(10, 20, i // 250, i % 250 + 1) for i in range(plcs)]
+        self.connections = [
+            _Connection(client, plc, 49152 + rnd.randrange(16000), rnd)
+            for client in self.clients for plc in self.plcs
+            if rnd.random() < max(0.1, 5.0 / plcs)
+        ] or [_Connection(self.clients[0], self.plcs[0], 49152, rnd)]
+        self.scanner = _addr(10, 99, 0, 5)
+        self.scan_target = self.plcs[0]
+        self.scan_port = 0
+        self.flood_target = self.plcs[-1]
+        self.ident = 0
+
+    def frames(self, count=None, max_bytes=None):
+        """Yield (data, ts) until count frames or max_bytes of frame data have been produced"""
+        rnd = self.rnd
+        scenarios = self.scenarios
+        produced = 0
+        size = 0
+        while (count is None or produced < count) and (max_bytes is None or size < max_bytes):
+            pick = rnd.random()
+            for cumulative, scenario in scenarios:
+                if pick <= cumulative:
+                    break
+            self.ident += 1
+            data = scenario()
+            yield data, self.start_ts + produced / self.rate
+            produced += 1
+            size += len(data) + 16
+
+    def _modbus(self):
+        """Request/response polling over persistent connections, with occasional exceptions"""
+        rnd = self.rnd
+        conn = self.connections[rnd.randrange(len(self.connections))]
+        unit = 1
+        if conn.pending is None:
+            conn.tid = (conn.tid + 1) & 0xffff
+            function = rnd.choice((3, 3, 3, 4, 4, 1, 16))
+            address = rnd.randrange(0, 1000)
+            if function == 16:
+                values = [rnd.randrange(65536) for _ in range(4)]
+                pdu = struct.pack('!BHHB', 16, address, 4, 8) + struct.pack('!4H', *values)
+            else:
+                pdu = struct.pack('!BHH', function, address, 10)
+            conn.pending = function
+            payload = modbus_adu(conn.tid, unit, pdu)
+            frame = tcp_frame(conn.client, conn.plc, conn.sport, MODBUS_PORT,
+                              conn.client_seq, conn.plc_seq, TCP_PSH | TCP_ACK, payload, self.ident)
+            conn.client_seq += len(payload)
+            return frame
+
+        function = conn.pending
+        conn.pending = None
+        if rnd.random() < 0.01:
+            pdu = struct.pack('!BB', function | 0x80, 2)
+        elif function == 16:
+            pdu = struct.pack('!BHH', 16, 0, 4)
+        elif function == 1:
+            pdu = struct.pack('!BB', 1, 2) + bytes((rnd.randrange(256), rnd.randrange(4)))
+        else:
+            pdu = struct.pack('!BB', function, 20) + bytes(rnd.randrange(256) for _ in range(20))
+        payload = modbus_adu(conn.tid, unit, pdu)
+        frame = tcp_frame(conn.plc, conn.client, MODBUS_PORT, conn.sport,
+                          conn.plc_seq, conn.client_seq, TCP_PSH | TCP_ACK, payload, self.ident)
+        conn.plc_seq += len(payload)
+        return frame
+
+    def _scan(self):
+        """One scanner walking the ports of one PLC with bare SYNs"""
+        self.scan_port = self.scan_port % 1024 + 1
+        return tcp_frame(self.scanner, self.scan_target, 40000 + self.scan_port % 1000, self.scan_port,
+                         self.rnd.getrandbits(32), 0, TCP_SYN, ident=self.ident)
+
+    def _spoof(self):
+        """Traffic to a PLC from loopback / 'this network' sources that can't be genuine"""
+        rnd = self.rnd
+        src = _addr(127, 0, 0, rnd.randrange(1, 255)) if rnd.random() < 0.5 else _addr(0, 0, 0, rnd.randrange(1, 255))
+        return tcp_frame(src, self.plcs[rnd.randrange(len(self.plcs))], rnd.randrange(1024, 65535), MODBUS_PORT,
+                         rnd.getrandbits(32), 0, TCP_SYN, ident=self.ident)
+
+    def _flood(self):
+        """SYN flood from many random sources converging on one PLC"""
+        rnd = self.rnd
+        src = _addr(172, 16 + rnd.randrange(16), rnd.randrange(256), rnd.randrange(1, 255))
+        return tcp_frame(src, self.flood_target, rnd.randrange(1024, 65535), MODBUS_PORT,
+                         rnd.getrandbits(32), 0, TCP_SYN, ident=self.ident)
+
+    def _udp(self):
+        """Background UDP (DNS/NTP-like) between workstations"""
+        rnd = self.rnd
+        client = self.clients[rnd.randrange(len(self.clients))]
+        port = rnd.choice((53, 123, 161))
+        return udp_frame(client, _addr(10, 0, 0, 2), rnd.randrange(1024, 65535), port,
+                         bytes(rnd.randrange(256) for _ in range(rnd.randrange(20, 120))), self.ident)
+
+
+def parse_mix(value):
+    """'modbus=0.9,scan=0.1' -> {"modbus": 0.9, "scan": 0.1}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown traffic type {name!r}, expected one of {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic SCADA PCAP")
+    parser.add_argument("output")
+    parser.add_argument("--packets", type=int, default=None, help="Number of frames (default 100000)")
+    parser.add_argument("--size-mb", type=float, default=None, help="Stop after this much capture data instead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=10000.0, help="Packets per second of capture time")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="Traffic mix, e.g. modbus=0.85,scan=0.05,spoof=0.02,flood=0.05,udp=0.03")
+    args = parser.parse_args(argv)
+
+    if args.packets is None and args.size_mb is None:
+        args.packets = 100000
+    max_bytes = int(args.size_mb * 1024 * 1024) if args.size_mb else None
+    generator = TrafficGenerator(args.seed, rate=args.rate, mix=args.mix)
+    count = write_pcap(args.output, generator.frames(args.packets, max_bytes))
+    print(f"Wrote {count} packets to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""Stateless web worker entry point for multi-worker deployments
+
+    python run_scada.py --role daemon                      # one capture/analysis daemon
+    gunicorn -w 4 --threads 50 -b 127.0.0.1:5000 src.wsgi:app
+
+The dashboard connects with the WebSocket transport only (see static/js/monitor.js):
+Socket.IO long-polling would need every request of a session to reach the same
+worker, which gunicorn's workers don't guarantee. Any proxy in front must pass
+WebSocket upgrades through.
+"""
+from .app import create_app
+
+app = create_app("web")
@@ -0,0 +1,80 @@
+"""Importing src.app stays cheap; create_app() builds the web state"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("numpy", "scapy", "pymodbus", "src.utils.analysis", "src.utils.capture", "src.utils.pipeline")
+
+IMPORT_PROBE = """
+import json, os, sqlite3, sys
+opened, made = [], []
+connect, makedirs = sqlite3.connect, os.makedirs
+sqlite3.connect = lambda *args, **kwargs: opened.append(str(args[0])) or connect(*args, **kwargs)
+os.makedirs = lambda *args, **kwargs: made.append(str(args[0])) or makedirs(*args, **kwargs)
+import src.app as scada
+print(json.dumps({
+    "opened": opened,
+    "made": made,
+    "heavy": [name for name in %r if name in sys.modules],
+    "built": [name for name in ("app", "socketio", "catalog", "event_store", "broadcaster")
+              if getattr(scada, name) is not None]
+}))
+""" % (HEAVY_MODULES,)
+
+
+def import_app_in_subprocess():
+    result = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=project_root, capture_output=True,
+                            text=True, check=True, timeout=60)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_has_no_side_effects():
+    probe = import_app_in_subprocess()
+    assert probe["opened"] == []
+    assert probe["made"] == []
+    assert probe["built"] == []
+
+
+def test_import_skips_heavy_dependencies():
+    assert import_app_in_subprocess()["heavy"] == []
+
+
+def test_create_app_builds_fresh_state(tmp_path, monkeypatch):
+    import src.app as scada
+    monkeypatch.setattr(scada, "CATALOG_PATH", str(tmp_path / "catalog.db"))
+
+    first = scada.create_app()
+    first_store = scada.event_store
+    second = scada.create_app()
+    assert first is not second
+    assert scada.event_store is not first_store
+    assert (tmp_path / "catalog.db").exists()
+
+    response = second.test_client().get("/api/stats")
+    assert response.status_code == 200
+    assert response.get_json()["total_events"] == 0
+    scada.catalog.close()
+
+
+def test_create_app_rejects_unknown_role():
+    import src.app as scada
+    with pytest.raises(ValueError, match="worker"):
+        scada.create_app("worker")
+
+
+def test_shutdown_without_a_server_hook_only_stops_monitoring(tmp_path, monkeypatch):
+    import src.app as scada
+    monkeypatch.setattr(scada, "CATALOG_PATH", str(tmp_path / "catalog.db"))
+    monkeypatch.setattr(scada, "scanning_active", True)
+    app = scada.create_app()
+
+    response = app.test_client().post("/api/control/shutdown")
+    assert response.status_code == 501
+    assert response.get_json()["status"] == "stopped"
+    assert scada.scanning_active is False
+    scada.catalog.close()
@@ -0,0 +1,32 @@
+from src.utils.assets import PrefixTable, parse_addr
+
+
+def test_longest_prefix_wins_regardless_of_insertion_order():
+    table = PrefixTable([("10.1.2.0/24", "cell"), ("10.0.0.0/8", "plant")])
+    table.add("10.1.0.0/16", "area")
+    table.add("10.1.2.7/32", "plc")
+    assert table.lookup(parse_addr("10.1.2.7")) == "plc"
+    assert table.lookup(parse_addr("10.1.2.8")) == "cell"
+    assert table.lookup(parse_addr("10.1.3.1")) == "area"
+    assert table.lookup(parse_addr("10.200.0.1")) == "plant"
+    assert table.lookup(parse_addr("192.168.0.1"), "unknown") == "unknown"
+    assert len(table) == 4
+
+
+def test_default_route_and_host_bits_in_prefix():
+    table = PrefixTable([("0.0.0.0/0", "any"), ("172.16.5.9/12", "corp")])  # Host bits are masked off
+    assert table.lookup(parse_addr("172.31.255.255")) == "corp"
+    assert table.lookup(parse_addr("172.32.0.0")) == "any"
+    assert table.lookup(0) == "any"
+
+
+def test_re_adding_a_prefix_replaces_its_value():
+    table = PrefixTable([("10.0.0.0/8", "old")])
+    table.add("10.0.0.0/8", "new")
+    assert table.lookup(parse_addr("10.9.9.9")) == "new" and len(table) == 1
+
+
+def test_parse_addr_accepts_ports_and_rejects_other_text():
+    assert parse_addr("10.0.0.1:502") == parse_addr("10.0.0.1") == 0x0a000001
+    assert parse_addr("fe80::1") is None
+    assert parse_addr(None) is None
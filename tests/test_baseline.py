@@ -0,0 +1,55 @@
+import struct
+
+from src.utils.baseline import ModbusBaseline, ModbusRateAnomaly
+from src.utils.decoder import TCP_ACK, TCP_PSH, decode_frame
+from src.utils.rules import ThreatAggregator
+from src.utils.traffic_gen import modbus_adu, tcp_frame
+
+HMI = bytes((10, 0, 0, 20))
+PLC = bytes((10, 0, 0, 10))
+
+
+def read_request(tid, ts):
+    pdu = struct.pack('!BHH', 3, 0, 10)
+    return decode_frame(tcp_frame(HMI, PLC, 40000, 502, tid * 12, 1, TCP_ACK | TCP_PSH, modbus_adu(tid, 1, pdu)), ts)
+
+
+def feed(baseline, threats, times):
+    """Observe a read request at each time, flushing every ten like the capture loop's batches"""
+    frames = [read_request(i, ts) for i, ts in enumerate(times)]
+    for i, frame in enumerate(frames):
+        baseline.observe(frame)
+        if i % 10 == 9:
+            baseline.flush(threats)
+    baseline.flush(threats)
+    return frames
+
+
+def steady(start, seconds, rate=2):
+    return [start + i / rate for i in range(seconds * rate)]
+
+
+def spike(start, requests=100):
+    return [start + i * 0.01 for i in range(requests)]
+
+
+def test_request_spike_is_flagged_once_the_rate_is_learned():
+    baseline = ModbusBaseline(interval=10.0, warmup=3)
+    threats = ThreatAggregator()
+    learned = feed(baseline, threats, steady(1000, 60))
+    assert len(threats) == 0 and all(frame.risk == 0 for frame in learned)
+    assert baseline.summary()["busiest"][0]["requests_per_second"] == 2.0
+
+    burst = feed(baseline, threats, spike(1060))
+    assert [(t["type"], t["source"]) for t in threats] == [(ModbusRateAnomaly.threat_type, "10.0.0.20")]
+    assert burst[0].risk == 0  # The first requests of the interval are within the learned rate
+    assert burst[-1].risk == 2
+
+
+def test_spike_during_warmup_is_not_flagged():
+    baseline = ModbusBaseline(interval=10.0, warmup=3)
+    threats = ThreatAggregator()
+    feed(baseline, threats, steady(1000, 20))  # Two complete intervals: still warming up
+    burst = feed(baseline, threats, spike(1020))
+    assert len(threats) == 0 and baseline.anomalies == 0
+    assert all(frame.risk == 0 for frame in burst)
@@ -0,0 +1,52 @@
+from src.utils.broadcaster import EventBroadcaster, ALL_EVENTS_ROOM
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, name, payload, to=None):
+        self.emitted.append((to, payload))
+
+
+def event(severity, source_ip="10.0.0.1"):
+    return {"severity": severity, "protocol": "Modbus TCP", "source_ip": source_ip, "target_ip": "10.0.0.2"}
+
+
+def test_queue_drops_are_reported_to_the_rooms_that_would_have_received_them():
+    socketio = FakeSocketIO()
+    broadcaster = EventBroadcaster(socketio, max_queue=1)
+    everything = broadcaster.subscribe("a")
+    high = broadcaster.subscribe("b", {"severity": "High"})
+    plc = broadcaster.subscribe("c", {"ip": "10.0.0.9"})
+
+    broadcaster.publish(event("Low"))
+    broadcaster.publish(event("High"))
+    broadcaster.publish(event("Low", "10.0.0.9"))
+    broadcaster.flush()
+
+    payloads = dict(socketio.emitted)
+    assert everything == ALL_EVENTS_ROOM
+    assert payloads[everything] == {"events": [event("Low")], "dropped": {"High": 1, "Low": 1}}
+    assert payloads[high] == {"events": [], "dropped": {"High": 1}}
+    assert payloads[plc] == {"events": [], "dropped": {"Low": 1}}
+    assert broadcaster.dropped == 2
+    assert {stats["room"]: stats["dropped"] for stats in broadcaster.room_stats()} == {everything: 2, high: 1, plc: 1}
+
+    socketio.emitted.clear()
+    broadcaster.flush()
+    assert socketio.emitted == []
+
+
+def test_oversized_room_batches_are_summarized_and_forgotten_with_the_room():
+    socketio = FakeSocketIO()
+    broadcaster = EventBroadcaster(socketio, max_room_batch=2)
+    room = broadcaster.subscribe("a", {"severity": ["Low"]})
+    for _ in range(5):
+        broadcaster.publish(event("Low"))
+    broadcaster.flush()
+
+    assert socketio.emitted == [(room, {"events": [event("Low")] * 2, "dropped": {"Low": 3}})]
+    assert broadcaster.room_stats() == [{"room": room, "filters": {"severity": ["Low"]}, "clients": 1, "dropped": 3}]
+    broadcaster.unsubscribe("a")
+    assert [stats["room"] for stats in broadcaster.room_stats()] == []
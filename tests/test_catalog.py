@@ -0,0 +1,97 @@
+import ipaddress
+
+import pytest
+
+from src.utils.catalog import Catalog
+from src.utils.pcap_index import HostSet
+from src.utils.retention import merge_into_rollup, new_rollup
+
+
+def host_set(ips, limit=1024):
+    hosts = HostSet(limit)
+    for ip in ips:
+        hosts.add(int(ipaddress.IPv4Address(ip)))
+    return hosts
+
+
+def report(hosts=None, top=(), threats=(), risk="Low", start=1000.0):
+    stats = {"total_packets": 10, "top_sources": list(top), "top_destinations": []}
+    if hosts is not None:
+        stats["hosts"] = hosts.to_dict()
+    return {
+        "report_metadata": {"pcap_file": "capture.pcap", "first_packet_ts": start, "last_packet_ts": start + 60},
+        "network_statistics": stats,
+        "security_analysis": {"risk_level": risk, "detected_threats": list(threats)}
+    }
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.db"))
+    yield catalog
+    catalog.close()
+
+
+def names(result):
+    return sorted(item["name"] for item in result["items"])
+
+
+def test_host_search_finds_hosts_outside_the_top_talkers(catalog):
+    catalog.add_report("/reports/a.json", report(host_set(["10.0.0.1", "10.0.3.7"]), top=["10.0.0.1"]))
+    catalog.add_report("/reports/b.json", report(host_set(["10.0.0.1"]), top=["10.0.0.1"]))
+
+    assert names(catalog.list_reports(host="10.0.3.7")) == ["a.json"]
+    assert names(catalog.list_reports(host="10.0.0.1")) == ["a.json", "b.json"]
+    assert catalog.list_reports(host="10.9.9.9")["total"] == 0
+
+
+def test_reports_past_the_host_limit_are_searched_by_bloom_filter(catalog):
+    ips = [f"10.1.{i // 256}.{i % 256}" for i in range(300)]
+    hosts = host_set(ips, limit=16)
+    assert not hosts.complete
+    catalog.add_report("/reports/big.json", report(hosts))
+
+    item = catalog.list_reports()["items"][0]
+    assert item["host_index"] == "filter"
+    assert all(names(catalog.list_reports(host=ip)) == ["big.json"] for ip in ips)
+    assert catalog.list_reports(host="192.0.2.1")["total"] == 0
+
+
+def test_older_reports_are_marked_partial(catalog):
+    legacy = report(top=["10.0.0.1"], threats=[{"type": "Port Scan", "source": "10.0.0.9:4444", "target": "10.0.0.2"}])
+    catalog.add_report("/reports/old.json", legacy)
+
+    assert catalog.list_reports()["items"][0]["host_index"] == "partial"
+    assert names(catalog.list_reports(host="10.0.0.9")) == ["old.json"]
+
+
+def test_report_filters_combine(catalog):
+    catalog.add_report("/reports/a.json", report(host_set(["10.0.0.1"]), risk="High", start=1000.0,
+                                                 threats=[{"type": "Port Scan", "source": "10.0.0.1", "target": "x"}]))
+    catalog.add_report("/reports/b.json", report(host_set(["10.0.0.1"]), risk="Low", start=5000.0))
+
+    assert names(catalog.list_reports(risk="High", host="10.0.0.1")) == ["a.json"]
+    assert names(catalog.list_reports(threat_type="Port Scan")) == ["a.json"]
+    assert names(catalog.list_reports(since=4000.0)) == ["b.json"]
+    assert catalog.list_reports(page=2, per_page=1)["items"][0]["name"] == "a.json"
+
+
+def test_removed_reports_leave_no_host_rows(catalog):
+    catalog.add_report("/reports/big.json", report(host_set([f"10.2.0.{i}" for i in range(40)], limit=8)))
+    catalog.remove("big.json")
+    assert catalog.list_reports(host="10.2.0.1")["total"] == 0
+
+
+def test_rollups_keep_every_host():
+    rollup = new_rollup("20260101")
+    merge_into_rollup(rollup, "a.json", report(host_set(["10.0.0.1"])))
+    merge_into_rollup(rollup, "b.json", report(host_set(["10.0.3.7"])))
+    assert rollup["network_statistics"]["hosts"]["ips"] == ["10.0.0.1", "10.0.3.7"]
+
+    merge_into_rollup(rollup, "c.json", report(host_set([f"10.1.0.{i}" for i in range(50)], limit=8)))
+    hosts = HostSet.from_dict(rollup["network_statistics"]["hosts"])
+    assert not hosts.complete
+    assert "10.0.3.7" in hosts and "10.1.0.49" in hosts
+
+    merge_into_rollup(rollup, "old.json", report(top=["10.0.0.1"]))
+    assert "hosts" not in rollup["network_statistics"]
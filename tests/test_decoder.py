@@ -0,0 +1,93 @@
+import socket
+import struct
+
+from src.utils.decoder import TCP_ACK, TCP_PSH, TCP_SYN, decode_frame, peek_flow
+
+SRC = "192.168.1.20"
+DST = "192.168.1.10"
+
+
+def ether(payload, vlans=0):
+    header = bytes(6) + b'\x02' + bytes(5)
+    for vlan in range(vlans):
+        header += struct.pack('!HH', 0x8100, 100 + vlan)
+    return header + struct.pack('!H', 0x0800) + payload
+
+
+def ipv4(proto, payload, options=b'', frag=0, total_length=None):
+    ihl = 5 + len(options) // 4
+    length = total_length if total_length is not None else ihl * 4 + len(payload)
+    header = struct.pack('!BBHHHBBH4s4s', 0x40 | ihl, 0, length, 1, frag, 64, proto, 0,
+                         socket.inet_aton(SRC), socket.inet_aton(DST))
+    return header + options + payload
+
+
+def tcp(sport, dport, payload=b'', flags=TCP_ACK | TCP_PSH, options=b'', seq=1000, ack=2000):
+    offset = (5 + len(options) // 4) << 4
+    return struct.pack('!HHIIBBHHH', sport, dport, seq, ack, offset, flags, 8192, 0, 0) + options + payload
+
+
+def mbap(tid, unit, pdu):
+    return struct.pack('!HHHB', tid, 0, len(pdu) + 1, unit) + pdu
+
+
+def test_tcp_behind_vlan_tags_and_ip_and_tcp_options():
+    data = ether(ipv4(6, tcp(40000, 80, b'hello', flags=TCP_SYN, options=bytes(12)), options=bytes(8)), vlans=2)
+    frame = decode_frame(data, 1.5)
+    assert (frame.src, frame.dst, frame.proto, frame.sport, frame.dport) == (SRC, DST, 6, 40000, 80)
+    assert (frame.flags, frame.seq, frame.ack) == (TCP_SYN, 1000, 2000)
+    assert frame.payload_offset == 14 + 8 + 28 + 32
+    assert bytes(frame.payload) == b'hello'
+    assert peek_flow(data) == (frame.src_addr, frame.dst_addr, 40000, 80)
+
+
+def test_modbus_read_request_and_response():
+    request = decode_frame(ether(ipv4(6, tcp(40000, 502, mbap(7, 3, struct.pack('!BHH', 3, 100, 10))))))
+    assert (request.modbus_tid, request.modbus_unit, request.modbus_fc) == (7, 3, 3)
+    assert (request.modbus_addr, request.modbus_qty, request.modbus_value) == (100, 10, None)
+
+    response = decode_frame(ether(ipv4(6, tcp(502, 40000, mbap(7, 3, struct.pack('!BBHH', 3, 4, 1234, 5))))))
+    assert (response.modbus_fc, response.modbus_qty, response.modbus_value) == (3, 2, 1234)
+    assert response.modbus_addr is None  # Filled in from the request by the flow table
+
+
+def test_modbus_writes_and_exceptions():
+    write = decode_frame(ether(ipv4(6, tcp(40000, 502, mbap(1, 1, struct.pack('!BHHBHH', 16, 20, 2, 4, 77, 88))))))
+    assert (write.modbus_addr, write.modbus_qty, write.modbus_value) == (20, 2, 77)
+
+    single = decode_frame(ether(ipv4(6, tcp(40000, 502, mbap(2, 1, struct.pack('!BHH', 6, 30, 99))))))
+    assert (single.modbus_addr, single.modbus_qty, single.modbus_value) == (30, 1, 99)
+
+    exception = decode_frame(ether(ipv4(6, tcp(502, 40000, mbap(2, 1, struct.pack('!BB', 0x86, 2))))))
+    assert (exception.modbus_fc, exception.modbus_exc, exception.modbus_addr) == (0x86, 2, None)
+
+
+def test_non_modbus_protocol_id_is_not_decoded_as_modbus():
+    pdu = struct.pack('!HHHBBHH', 1, 5, 6, 1, 3, 0, 1)
+    frame = decode_frame(ether(ipv4(6, tcp(40000, 502, pdu))))
+    assert frame.is_modbus and frame.modbus_fc is None
+
+
+def test_truncated_capture_keeps_wire_lengths():
+    full = ether(ipv4(6, tcp(40000, 502, mbap(9, 1, struct.pack('!BHH', 3, 0, 125)) + bytes(200))))
+    frame = decode_frame(full[:68])  # Snaplen covers the MBAP header and request PDU only
+    assert frame.length == len(full)
+    assert frame.payload_len == 12 + 200
+    assert (frame.modbus_fc, frame.modbus_addr, frame.modbus_qty) == (3, 0, 125)
+
+
+def test_udp_and_non_first_fragments():
+    udp = decode_frame(ether(ipv4(17, struct.pack('!HHHH', 5353, 53, 12, 0) + b'abcd')))
+    assert (udp.sport, udp.dport, udp.payload_len) == (5353, 53, 4)
+
+    data = ether(ipv4(6, bytes(40), frag=185))
+    fragment = decode_frame(data)
+    assert (fragment.src, fragment.proto, fragment.sport) == (SRC, 6, None)
+    assert peek_flow(data)[2:] == (0, 0)
+
+
+def test_short_and_non_ip_frames():
+    assert decode_frame(b'\x00' * 10).src is None
+    arp = decode_frame(bytes(6) + b'\x02' + bytes(5) + struct.pack('!H', 0x0806) + bytes(28))
+    assert (arp.proto, arp.ethertype, arp.src) == (None, 0x0806, "02:00:00:00:00:00")
+    assert peek_flow(arp.data) is None
@@ -0,0 +1,72 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from src.utils.event_store import EventStore
+
+
+def event(i, severity="Low", src="10.0.0.1"):
+    return {"ts": 1700000000.0 + i, "source_ip": src, "target_ip": "10.0.0.2", "protocol": "TCP",
+            "severity": severity, "packet_info": f"frame {i}",
+            "modbus_details": {"function_code": 3, "unit_id": 1, "data_length": 12}}
+
+
+def ids(records):
+    return [record.id for record in records]
+
+
+def test_cursor_pages_through_events_in_order():
+    store = EventStore(capacity=100)
+    for i in range(25):
+        store.append(event(i))
+    page, cursor = store.query(since_id=0, limit=10)
+    assert ids(page) == list(range(1, 11)) and cursor == 10
+    page, cursor = store.query(since_id=cursor, limit=10)
+    assert ids(page) == list(range(11, 21)) and cursor == 20
+    page, cursor = store.query(since_id=cursor, limit=10)
+    assert ids(page) == list(range(21, 26)) and cursor == 25
+    assert store.query(since_id=cursor) == ([], 25)
+
+    record = page[0].to_dict()
+    assert record["timestamp"] == datetime.fromtimestamp(1700000020).strftime("%Y-%m-%d %H:%M:%S")
+    assert record["modbus_details"] == {"function_code": 3, "unit_id": 1, "data_length": 12}
+
+
+def test_cursor_skips_events_overwritten_after_wraparound():
+    store = EventStore(capacity=10)
+    for i in range(35):
+        store.append(event(i))
+    assert len(store) == 10 and store.last_id == 35
+    page, cursor = store.query(since_id=3, limit=4)
+    assert ids(page) == [26, 27, 28, 29] and cursor == 29
+    page, cursor = store.query(since_id=cursor, limit=100)
+    assert ids(page) == [30, 31, 32, 33, 34, 35]
+    assert [record.ts for record in page] == [1700000000.0 + i for i in range(29, 35)]
+
+
+def test_filtered_query_advances_cursor_past_non_matching_events():
+    store = EventStore(capacity=50)
+    for i in range(20):
+        store.append(event(i, "High" if i % 5 == 0 else "Low", src="10.0.0.9" if i == 7 else "10.0.0.1"))
+    page, cursor = store.query(since_id=0, limit=2, severities={"High"})
+    assert ids(page) == [1, 6] and cursor == 6
+    page, cursor = store.query(since_id=cursor, limit=10, severities={"High"})
+    assert ids(page) == [11, 16] and cursor == 20
+    assert ids(store.query(ip="10.0.0.9")[0]) == [8]
+
+
+def test_events_need_a_timestamp():
+    with pytest.raises(KeyError):
+        EventStore().append({"timestamp": "2024-01-01 00:00:00", "source_ip": "10.0.0.1", "severity": "Low"})
+
+
+def test_concurrent_appends_get_unique_ids():
+    store = EventStore(capacity=10000)
+    threads = [threading.Thread(target=lambda: [store.append(event(i)) for i in range(1000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    page, cursor = store.query(limit=10000)
+    assert ids(page) == list(range(1, 4001)) and cursor == 4000
@@ -0,0 +1,91 @@
+import struct
+
+from src.utils.decoder import TCP_ACK, TCP_PSH, decode_frame
+from src.utils.flows import FlowTable, NetworkMetrics
+from src.utils.traffic_gen import modbus_adu, tcp_frame
+
+HMI = bytes((10, 0, 0, 5))
+PLC = bytes((10, 0, 0, 10))
+
+
+class Connection:
+    """One HMI-to-PLC Modbus connection that tracks its own sequence numbers"""
+
+    def __init__(self, sport=40000, client=HMI):
+        self.sport = sport
+        self.client = client
+        self.seq = [1000, 5000]
+
+    def _segment(self, direction, payload, ts, resend=False):
+        seq = self.seq[direction] - (len(payload) if resend else 0)
+        if not resend:
+            self.seq[direction] += len(payload)
+        src, dst, sport, dport = (self.client, PLC, self.sport, 502) if direction == 0 else \
+            (PLC, self.client, 502, self.sport)
+        return decode_frame(tcp_frame(src, dst, sport, dport, seq, 0, TCP_ACK | TCP_PSH, payload), ts)
+
+    def request(self, tid, ts, address=100, resend=False):
+        return self._segment(0, modbus_adu(tid, 1, struct.pack('!BHH', 3, address, 2)), ts, resend)
+
+    def response(self, tid, ts, fc=3):
+        pdu = struct.pack('!BBHH', 3, 4, 1, 2) if fc == 3 else struct.pack('!BB', fc, 2)
+        return self._segment(1, modbus_adu(tid, 1, pdu), ts)
+
+
+def feed(table, metrics, frames):
+    for frame in frames:
+        table.update(frame, metrics)
+    return metrics.summary()
+
+
+def test_matches_responses_to_requests_by_transaction_id():
+    table, metrics, conn = FlowTable(), NetworkMetrics(), Connection()
+    frames = [conn.request(1, 1.0, address=7), conn.request(2, 1.001, address=9), conn.response(1, 1.004),
+              conn.response(2, 1.0105), conn.response(99, 1.02), conn.request(3, 1.1), conn.response(3, 1.102, fc=0x83)]
+    summary = feed(table, metrics, frames)
+    device = summary["latency"]["10.0.0.10"]
+    assert (device["requests"], device["responses"], device["exceptions"]) == (3, 3, 1)
+    assert (frames[2].modbus_addr, frames[3].modbus_addr) == (7, 9)  # Read responses take their request's address
+    assert device["max_ms"] == 9.5 and device["count"] == 3
+    assert summary["exception_rate"] == round(1 / 3, 4) and summary["packet_loss"] == 0
+
+
+def test_unmatched_response_and_reused_transaction_id():
+    table, metrics, conn = FlowTable(), NetworkMetrics(), Connection()
+    summary = feed(table, metrics, [conn.response(5, 0.5), conn.request(1, 1.0), conn.request(1, 2.0),
+                                    conn.response(1, 2.002)])
+    device = summary["latency"]["10.0.0.10"]
+    assert (device["requests"], device["responses"], device["count"]) == (2, 1, 1)
+    assert device["max_ms"] == 2.0  # Timed from the request that reused the ID
+    assert summary["packet_loss"] == 0.5
+
+
+def test_retransmissions_are_counted_once_and_not_matched_again():
+    table, metrics, conn = FlowTable(), NetworkMetrics(), Connection()
+    summary = feed(table, metrics, [conn.request(1, 1.0), conn.request(1, 1.2, resend=True),
+                                    conn.response(1, 1.25)])
+    device = summary["latency"]["10.0.0.10"]
+    assert (device["requests"], device["responses"], device["max_ms"]) == (1, 1, 250.0)
+    assert summary["retransmission_rate"] == round(1 / 3, 4)
+
+
+def test_capacity_and_idle_eviction_count_open_requests_as_unanswered():
+    table, metrics = FlowTable(capacity=2, idle_timeout=10), NetworkMetrics()
+    first, second, third = Connection(40001), Connection(40002), Connection(40003)
+    feed(table, metrics, [first.request(1, 1.0), second.request(1, 2.0), third.request(1, 3.0)])
+    assert len(table) == 2 and table.evicted == 1  # The least recently used flow went first
+
+    summary = feed(table, metrics, [Connection(40004).request(1, 30.0)])  # The rest have been idle past 10s
+    assert len(table) == 1 and table.evicted == 3
+    assert summary["latency"]["10.0.0.10"]["requests"] == 4 and summary["packet_loss"] == 0.75
+
+
+def test_metrics_merge_adds_device_counters():
+    table, a, b = FlowTable(), NetworkMetrics(), NetworkMetrics()
+    conn = Connection()
+    feed(table, a, [conn.request(1, 1.0), conn.response(1, 1.001)])
+    feed(table, b, [conn.request(2, 2.0), conn.response(2, 2.003)])
+    a.merge(b)
+    summary = a.summary()
+    assert summary["modbus_requests"] == 2 and summary["overall_latency"]["count"] == 2
+    assert summary["throughput_bps"] == round(a.bytes * 8 / 1.003)
@@ -0,0 +1,103 @@
+import asyncio
+import socket
+
+import pytest
+
+pymodbus = pytest.importorskip("pymodbus")
+
+from pymodbus.datastore import ModbusDeviceContext, ModbusSequentialDataBlock, ModbusServerContext
+from pymodbus.server import ServerAsyncStop, StartAsyncTcpServer
+
+from src.utils.modbus_poller import Device, ModbusPoller, Point, coalesce, MAX_READ_BITS, MAX_READ_REGISTERS
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spans(blocks):
+    return [(block.table, block.address, block.count, [point.name for point in block.points]) for block in blocks]
+
+
+def test_coalesce_merges_overlapping_and_nearby_points_per_table():
+    points = [Point("c", "holding", 10, 2), Point("a", "holding", 0, 4), Point("b", "holding", 2, 3),
+              Point("d", "input", 4), Point("e", "holding", 15)]
+    assert spans(coalesce(points)) == [("holding", 0, 5, ["a", "b"]), ("holding", 10, 2, ["c"]),
+                                       ("holding", 15, 1, ["e"]), ("input", 4, 1, ["d"])]
+    assert spans(coalesce(points, max_gap=5)) == [("holding", 0, 16, ["a", "b", "c", "e"]), ("input", 4, 1, ["d"])]
+
+
+def test_coalesce_starts_a_new_read_at_the_protocol_limits():
+    registers = [Point(f"r{i}", "holding", i * 50, 50) for i in range(4)]
+    assert [(b.address, b.count) for b in coalesce(registers, max_gap=10)] == [(0, 100), (100, 100)]
+    exact = [Point("x", "holding", 0, 100), Point("y", "holding", 100, MAX_READ_REGISTERS - 100)]
+    assert [(b.address, b.count) for b in coalesce(exact)] == [(0, MAX_READ_REGISTERS)]
+
+    bits = [Point(f"b{i}", "coil", i * 1000, 1000) for i in range(3)]
+    assert [(b.address, b.count) for b in coalesce(bits)] == [(0, MAX_READ_BITS), (2000, 1000)]
+    assert len(coalesce(bits, max_bits=1500)) == 3
+
+
+def test_coalesce_rejects_point_larger_than_one_request():
+    with pytest.raises(ValueError, match="big"):
+        Point("big", "holding", 0, MAX_READ_REGISTERS + 1)
+    point = Point("big", "holding", 0, 100)
+    with pytest.raises(ValueError, match="big"):
+        coalesce([point], max_registers=50)
+
+
+def test_device_config_rejects_oversized_point():
+    with pytest.raises(ValueError):
+        Device({"host": "127.0.0.1", "points": [{"name": "bits", "table": "coil", "address": 0, "count": 2001}]})
+
+
+def test_polls_simulator_with_coalesced_reads_and_opens_breaker_for_dead_device():
+    port = free_port()
+    registers = list(range(100, 120))
+    context = ModbusServerContext(devices=ModbusDeviceContext(
+        hr=ModbusSequentialDataBlock(1, registers),  # pymodbus blocks start at 1 for protocol address 0
+        co=ModbusSequentialDataBlock(1, [True, False] * 8)
+    ), single=True)
+    plc = Device({
+        "name": "plc", "host": "127.0.0.1", "port": port, "interval": 0.05, "timeout": 1.0,
+        "points": [
+            {"name": "level", "table": "holding", "address": 0, "count": 2},
+            {"name": "setpoint", "table": "holding", "address": 2},
+            {"name": "flow", "table": "holding", "address": 10},
+            {"name": "pump", "table": "coil", "address": 0},
+            {"name": "valve", "table": "coil", "address": 1}
+        ]
+    })
+    dead = Device({"name": "dead", "host": "127.0.0.1", "port": free_port(), "interval": 0.05, "timeout": 0.5,
+                   "failure_threshold": 2, "reset_timeout": 60.0,
+                   "points": [{"name": "x", "table": "holding", "address": 0}]})
+    assert len(plc.blocks) == 3  # holding 0-2, holding 10, coils 0-1
+    opened = []
+    poller = ModbusPoller([plc, dead], on_failure=lambda device, error, breaker_opened: opened.append(
+        (device.name, breaker_opened)))
+
+    async def scenario():
+        server = asyncio.create_task(StartAsyncTcpServer(context, address=("127.0.0.1", port)))
+        await asyncio.sleep(0.3)
+        poller.running = True
+        polling = asyncio.create_task(poller.run())
+        try:
+            for _ in range(100):
+                if plc.polls >= 2 and dead.breaker.state == "open":
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            poller.running = False
+            await polling
+            await ServerAsyncStop()
+            await server
+
+    asyncio.run(scenario())
+
+    assert plc.values == {"level": [100, 101], "setpoint": 102, "flow": 110, "pump": True, "valve": False}
+    assert plc.requests == plc.polls * len(plc.blocks)
+    assert dead.breaker.state == "open"
+    assert dead.polls == 0 and dead.failures == 2
+    assert ("dead", True) in opened
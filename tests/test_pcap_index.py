@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from src.utils.pcap_index import EMPTY_PCAP_HEADER, extract_pcap, index_path
+from src.utils.pcap_reader import GLOBAL_HEADER_SIZE, iter_records, read_header
+from src.utils.pcap_writer import RotatingPcapWriter
+from src.utils.traffic_gen import tcp_frame
+
+HOSTS = [bytes((10, 0, 0, n)) for n in (1, 2, 3)]
+PLC = bytes((10, 0, 0, 10))
+
+
+@pytest.fixture
+def captures(tmp_path):
+    """Two indexed captures, 1000-1099 and 1100-1199, with one frame per 0.5s cycling through HOSTS"""
+    closed = []
+    writer = RotatingPcapWriter(str(tmp_path), max_bytes=10 ** 9, on_rotate=closed.append)
+    for i in range(400):
+        if i == 200:
+            writer.rotate()
+        src = HOSTS[i % 3]
+        writer.write(tcp_frame(src, PLC, 40000 + i % 3, 502, i, 0, 0x18), 1000 + i * 0.5,
+                     (int.from_bytes(src, 'big'), int.from_bytes(PLC, 'big')))
+    writer.close()
+    return [info["pcap_file"] for info in closed]
+
+
+def extract(tmp_path, pcap_files, *args, **kwargs):
+    path = tmp_path / "extract.pcap"
+    path.write_bytes(b''.join(extract_pcap(pcap_files, *args, **kwargs)))
+    with open(path, 'rb') as fh:
+        header = read_header(fh)
+        return [(ts, data[26:30]) for data, ts, _ in iter_records(fh, header)]
+
+
+def test_time_window_spans_files_and_excludes_the_edges(tmp_path, captures):
+    records = extract(tmp_path, captures, 1090, 1110.25)
+    assert [ts for ts, _ in records] == [1090 + i * 0.5 for i in range(41)]
+
+
+def test_ip_and_port_filters(tmp_path, captures):
+    records = extract(tmp_path, captures, 1000, 1200, ip="10.0.0.2")
+    assert len(records) == 133 and {src for _, src in records} == {HOSTS[1]}
+    assert len(extract(tmp_path, captures, 1000, 1200, port=40002)) == 133
+    assert len(extract(tmp_path, captures, 1000, 1200, ip="10.0.0.2", port=40000)) == 0
+
+
+def test_empty_extract_is_still_a_valid_pcap(tmp_path, captures):
+    assert extract(tmp_path, captures, 5000, 6000) == []
+    with open(captures[0], 'rb') as fh:
+        assert b''.join(extract_pcap(captures, 5000, 6000)) == fh.read(GLOBAL_HEADER_SIZE)
+    assert extract(tmp_path, captures, 1000, 1200, ip="192.168.1.1") == []
+
+
+def test_deleted_captures_are_skipped(tmp_path, captures):
+    for pcap_file in captures:
+        os.remove(pcap_file)
+    os.remove(index_path(captures[0]))
+    assert b''.join(extract_pcap(captures, 1000, 1200)) == EMPTY_PCAP_HEADER
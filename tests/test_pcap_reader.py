@@ -0,0 +1,90 @@
+import struct
+
+import pytest
+
+from src.utils.pcap_reader import (GLOBAL_HEADER_SIZE, _resync, iter_pcap, open_pcap, overlap_start, read_header,
+                                   split_pcap)
+from src.utils.retention import compress_pcap
+
+FIRST_TS = 1700000000
+
+
+def write_pcap(path, frames):
+    """Write frames to a classic pcap; returns the offset of each record"""
+    offsets = []
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for i, frame in enumerate(frames):
+            offsets.append(f.tell())
+            f.write(struct.pack('<IIII', FIRST_TS + i // 10, i * 1000, len(frame), len(frame)) + frame)
+    return offsets
+
+
+def frames(count=300):
+    return [bytes([i % 251]) + b'\xff' * (20 + i * 37 % 180) for i in range(count)]
+
+
+@pytest.fixture
+def capture(tmp_path):
+    path = str(tmp_path / "capture.pcap")
+    sent = frames()
+    return path, sent, write_pcap(path, sent)
+
+
+def records(path, ranges):
+    return [data for start, end in ranges for data, _ in iter_pcap(path, start, end)]
+
+
+def test_split_ranges_start_on_records_and_cover_the_file(capture):
+    path, sent, offsets = capture
+    ranges = split_pcap(path, 2000)
+    assert len(ranges) > 10
+    assert ranges[0][0] == GLOBAL_HEADER_SIZE and ranges[-1][1] == offsets[-1] + 16 + len(sent[-1])
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert {start for start, _ in ranges} <= set(offsets)
+    assert records(path, ranges) == sent
+
+
+def test_small_file_is_one_range(capture):
+    path, sent, offsets = capture
+    size = offsets[-1] + 16 + len(sent[-1])
+    assert split_pcap(path, size) == [(GLOBAL_HEADER_SIZE, size)]
+
+
+def test_resync_finds_the_next_record_from_any_offset(capture):
+    path, _, offsets = capture
+    with open(path, 'rb') as fh:
+        header = read_header(fh)
+        for offset in range(GLOBAL_HEADER_SIZE, offsets[40]):
+            assert _resync(fh, header, offset, FIRST_TS) == min(o for o in offsets if o >= offset)
+
+
+def test_resync_skips_a_lone_header_lookalike_inside_a_payload(tmp_path):
+    fake = struct.pack('<IIII', FIRST_TS, 0, 4, 4) + b'abcd' + b'\xff' * 16
+    path = str(tmp_path / "capture.pcap")
+    offsets = write_pcap(path, [b'\xff' * 30, b'\xff' * 8 + fake, b'\xff' * 30, b'\xff' * 30])
+    with open(path, 'rb') as fh:
+        header = read_header(fh)
+        assert _resync(fh, header, offsets[1] + 17, FIRST_TS) == offsets[2]
+
+
+def test_overlap_start_backs_up_to_a_record_boundary(capture):
+    path, _, offsets = capture
+    start = offsets[200]
+    boundary = overlap_start(path, start, 1000)
+    assert boundary in offsets and start - 1000 <= boundary < start
+    assert overlap_start(path, offsets[2], 10 ** 6) == GLOBAL_HEADER_SIZE
+
+
+def test_compressed_capture_splits_on_members(capture):
+    path, sent, _ = capture
+    gz = compress_pcap(path, chunk_bytes=1000)
+    with open_pcap(gz) as reader:
+        members = [chunk[0] for chunk in reader.chunks]
+    assert len(members) > 20
+
+    ranges = split_pcap(gz, 3000)
+    assert 1 < len(ranges) < len(members)
+    assert {start for start, _ in ranges[1:]} <= set(members)
+    assert records(gz, ranges) == sent
+    assert overlap_start(gz, ranges[-1][0], 2000) in members
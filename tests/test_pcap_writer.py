@@ -0,0 +1,65 @@
+import os
+
+from src.utils.pcap_index import PcapIndex
+from src.utils.pcap_reader import iter_pcap, read_header
+from src.utils.pcap_writer import RotatingPcapWriter
+
+
+def test_rotates_by_size_and_reports_each_closed_file(tmp_path):
+    closed = []
+    writer = RotatingPcapWriter(str(tmp_path), max_bytes=24 + 3 * (16 + 100), on_rotate=closed.append)
+    for i in range(7):
+        writer.write(bytes([i]) * 100, ts=1000.0 + i, hosts=(0x0a000001 + i,))
+    writer.close()
+
+    assert [info["packet_count"] for info in closed] == [3, 3, 1]
+    assert len({info["pcap_file"] for info in closed}) == 3  # Same-second names get a sequence suffix
+    first = closed[0]
+    assert (first["first_ts"], first["last_ts"], first["size"]) == (1000.0, 1002.0, os.path.getsize(first["pcap_file"]))
+    assert [(data[0], ts) for info in closed for data, ts in iter_pcap(info["pcap_file"])] == \
+        [(i, 1000.0 + i) for i in range(7)]
+
+
+def test_index_sidecar_records_offsets_and_hosts(tmp_path):
+    closed = []
+    writer = RotatingPcapWriter(str(tmp_path), on_rotate=closed.append, index_interval=1.0)
+    for i in range(10):
+        writer.write(bytes(60), ts=1000.0 + i * 0.5, hosts=("10.0.0.1", "10.0.0.2"))
+    writer.close()
+
+    index = PcapIndex.load(closed[0]["index_file"])
+    assert index.packet_count == 10 and index.timestamps == [1000.0, 1001.0, 1002.0, 1003.0, 1004.0]
+    assert index.seek_offset(1002.5) == 24 + 4 * (16 + 60)
+    assert index.may_contain("10.0.0.2")
+
+
+def test_rotates_by_age_and_truncates_to_snaplen(tmp_path, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("src.utils.pcap_writer.time.monotonic", lambda: clock[0])
+    closed = []
+    writer = RotatingPcapWriter(str(tmp_path), max_seconds=60, snaplen=64, on_rotate=closed.append,
+                                index_interval=0)
+    writer.maybe_rotate()  # Nothing open yet
+    writer.write(bytes(200), ts=1.0)
+    clock[0] += 59
+    writer.maybe_rotate()
+    assert not closed
+    clock[0] += 1
+    writer.maybe_rotate()
+    assert len(closed) == 1 and closed[0]["index_file"] is None and writer.current_file is None
+
+    with open(closed[0]["pcap_file"], 'rb') as fh:
+        assert read_header(fh).snaplen == 64
+        record = fh.read()
+    assert record[8:16] == (64).to_bytes(4, 'little') + (200).to_bytes(4, 'little')
+
+
+def test_callback_errors_do_not_stop_the_writer(tmp_path):
+    def fail(info):
+        raise RuntimeError("catalog down")
+
+    writer = RotatingPcapWriter(str(tmp_path), max_bytes=1, on_rotate=fail)
+    writer.write(b'a' * 60, ts=1.0)
+    writer.write(b'b' * 60, ts=2.0)
+    writer.close()
+    assert len(os.listdir(tmp_path)) == 4  # Two captures, two index sidecars
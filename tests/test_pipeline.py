@@ -0,0 +1,176 @@
+import os
+import random
+import signal
+import time
+
+import pytest
+
+from src.utils.decoder import TCP_SYN, peek_flow
+from src.utils.pipeline import ShardedPipeline, ShmRing, shard_for
+from src.utils.traffic_gen import TrafficGenerator, tcp_frame
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing(100)
+    yield ring
+    ring.close()
+
+
+def frame(n, size):
+    return bytes([n % 256]) * size
+
+
+def test_wraps_when_tail_is_too_short_for_a_record_header(ring):
+    assert ring.put_batch([(frame(i, 20), float(i)) for i in range(3)]) == 3  # 3 x 32 bytes, 4 left
+    assert ring.get_batch(2) == [(frame(0, 20), 0.0), (frame(1, 20), 1.0)]
+    assert ring.put_batch([(frame(3, 20), 3.0)]) == 1
+    assert ring.get_batch() == [(frame(2, 20), 2.0), (frame(3, 20), 3.0)]
+    assert ring.free_space() == ring.capacity
+
+
+def test_wraps_past_wrap_record_and_keeps_markers_in_order(ring):
+    assert ring.put_batch([(frame(0, 28), 0.0), (frame(1, 28), 1.0)]) == 2  # 2 x 40 bytes, 20 left
+    assert ring.get_batch(1) == [(frame(0, 28), 0.0)]
+    assert ring.put_marker(7, timeout=0)
+    assert ring.put_batch([(frame(2, 28), 2.0)]) == 1  # Only 8 bytes left at the end: wraps
+    assert ring.get_batch() == [(frame(1, 28), 1.0), (None, 7), (frame(2, 28), 2.0)]
+
+
+def test_full_ring_accepts_a_prefix_and_marker_times_out(ring):
+    assert ring.put_batch([(frame(i, 30), float(i)) for i in range(4)]) == 2
+    assert ring.put_marker(1, timeout=0)
+    assert not ring.put_marker(2, timeout=0.01)
+    assert [ts for _, ts in ring.get_batch()] == [0.0, 1.0, 1]
+
+
+def test_records_survive_many_wraps_in_order():
+    ring = ShmRing(1000)
+    rng = random.Random(1)
+    sent, received = [], []
+    try:
+        for n in range(2000):
+            pending = [(frame(n + i, rng.randint(0, 120)), float(n + i)) for i in range(rng.randint(1, 8))]
+            sent.extend(pending[:ring.put_batch(pending)])
+            received.extend(ring.get_batch(rng.randint(1, 8)))
+        received.extend(ring.get_batch(10000))
+    finally:
+        ring.close()
+    assert received == sent and len(sent) > 5000
+
+
+def test_attached_ring_sees_the_producers_records(ring):
+    consumer = ShmRing(name=ring.name)
+    try:
+        ring.put_batch([(b'abc', 1.0)])
+        assert consumer.get_batch() == [(b'abc', 1.0)]
+        assert ring.free_space() == ring.capacity
+    finally:
+        consumer.close()
+
+
+def test_shard_for_sends_both_directions_to_the_same_worker():
+    rng = random.Random(2)
+    for _ in range(1000):
+        src, dst = rng.getrandbits(32), rng.getrandbits(32)
+        sport, dport = rng.getrandbits(16), rng.getrandbits(16)
+        shard = shard_for((src, dst, sport, dport), 4)
+        assert 0 <= shard < 4
+        assert shard == shard_for((dst, src, dport, sport), 4)
+    assert shard_for(None, 4) == 0
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def epochs():
+    return []
+
+
+@pytest.fixture
+def pipeline(request, epochs):
+    pipeline = ShardedPipeline(2, on_epoch=lambda info, analysis: epochs.append((info, analysis)),
+                               ring_bytes=256 * 1024, **getattr(request, "param", {}))
+    pipeline.start()
+    yield pipeline
+    for process in pipeline.processes:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGCONT)
+    pipeline.stop()
+
+
+def test_marker_for_a_full_ring_is_queued_without_blocking(pipeline, epochs):
+    pipeline.submit(list(TrafficGenerator().frames(1000)))
+    wait_for(lambda: sum(pipeline.backlog()) == 0)
+    os.kill(pipeline.processes[0].pid, signal.SIGSTOP)
+    filler = 0
+    while pipeline.rings[0].put_batch([(b'', 0.0)]):  # Fill worker 0's ring to the last byte
+        filler += 1
+
+    started = time.monotonic()
+    pipeline.mark_epoch("full")
+    assert time.monotonic() - started < 0.1
+    assert pipeline._unsent[0] == [1]
+
+    os.kill(pipeline.processes[0].pid, signal.SIGCONT)
+    wait_for(lambda: epochs)
+    info, analysis = epochs[0]
+    assert info == "full" and analysis["total_packets"] == 1000 + filler
+    assert pipeline.failed_epochs == 0
+
+
+def test_dead_worker_is_restarted_and_picks_up_its_ring(pipeline, epochs):
+    pipeline.submit(list(TrafficGenerator().frames(2000)))
+    wait_for(lambda: sum(pipeline.backlog()) == 0)
+    os.kill(pipeline.processes[1].pid, signal.SIGSTOP)
+    pipeline.mark_epoch("first")
+    pipeline.processes[1].kill()
+    wait_for(lambda: epochs)  # The restarted worker reads the marker the dead one never got to
+    assert pipeline.worker_restarts == 1 and pipeline.processes[1].is_alive()
+    assert epochs[0][1]["total_packets"] < 2000  # Frames the dead worker had taken are lost with it
+
+
+@pytest.mark.parametrize("pipeline", [{"epoch_timeout": 1.0}], indirect=True)
+def test_epoch_times_out_with_the_missing_shard_listed(pipeline, epochs):
+    pipeline.submit(list(TrafficGenerator().frames(2000)))
+    wait_for(lambda: sum(pipeline.backlog()) == 0)
+    os.kill(pipeline.processes[1].pid, signal.SIGSTOP)
+    pipeline.mark_epoch("stuck")
+    wait_for(lambda: epochs)
+    assert epochs[0][0] == "stuck" and epochs[0][1]["missing_shards"] == [1]
+    assert pipeline.failed_epochs == 1
+
+    os.kill(pipeline.processes[1].pid, signal.SIGCONT)  # Its late share goes into the next file's report
+    pipeline.mark_epoch("next")
+    wait_for(lambda: len(epochs) == 2)
+    assert epochs[0][1]["total_packets"] + epochs[1][1]["total_packets"] == 2000
+    assert "missing_shards" not in epochs[1][1]
+
+
+def test_scan_spread_over_workers_is_detected_from_summed_counts(epochs):
+    events = []
+    pipeline = ShardedPipeline(2, on_events=events.extend, on_epoch=lambda info, analysis: epochs.append(analysis),
+                               ring_bytes=256 * 1024)
+    frames, per_shard = [], [0, 0]
+    for port in range(1000):  # 15 SYNs for each worker: neither alone reaches the threshold of 20
+        data = tcp_frame(bytes((10, 0, 0, 66)), bytes((10, 0, 0, 10)), 40000, port, 1, 0, TCP_SYN)
+        shard = shard_for(peek_flow(data), 2)
+        if per_shard[shard] < 15:
+            per_shard[shard] += 1
+            frames.append((data, 1000 + port * 0.01))
+    assert len(frames) == 30
+    pipeline.start()
+    try:
+        pipeline.submit(frames)
+        pipeline.mark_epoch()
+        wait_for(lambda: epochs)
+    finally:
+        pipeline.stop()
+    threats = list(epochs[0]["security_analysis"]["detected_threats"])
+    assert [(t["type"], t["source"], t["count"]) for t in threats] == [("Port Scanning", "10.0.0.66", 1)]
+    assert [e["severity"] for e in events if e["packet_info"].startswith("Port Scanning")] == ["High"]
@@ -0,0 +1,123 @@
+import os
+import struct
+import threading
+from datetime import datetime
+
+import pytest
+
+from src.utils.analysis import load_report, write_report
+from src.utils.catalog import Catalog
+from src.utils.pcap_reader import lock_exclusive, lock_shared, open_pcap
+from src.utils.retention import RetentionManager, compress_pcap, merge_into_rollup, new_rollup
+
+
+def write_pcap(path, records=200):
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for i in range(records):
+            frame = bytes(60)
+            f.write(struct.pack('<IIII', 1700000000 + i, 0, len(frame), len(frame)) + frame)
+    return str(path)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.db"))
+    yield catalog
+    catalog.close()
+
+
+def test_retention_skips_captures_with_open_readers(tmp_path, catalog):
+    pcap = write_pcap(tmp_path / "capture_20240101_000000.pcap")
+    catalog.add_capture(pcap, 200, 1700000000, 1700000199, 0)
+    retention = RetentionManager(catalog, str(tmp_path), compress_after=0)
+
+    with open_pcap(pcap):
+        summary = retention.run_once(now=1800000000)
+    assert summary["compressed"] == 0 and summary["in_use"] == 1
+
+    summary = retention.run_once(now=1800000000)
+    assert summary["compressed"] == 1
+    assert catalog.capture_paths()[0] == pcap + ".gz"
+
+
+def test_reader_waiting_out_a_compression_opens_the_compressed_file(tmp_path):
+    pcap = write_pcap(tmp_path / "capture.pcap")
+    claim = lock_exclusive(pcap)
+    opened = []
+    reader = threading.Thread(target=lambda: opened.append(lock_shared(pcap)))
+    reader.start()
+    reader.join(0.2)
+    assert reader.is_alive()  # Blocked while retention holds the file
+    compress_pcap(pcap)
+    claim.close()
+    reader.join()
+    assert opened[0].name == pcap + ".gz"
+    assert lock_exclusive(opened[0].name) is None
+    opened[0].close()
+
+
+def health(loss, requests, mean_ms, p95_ms, bps, packets, start):
+    latency = {"count": requests, "mean_ms": mean_ms, "p50_ms": mean_ms, "p95_ms": p95_ms, "p99_ms": p95_ms,
+               "max_ms": p95_ms}
+    return {
+        "report_metadata": {"first_packet_ts": start, "last_packet_ts": start + 10},
+        "network_statistics": {"total_packets": packets},
+        "network_health": {
+            "latency_stats": {"10.0.0.1": dict(latency, requests=requests, responses=requests, exceptions=0)},
+            "packet_loss_rate": loss,
+            "retransmission_rate": 0.01,
+            "exception_response_rate": 0,
+            "performance_metrics": {"response_time_percentiles": latency, "network_utilization": f"{bps} bit/s"}
+        }
+    }
+
+
+def test_rollup_keeps_network_health_weighted_by_traffic():
+    rollup = new_rollup("20240101")
+    merge_into_rollup(rollup, "a", health(0.1, 100, 2.0, 5.0, 1000, 1000, start=0))
+    merge_into_rollup(rollup, "b", health(0.0, 300, 4.0, 9.0, 3000, 3000, start=100))
+
+    rolled = rollup["network_health"]
+    assert rolled["packet_loss_rate"] == 0.025
+    assert rolled["retransmission_rate"] == 0.01
+    assert rolled["latency_stats"]["10.0.0.1"]["requests"] == 400
+    overall = rolled["performance_metrics"]["response_time_percentiles"]
+    assert (overall["count"], overall["mean_ms"], overall["p95_ms"]) == (400, 3.5, 9.0)
+    assert rolled["performance_metrics"]["network_utilization"] == "2000 bit/s"
+
+
+def write_report_file(tmp_path, catalog, name, pcap_file, packets, created):
+    report = health(0.0, 10, 1.0, 2.0, 1000, packets, start=1700000000)
+    report["report_metadata"]["pcap_file"] = pcap_file
+    path = str(tmp_path / name)
+    write_report(report, path)
+    os.utime(path, (created, created))
+    catalog.add_report(path, report)
+    return path
+
+
+def test_rollup_counts_each_capture_once_and_skips_combined_reports(tmp_path, catalog):
+    pcap = str(tmp_path / "capture_20231114_221320.pcap")
+    write_report_file(tmp_path, catalog, "report_20231114_221320.json", pcap, 1000, created=1700000100)
+    write_report_file(tmp_path, catalog, "report_20231114_221320_reanalyzed_20240101_000000.json", pcap + ".gz",
+                      1200, created=1704067200)
+    combined = write_report_file(tmp_path, catalog, "report_combined_20231114_221320.json", "2 files", 2200,
+                                 created=1704067300)
+    retention = RetentionManager(catalog, str(tmp_path), rollup_after=0)
+
+    summary = retention.run_once(now=1800000000)
+    assert summary["rolled_up"] == 2
+    rollup_name = f"report_daily_{datetime.fromtimestamp(1700000000):%Y%m%d}.json"
+    rollup = load_report(catalog.get(rollup_name)["path"])
+    assert rollup["network_statistics"]["total_packets"] == 1200  # The re-analysis, not both
+    assert [entry["name"] for entry in rollup["report_metadata"]["reports"]] == [
+        "report_20231114_221320_reanalyzed_20240101_000000.json"]
+    assert os.path.exists(combined) and catalog.get("report_combined_20231114_221320.json") is not None
+
+    # A report of a capture the rollup already holds is removed without adding to it
+    write_report_file(tmp_path, catalog, "report_20231114_221320_reanalyzed_20240102_000000.json", pcap, 900,
+                      created=1704153600)
+    assert retention.run_once(now=1800000000)["rolled_up"] == 1
+    rollup = load_report(catalog.get(rollup_name)["path"])
+    assert rollup["network_statistics"]["total_packets"] == 1200
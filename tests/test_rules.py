@@ -0,0 +1,146 @@
+
+from src.utils.decoder import TCP_ACK, TCP_SYN, decode_frame
+from src.utils.rules import DoSRule, ExpiringTable, PortScanRule, Rule, RuleEngine, SpoofingRule, ThreatAggregator
+from src.utils.traffic_gen import tcp_frame, udp_frame
+
+SCANNER = bytes((10, 0, 0, 66))
+PLC = bytes((10, 0, 0, 10))
+
+
+def syn(src, dst, dport, ts, flags=TCP_SYN, sport=40000):
+    return decode_frame(tcp_frame(src, dst, sport, dport, 1, 0, flags), ts)
+
+
+def run(engine, frames):
+    threats = ThreatAggregator()
+    for frame in frames:
+        engine.evaluate(frame, threats)
+    return threats
+
+
+def test_port_scan_fires_once_per_window():
+    engine = RuleEngine([PortScanRule(threshold=20, window=10)])
+    frames = [syn(SCANNER, PLC, port, 1000 + port * 0.1) for port in range(50)]  # One window
+    frames += [syn(SCANNER, PLC, port, 1020 + port * 0.1) for port in range(25)]  # The next
+    threats = run(engine, frames)
+    assert [(t["type"], t["source"], t["count"]) for t in threats] == [("Port Scanning", "10.0.0.66", 2)]
+    assert [frame.risk for frame in frames].count(2) == 2
+    assert frames[19].risk == 2 and frames[20].risk == 0
+
+
+def test_port_scan_ignores_syn_ack_and_slow_sources():
+    engine = RuleEngine([PortScanRule(threshold=5, window=10)])
+    replies = [syn(PLC, SCANNER, 40000, 1000 + i, flags=TCP_SYN | TCP_ACK, sport=502) for i in range(20)]
+    slow = [syn(SCANNER, PLC, port, 1000 + port * 11) for port in range(10)]  # Each window holds one SYN
+    assert len(run(engine, replies + slow)) == 0
+
+
+def test_port_scan_state_expires_with_its_window():
+    threats = ThreatAggregator()
+    engine = RuleEngine([PortScanRule(threshold=3, window=10)])
+    for ts in (1000, 1001, 1015, 1016):  # Two SYNs, then two more after the first window lapsed
+        engine.evaluate(syn(SCANNER, PLC, 502, ts), threats)
+    assert len(threats) == 0
+
+
+def test_dos_fires_once_per_window_when_sources_converge():
+    engine = RuleEngine([DoSRule(threshold=50, window=10)])
+    frames = [syn(bytes((172, 16, i >> 8, i & 255)), PLC, 502, 1000 + i * 0.01) for i in range(300)]
+    threats = run(engine, frames)
+    assert [(t["type"], t["target"], t["count"]) for t in threats] == [("Potential DoS Attack", "10.0.0.10", 1)]
+
+
+def test_partial_counts_from_shards_cross_the_full_threshold_once():
+    shards = [RuleEngine([PortScanRule(partial=True), DoSRule(partial=True)]) for _ in range(3)]
+    coordinator = {"Port Scanning": PortScanRule(threshold=20), "Potential DoS Attack": DoSRule(threshold=100)}
+    hits = []
+    for batch in range(4):  # 4 drains x 3 shards x 5 SYNs: no shard alone gets near 20
+        for shard, engine in enumerate(shards):
+            for i in range(5):
+                port = batch * 15 + shard * 5 + i
+                frame = syn(SCANNER, PLC, port, 1000 + port * 0.1)
+                assert run(engine, [frame]).suppressed == 0 and frame.risk == 0
+            for threat_type, counts in engine.drain().items():
+                hits += [(threat_type, hit) for hit in coordinator[threat_type].merge(counts)]
+            assert engine.drain() == {}
+    assert hits == [("Port Scanning", ("10.0.0.66", "10.0.0.10", 1000 + 15 * 0.1))]
+
+
+def test_partial_dos_sketches_merge_into_one_distinct_count():
+    shards = [DoSRule(partial=True) for _ in range(4)]
+    for i in range(160):  # 40 distinct sources per shard, 160 in all
+        shards[i % 4].evaluate(syn(bytes((172, 16, 0, i)), PLC, 502, 1000 + i * 0.01))
+    full = DoSRule(threshold=100)
+    hits = [hit for shard in shards for hit in full.merge(shard.drain())]
+    assert [(source, target) for source, target, _ in hits] == [("Multiple Sources", "10.0.0.10")]
+
+
+def test_spoofing_matches_reserved_prefixes():
+    engine = RuleEngine([SpoofingRule()])
+    threats = run(engine, [syn(bytes((127, 0, 0, 5)), PLC, 502, 1000), syn(bytes((0, 1, 2, 3)), PLC, 502, 1001),
+                           syn(SCANNER, PLC, 502, 1002)])
+    assert sorted(t["source"] for t in threats) == ["0.1.2.3", "127.0.0.5"]
+
+
+class Recorder(Rule):
+    threat_type = "Recorder"
+
+    def __init__(self, protocols=None, ports=None):
+        self.protocols = protocols
+        self.ports = ports
+        self.seen = 0
+
+    def evaluate(self, frame):
+        self.seen += 1
+        return None
+
+
+def test_dispatch_runs_only_rules_for_the_frames_protocol_and_ports():
+    any_ip, tcp, modbus, dns = Recorder(), Recorder((6,)), Recorder((6,), (502,)), Recorder((17,), (53,))
+    engine = RuleEngine([any_ip, tcp, modbus, dns])
+    run(engine, [
+        syn(SCANNER, PLC, 502, 1000),                                          # any, tcp, modbus
+        syn(PLC, SCANNER, 40000, 1001, flags=TCP_SYN | TCP_ACK, sport=502),    # any, tcp, modbus (source port)
+        syn(SCANNER, PLC, 80, 1002),                                           # any, tcp
+        decode_frame(udp_frame(SCANNER, PLC, 5353, 53), 1003),                 # any, dns
+        decode_frame(udp_frame(SCANNER, PLC, 53, 53), 1004),                   # any, dns once
+        decode_frame(udp_frame(SCANNER, PLC, 5353, 123), 1005)                 # any
+    ])
+    assert (any_ip.seen, tcp.seen, modbus.seen, dns.seen) == (6, 3, 2, 2)
+
+
+def test_aggregator_rolls_up_repeats_and_caps_distinct_threats():
+    rule = PortScanRule()
+    threats = ThreatAggregator(capacity=2)
+    for ts, source in ((5, "a"), (3, "a"), (9, "a"), (1, "b"), (2, "c")):
+        threats.record(rule, source, "plc", ts)
+    first = next(iter(threats))
+    assert (first["count"], first["first_seen"], first["last_seen"]) == (3, 5, 9)
+    assert len(threats) == 2 and threats.suppressed == 1
+
+    other = ThreatAggregator()
+    other.record(rule, "a", "plc", 1)
+    threats.merge(other)
+    assert (first["count"], first["first_seen"]) == (4, 1)
+
+
+def test_expiring_table_drops_entries_after_ttl():
+    table = ExpiringTable(capacity=10, ttl=5)
+    table.put("a", 1, now=0)
+    assert table.get("a", now=5) == 1
+    assert table.get("a", now=5.1) is None and len(table) == 0
+
+    table.put("b", 2, now=0)
+    table.put("c", 3, now=1)
+    table.put("d", 4, now=10)  # Sweeps the stale entries at the cold end
+    assert len(table) == 1
+
+
+def test_expiring_table_evicts_least_recently_updated_at_capacity():
+    table = ExpiringTable(capacity=3, ttl=100)
+    for i, key in enumerate("abc"):
+        table.put(key, i, now=i)
+    table.put("a", 10, now=3)  # Refreshing moves a to the hot end
+    table.put("d", 4, now=4)
+    assert table.get("b", now=4) is None
+    assert [table.get(key, now=4) for key in "acd"] == [10, 2, 4]
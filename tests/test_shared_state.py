@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src.utils.event_store import EventRecord
+from src.utils.shared_state import SharedState
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DAEMON = """
+import sys, time
+import src.app as scada
+scada.SHARED_STATE_PATH, scada.CATALOG_PATH = sys.argv[1], sys.argv[2]
+scada.create_app("daemon")
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    state = SharedState(str(tmp_path / "state.db"))
+    state.reset()
+    yield state
+    state.close()
+
+
+@pytest.fixture
+def web(tmp_path, daemon):
+    state = SharedState(str(tmp_path / "state.db"))
+    yield state
+    state.close()
+
+
+def test_command_round_trip_between_daemon_and_web(daemon, web):
+    def handler(name, payload):
+        if name == "fail":
+            raise ValueError("no such thing")
+        return {"name": name, "doubled": payload["n"] * 2}
+
+    daemon.serve(handler)
+    started = time.monotonic()
+    assert web.call("double", {"n": 21}, timeout=5) == {"name": "double", "doubled": 42}
+    assert time.monotonic() - started < 0.5  # Woken by the datagram, not the fallback poll
+    assert web.call("fail", {}, timeout=5) == {"error": "no such thing"}
+
+
+def test_unanswered_command_times_out_and_is_withdrawn(daemon, web):
+    started = time.monotonic()
+    assert web.call("double", {"n": 1}, timeout=0.3) is None  # No daemon is serving
+    assert 0.3 <= time.monotonic() - started < 2
+    with web._lock:
+        assert web._conn.execute("SELECT COUNT(*) FROM commands").fetchone()[0] == 0
+
+
+def test_web_reads_what_the_daemon_publishes(daemon, web):
+    for i in range(1, 4):
+        daemon.publish(EventRecord(i, 1000.0 + i, "10.0.0.1", "10.0.0.2", "TCP", "Low", f"frame {i}"))
+    daemon.put("stats", {"total_events": 3})
+    daemon.emit("scanning_status", {"scanning": True})
+    daemon.flush()
+
+    records, cursor = web.query(since_id=1)
+    assert [record.packet_info for record in records] == ["frame 2", "frame 3"] and cursor == 3
+    assert web.get("stats") == {"total_events": 3}
+    assert [(event, data) for _, event, data in web.messages()] == [("scanning_status", {"scanning": True})]
+
+
+def test_web_app_relays_control_routes_to_the_daemon_process(tmp_path, monkeypatch):
+    import src.app as scada
+    state_path, catalog_path = str(tmp_path / "state.db"), str(tmp_path / "catalog.db")
+    daemon = subprocess.Popen([sys.executable, "-c", DAEMON, state_path, str(tmp_path / "daemon.db")],
+                              cwd=project_root, stdout=subprocess.PIPE, text=True)
+    try:
+        assert daemon.stdout.readline().strip() == "ready"
+        monkeypatch.setattr(scada, "SHARED_STATE_PATH", state_path)
+        monkeypatch.setattr(scada, "CATALOG_PATH", catalog_path)
+        monkeypatch.setattr(scada, "DAEMON_REQUEST_TIMEOUT", 5)
+        client = scada.create_app("web").test_client()
+
+        response = client.get("/api/poller")
+        assert response.status_code == 200 and response.get_json() == {"enabled": False, "devices": []}
+        response = client.post("/api/control/shutdown")  # Stops the daemon's monitoring, not this worker's
+        assert response.status_code == 501 and response.get_json()["status"] == "stopped"
+    finally:
+        daemon.kill()
+        daemon.wait()
+
+    monkeypatch.setattr(scada, "DAEMON_REQUEST_TIMEOUT", 0.3)
+    assert client.get("/api/poller").status_code == 503
+    scada.catalog.close()
@@ -0,0 +1,74 @@
+import pytest
+
+from src.utils.sketches import HyperLogLog, SlidingWindow, SpaceSaving, StreamingStats, hash64
+
+
+def addresses(start, count):
+    return [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(start, start + count)]
+
+
+@pytest.mark.parametrize("count", [0, 1, 50, 1000, 20000])
+def test_hyperloglog_estimates_within_a_few_standard_errors(count):
+    hll = HyperLogLog(p=12)
+    for ip in addresses(0, count):
+        hll.add(ip)
+        hll.add(ip)  # Repeats do not count
+    assert abs(len(hll) - count) <= max(1, 3 * 0.0163 * count)
+
+
+def test_hyperloglog_merge_counts_the_union():
+    a, b = HyperLogLog(), HyperLogLog()
+    for ip in addresses(0, 6000):
+        a.add(ip)
+    for ip in addresses(4000, 6000):
+        b.add(ip)
+    a.update(b)
+    assert abs(a.count() - 10000) <= 500
+    a.clear()
+    assert a.count() == 0
+    with pytest.raises(ValueError):
+        a.update(HyperLogLog(p=10))
+
+
+def test_space_saving_keeps_heavy_hitters_and_never_undercounts():
+    sketch = SpaceSaving(k=10)
+    truth = {}
+    for i in range(5000):
+        item = f"heavy{i % 3}" if i % 2 else f"noise{i}"
+        sketch.add(item)
+        truth[item] = truth.get(item, 0) + 1
+    assert {item for item, _ in sketch.top(3)} == {"heavy0", "heavy1", "heavy2"}
+    for item, count in sketch.counts.items():
+        assert count - sketch.errors[item] <= truth[item] <= count
+    assert len(sketch.counts) == 10 and sum(sketch.counts.values()) == 5000
+
+
+def test_space_saving_update_adds_weights():
+    a, b = SpaceSaving(k=4), SpaceSaving(k=4)
+    a.add("x", 5)
+    b.add("x", 2)
+    b.add("y", 1)
+    a.update(b)
+    assert a.top() == [("x", 7), ("y", 1)]
+
+
+def test_sliding_window_forgets_buckets_older_than_its_span():
+    window = SlidingWindow(span=60, buckets=12)
+    for i, ip in enumerate(addresses(0, 100)):
+        window.add(ip, hash64(ip), now=1000 + i * 0.5)  # 1000.0 .. 1049.5
+    assert window.snapshot(1050)["packets"] == 100
+    recent = window.snapshot(1095)  # Buckets from 1040 on are still in the window
+    assert recent["packets"] == 20 and abs(recent["unique_sources"] - 20) <= 1
+    assert window.snapshot(2000)["packets"] == 0
+
+
+
+def test_streaming_stats_counts_batched_sources_like_single_packets():
+    single, batched = StreamingStats(), StreamingStats()
+    for _ in range(5):
+        single.add_source("10.0.0.1", now=1000)
+    single.add_source("10.0.0.2", now=1000)
+    batched.add_source("10.0.0.1", now=1000, count=5)
+    batched.add_source("10.0.0.2", now=1000)
+    assert batched.snapshot(1000) == single.snapshot(1000)
+    assert batched.snapshot(1000)["1m"]["top_talkers"][0] == {"ip": "10.0.0.1", "count": 5}
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from src.utils.timeseries import COLUMNS, RingSeries, TimeSeries, parse_duration
+
+
+@pytest.mark.parametrize("value, seconds", [("90", 90), ("90s", 90), (" 15M ", 900), ("1.5h", 5400), ("7d", 604800),
+                                            (30, 30)])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == seconds
+
+
+@pytest.mark.parametrize("value", ["", "m", "abc", "inf", "nan", "-5m", "0", "1e400s", "infh"])
+def test_parse_duration_rejects_non_finite_and_non_positive(value):
+    with pytest.raises(ValueError):
+        parse_duration(value)
+
+
+def test_ring_series_forgets_buckets_it_has_wrapped_past():
+    series = RingSeries(width=10, buckets=4, columns=2)
+    for ts in (100, 105, 110, 130, 150):  # 150 reuses 110's slot
+        series.add(ts, np.array([1, 2]))
+    starts, counts = series.window(155, 6)
+    assert starts.tolist() == [120, 130, 140, 150]  # No more than the ring holds
+    assert counts.tolist() == [[0, 0], [1, 2], [0, 0], [1, 2]]
+    assert series.window(115, 2)[1].tolist() == [[2, 4], [0, 0]]  # 110's bucket was overwritten by 150
+
+
+def test_ticks_roll_up_into_coarser_resolutions():
+    timeseries = TimeSeries()
+    for second in range(120):
+        for _ in range(second % 3):
+            timeseries.record("High", "Modbus TCP")
+        timeseries.record("Low", "SNMP")  # Unknown protocols count as Other
+        delta = timeseries.tick(now=6000 + second)
+    assert delta == {"ts": 6119, "counts": {"Low": 1, "Other": 1, "High": 2, "Modbus TCP": 2}}
+
+    seconds = timeseries.query("1s", 10, now=6119)
+    assert seconds["timestamps"] == list(range(6110, 6120)) and seconds["series"]["High"] == [2, 0, 1] * 3 + [2]
+    minutes = timeseries.query("1m", 3600, now=6119)
+    assert minutes["step"] == 60 and len(minutes["timestamps"]) == 60
+    assert minutes["series"]["Low"][-2:] == [60, 60] and minutes["series"]["High"][-2:] == [60, 60]
+    hours = timeseries.query("1h", 1, now=6119)
+    assert hours["timestamps"] == [3600] and hours["series"]["Other"] == [120]
+    assert set(hours["series"]) == set(COLUMNS)
+    with pytest.raises(ValueError):
+        timeseries.query("5m", 60)